@@ -0,0 +1,174 @@
+"""
+Parse time benchmark of the DAG modules. Every DAG file is imported in a fresh interpreter with Airflow already
+loaded, the way the DAG processor does, and the median import time is compared with the threshold. Exits with 1
+if any DAG module is slower or imports a client library, so it can gate a regression of the parse time.
+
+python benchmarks/dag_import_time.py --repeat 5 --max-seconds 2
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DAGS_DIR = os.path.join(REPO_DIR, 'dags')
+TEMPLATE_DIR = "redshift_migration_ENTITY_NAME"
+ENTITY_NAME = "bench"
+DAG_FILES = [
+    f"redshift_migration_{ENTITY_NAME}/redshift_{ENTITY_NAME}_migration_dag.py",
+    f"redshift_migration_{ENTITY_NAME}/{ENTITY_NAME}_dq_dag.py",
+    f"redshift_migration_{ENTITY_NAME}/{ENTITY_NAME}_backfill_dag.py",
+    "redshift_migration_scheduler/migration_scheduler_dag.py",
+]
+# Libraries which are only needed by the task callables
+HEAVY_MODULES = ["pyarrow", "pandas", "pandas_gbq", "duckdb", "google.cloud.bigquery", "google.cloud.storage",
+                 "google.cloud.bigquery_storage_v1", "google.auth", "yaml", "requests", "boto3", "botocore"]
+ENTITY_CONFIG = {
+    "gcp": {"project": "bench-project", "dataset_id": "redshift_raw", "table_id": ENTITY_NAME, "bucket": "bench-gcs",
+            "path": f"s3-unload/{ENTITY_NAME}/", "file_prefix": f"{ENTITY_NAME}_", "file_format": ".parquet",
+            "dataset_region_id": "EU", "environment": "bench",
+            "dataplex": {"project": "bench-project", "region": "local", "lake_id": "bench-lake",
+                         "service_acc": "bench-sa", "yaml_bucket_name": "bench-dq-rules"}},
+    "aws": {"bucket": "bench-s3", "path": f"unload/{ENTITY_NAME}/", "file_prefix": f"{ENTITY_NAME}_",
+            "file_format": ".parquet", "table_id": f"dev.public.{ENTITY_NAME}"},
+    "ts_incremental_column_name": "insert_time",
+    "run_dq_tests": True,
+    "run_preload_dq_tests": True,
+    "verify_parquet_checksum": True,
+    "backfill": {"start": "2019-12-31T00:00:00", "end": "2023-06-01T00:00:00", "window_days": 30},
+}
+# The template unload SQL is a placeholder until the entity SQL is generated
+UNLOAD_SQL = """unload ('SELECT insert_time, TO_TIMESTAMP(''%(export_datetime)s'', ''YYYY-MM-DD"T"HH24:MI:SS'') \
+AS export_datetime FROM %(table_id)s WHERE insert_time > ''%(insert_time)s''') \
+to 's3://bench-s3/unload/bench/%(export_datetime)s/bench_' iam_role DEFAULT FORMAT PARQUET;"""
+# Runs in the fresh interpreter: Airflow is imported first, only the DAG module import is timed
+CHILD_SCRIPT = """
+import importlib.util, json, sys, time
+import airflow
+from airflow.models import DAG
+heavy = sys.argv[2].split(',')
+loaded = {name for name in heavy if name in sys.modules}
+sys.stderr.write("dag-import-start\\n")
+spec = importlib.util.spec_from_file_location("benchmarked_dag", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+started = time.perf_counter()
+spec.loader.exec_module(module)
+seconds = time.perf_counter() - started
+imported = sorted(name for name in heavy if name in sys.modules and name not in loaded)
+print(json.dumps({'seconds': seconds, 'heavy': imported}))
+"""
+IMPORT_TIME_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def prepare_dags_folder(dags_dir: str) -> None:
+    """
+    This method will copy the DAGs folder with the ENTITY_NAME template rendered to the bench entity.
+    Args:
+    Returns: None
+    """
+    shutil.copytree(DAGS_DIR, dags_dir, ignore=shutil.ignore_patterns('__pycache__'))
+    entity_dir = os.path.join(dags_dir, f"redshift_migration_{ENTITY_NAME}")
+    for root, _, files in os.walk(os.path.join(dags_dir, TEMPLATE_DIR)):
+        target_root = root.replace(os.path.join(dags_dir, TEMPLATE_DIR), entity_dir)
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            with open(os.path.join(root, name)) as f:
+                content = f.read()
+            if name.endswith('.py'):
+                content = re.sub(r'^entity_name = "<?ENTITY_NAME>?"$', f'entity_name = "{ENTITY_NAME}"', content,
+                                 flags=re.MULTILINE)
+            with open(os.path.join(target_root, name.replace('ENTITY_NAME', ENTITY_NAME)), 'w') as f:
+                f.write(content)
+    with open(os.path.join(entity_dir, f"{ENTITY_NAME}-entity-config.json"), 'w') as f:
+        json.dump(ENTITY_CONFIG, f)
+    with open(os.path.join(entity_dir, 'sql', 'redshift', f"unload_{ENTITY_NAME}.sql"), 'w') as f:
+        f.write(UNLOAD_SQL)
+
+
+def get_top_imports(importtime_log: str, top: int) -> list:
+    """
+    This method will return the slowest top level imports of the DAG module by their cumulative time.
+    Args: importtime_log stderr of python -X importtime
+    Returns: list of (module, seconds) tuples
+    """
+    imports = []
+    started = False
+    for line in importtime_log.splitlines():
+        if line == "dag-import-start":
+            started = True
+            continue
+        match = IMPORT_TIME_PATTERN.match(line)
+        # Nested imports are indented by two spaces per level
+        if started and match and len(match.group(3)) == 1:
+            imports.append((match.group(4), int(match.group(2)) / 1e6))
+    return sorted(imports, key=lambda item: -item[1])[:top]
+
+
+def time_dag_import(dags_dir: str, dag_file: str, env: dict, importtime: bool = False) -> dict:
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + \
+              ['-c', CHILD_SCRIPT, os.path.join(dags_dir, dag_file), ','.join(HEAVY_MODULES)]
+    result = subprocess.run(command, cwd=dags_dir, env=env, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"DAG {dag_file} import failed:\n{result.stderr[-4000:]}")
+    measurement = json.loads(result.stdout.strip().splitlines()[-1])
+    if importtime:
+        measurement['top_imports'] = get_top_imports(result.stderr, 10)
+    return measurement
+
+
+def main(repeat: int, max_seconds: float, work_dir: str, output: str = None) -> bool:
+    dags_dir = os.path.join(work_dir, 'dags')
+    prepare_dags_folder(dags_dir)
+    airflow_home = os.path.join(work_dir, 'airflow')
+    env = dict(os.environ, AIRFLOW_HOME=airflow_home, DAGS_FOLDER=dags_dir, AIRFLOW__CORE__DAGS_FOLDER=dags_dir,
+               AIRFLOW__CORE__LOAD_EXAMPLES='False', PYTHONPATH=dags_dir, PYTHONDONTWRITEBYTECODE='1')
+    # Initializes the Airflow home once, so the timed runs don't write its config
+    subprocess.run([sys.executable, '-c', 'import airflow'], env=env, capture_output=True, check=True)
+
+    report, passed = [], True
+    for dag_file in DAG_FILES:
+        seconds = [time_dag_import(dags_dir, dag_file, env)['seconds'] for _ in range(repeat)]
+        profile = time_dag_import(dags_dir, dag_file, env, importtime=True)
+        median_s = statistics.median(seconds)
+        # Client libraries are only needed by the task callables, importing one at parse is a regression too
+        dag_passed = median_s <= max_seconds and not profile['heavy']
+        passed = passed and dag_passed
+        report.append({'dag_file': dag_file, 'median_s': round(median_s, 4), 'min_s': round(min(seconds), 4),
+                       'heavy_modules': profile['heavy'], 'top_imports': profile['top_imports'],
+                       'passed': dag_passed})
+
+    print(f"{'DAG module':<64}{'median, s':>11}{'min, s':>9}  heavy modules imported")
+    for dag_report in report:
+        print(f"{dag_report['dag_file']:<64}{dag_report['median_s']:>11}{dag_report['min_s']:>9}  "
+              f"{', '.join(dag_report['heavy_modules']) or '-'}{'' if dag_report['passed'] else '  FAILED'}")
+        for module, module_s in dag_report['top_imports'][:5]:
+            print(f"    {module:<60}{module_s:>11.4f}")
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'max_seconds': max_seconds, 'repeat': repeat, 'dags': report}, f, indent=2)
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Parse time benchmark of the DAG modules.')
+    parser.add_argument('--repeat', default=5, type=int, help='Fresh interpreter imports per DAG module')
+    parser.add_argument('--max-seconds', default=2.0, type=float,
+                        help='Median import time of a DAG module above which the benchmark fails')
+    parser.add_argument('--work_dir', default=None, type=str, help='Directory of the rendered DAGs folder')
+    parser.add_argument('--output', default=None, type=str, help='JSON file to write the report to')
+
+    args = parser.parse_args()
+    benchmark_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix='dag-import-bench-')
+    os.makedirs(benchmark_dir, exist_ok=True)
+    try:
+        succeeded = main(args.repeat, args.max_seconds, benchmark_dir,
+                         os.path.abspath(args.output) if args.output else None)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(benchmark_dir, ignore_errors=True)
+    sys.exit(0 if succeeded else 1)
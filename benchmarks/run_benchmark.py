@@ -0,0 +1,401 @@
+"""
+Offline end-to-end benchmark of the migration DAG callables against local stand-ins of S3, GCS, Redshift,
+BigQuery and Dataplex. Reports rows/s, bytes read, peak RSS and wall time per stage.
+
+python benchmarks/run_benchmark.py --rows 1000000 --width 20 --files 4
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DAGS_DIR = os.path.join(REPO_DIR, 'dags')
+sys.path.insert(0, DAGS_DIR)
+os.environ.setdefault('DAGS_FOLDER', DAGS_DIR)
+
+from pyarrow import fs, parquet as pq  # noqa: E402
+
+import stand_ins  # noqa: E402
+import synthetic  # noqa: E402
+from common import bq_data_operations, change_probe, checksum, compaction, data_quality, dataplex, \
+    file_operations, local_dq, profiling, redshift as common_redshift, s3_copier, schema_check  # noqa: E402
+
+log = logging.getLogger()
+
+ENTITY_NAME = "bench"
+EXPORT_DATETIME = "2023-06-01T10:00:00"
+GCP_CONFIG = {
+    "project": "bench-project",
+    "dataset_id": "redshift_raw",
+    "table_id": ENTITY_NAME,
+    "dataset_region_id": "EU",
+    "environment": "bench",
+    "bucket": "bench-gcs",
+    "path": f"s3-unload/{ENTITY_NAME}/",
+    "file_prefix": f"{ENTITY_NAME}_",
+    "file_format": ".parquet",
+    "dataplex": {"project": "bench-project", "region": "local", "lake_id": "bench-lake", "service_acc": "bench-sa",
+                 "yaml_bucket_name": "bench-dq-rules"},
+}
+AWS_CONFIG = {"bucket": "bench-s3", "path": f"unload/{ENTITY_NAME}/", "file_prefix": f"{ENTITY_NAME}_",
+              "table_id": f"dev.public.{ENTITY_NAME}"}
+STAGES = ["generate", "sql_generators", "redshift_probe", "redshift_paging", "get_latest_load_ts",
+          "calculate_total_rows", "query_bq_single_value", "metadata_probe", "s3_copy", "schema_check",
+          "verify_checksums", "local_dq", "dataplex", "dataplex_shards", "skip_existing", "compaction"]
+
+
+class RssSampler:
+    """Samples the process resident set size in the background to get the peak of a single stage."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current_rss() -> int:
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            # ru_maxrss is the peak of the whole process lifetime in KB on Linux
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current_rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current_rss())
+
+
+def read_bytes() -> int:
+    try:
+        with open('/proc/self/io') as f:
+            return int(next(line for line in f if line.startswith('rchar:')).split()[1])
+    except (OSError, StopIteration):
+        return 0
+
+
+def run_stage(name: str, func, store: stand_ins.ObjectStore) -> dict:
+    log.info(f"Running stage {name}")
+    bytes_before = read_bytes()
+    store_bytes_before = store.bytes_read
+    with RssSampler() as sampler:
+        started = time.perf_counter()
+        rows = func()
+        wall_time = time.perf_counter() - started
+    bytes_read = max(read_bytes() - bytes_before, store.bytes_read - store_bytes_before)
+    return {
+        'stage': name,
+        'wall_time_s': round(wall_time, 4),
+        'rows': rows,
+        'rows_per_s': round(rows / wall_time) if rows and wall_time else None,
+        'bytes_read': bytes_read,
+        'peak_rss_mb': round(sampler.peak / 1024 / 1024, 1),
+    }
+
+
+def load_generate_sql(work_dir: str):
+    # generate_sql.py reads the credentials at import time from the current directory
+    os.makedirs(os.path.join(work_dir, '.secrets'), exist_ok=True)
+    shutil.copyfile(os.path.join(REPO_DIR, '.secrets', 'credentials.example.json'),
+                    os.path.join(work_dir, '.secrets', 'credentials.json'))
+    spec = importlib.util.spec_from_file_location('generate_sql', os.path.join(REPO_DIR, 'generate_sql.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def install_stand_ins(store: stand_ins.ObjectStore, engine: stand_ins.SqlEngine, dataplex_endpoint: str) -> None:
+    storage_module = stand_ins.FakeStorageModule(store)
+    local_fs = fs.SubTreeFileSystem(store.root, fs.LocalFileSystem())
+    arrow_fs = SimpleNamespace(GcsFileSystem=lambda *args, **kwargs: local_fs, FileSystem=fs.FileSystem)
+    for module in [file_operations, data_quality, checksum, local_dq, s3_copier, compaction]:
+        module.storage = storage_module
+    for module in [checksum, local_dq, compaction]:
+        module.fs = arrow_fs
+    bq_data_operations.bigquery = stand_ins.FakeBigQueryModule(engine)
+    bq_data_operations.bigquery_storage = stand_ins.FakeBigQueryStorageModule()
+    s3_copier.s3 = SimpleNamespace(
+        S3Hook=lambda *args, **kwargs: SimpleNamespace(get_conn=lambda: stand_ins.FakeS3Client(store)))
+    schema_check.s3 = s3_copier.s3
+    data_quality.Variable = stand_ins.FakeVariable
+    profiling.Variable = stand_ins.FakeVariable
+    schema_check.Variable = stand_ins.FakeVariable
+    dataplex.DATAPLEX_ENDPOINT = dataplex_endpoint
+    setattr(dataplex, '__get_session_headers', lambda: {'Accept': 'application/json'})
+    schema_check.BIGQUERY_ENDPOINT = dataplex_endpoint
+    setattr(schema_check, '__get_headers', lambda: {'Accept': 'application/json'})
+
+
+def write_dq_config(store: stand_ins.ObjectStore) -> str:
+    config_path = data_quality.get_configs_path(GCP_CONFIG, ENTITY_NAME)
+    bucket_name, blob_name = config_path[len("gs://"):].split('/', 1)
+    rules = f"""
+row_filters:
+  NONE:
+    filter_sql_expr: True
+rules:
+  NOT_NULL:
+    rule_type: NOT_NULL
+    dimension: completeness
+  VALUE_ZERO_OR_POSITIVE:
+    rule_type: CUSTOM_SQL_EXPR
+    dimension: correctness
+    params:
+      custom_sql_expr: $column >= 0
+  NO_DUPLICATES_IN_COLUMN_GROUPS:
+    rule_type: CUSTOM_SQL_STATEMENT
+    dimension: uniqueness
+    params:
+      custom_sql_arguments:
+        - column_names
+      custom_sql_statement: |-
+        select a.* from data a
+        inner join (select $column_names from data group by $column_names having count(*) > 1) duplicates
+        using ($column_names)
+rule_bindings:
+  C0_VALID:
+    entity_uri: dataplex://entities/{ENTITY_NAME}
+    column_id: c0
+    row_filter_id: NONE
+    rule_ids:
+      - NOT_NULL
+      - VALUE_ZERO_OR_POSITIVE
+      - NO_DUPLICATES_IN_COLUMN_GROUPS:
+          column_names: c0
+"""
+    store.write(bucket_name, blob_name, rules.encode('utf-8'))
+    return config_path
+
+
+def main(rows: int, width: int, files: int, stages: list, work_dir: str, output: str) -> list:
+    store = stand_ins.ObjectStore(os.path.join(work_dir, 'objects'))
+    engine = stand_ins.SqlEngine()
+    redshift = stand_ins.FakeRedshiftDataClient(engine)
+    export_prefix = f"{GCP_CONFIG['path']}{EXPORT_DATETIME}/{GCP_CONFIG['file_prefix']}"
+    export_dir = os.path.dirname(store.path(GCP_CONFIG['bucket'], export_prefix))
+    table_id = bq_data_operations.get_full_table_id(GCP_CONFIG['project'], GCP_CONFIG['dataset_id'],
+                                                    GCP_CONFIG['table_id'])
+    os.chdir(work_dir)
+
+    def generate():
+        synthetic.generate_export(export_dir, GCP_CONFIG['file_prefix'], EXPORT_DATETIME, rows, width, files)
+        engine.register_parquet_table(table_id, os.path.join(export_dir, '*.parquet'))
+        engine.register_parquet_table(AWS_CONFIG['table_id'], os.path.join(export_dir, '*.parquet'))
+        return rows
+
+    def sql_generators():
+        generate_sql = load_generate_sql(work_dir)
+        columns = [{'name': 'insert_time', 'type': 'timestamp without time zone'}] + \
+                  [{'name': f"c{n}", 'type': 'boolean' if n % 5 == 3 else 'character varying'} for n in range(width)]
+        select_sql = generate_sql.get_redshift_select_sql(columns, ENTITY_NAME, 'insert_time')
+        generate_sql.generate_unload_query(select_sql, ENTITY_NAME)
+        generate_sql.get_bq_sql(columns)
+        return None
+
+    def redshift_probe():
+        sql = file_operations.read_sql_file(
+            'redshift_migration_ENTITY_NAME/sql/redshift/new_record_exists_after_ts.sql') % {
+                  'column_name': 'insert_time', 'insert_time': '1970-01-01 00:00:00', 'table_id': AWS_CONFIG['table_id']}
+        common_redshift.run_statements(redshift, [sql], 'dev', 'bench-cluster', 'bench')
+        return rows
+
+    def redshift_paging():
+        # The rows and the column metadata of the table, both paged, in one batch
+        results = common_redshift.run_statements(redshift, [
+            f"SELECT * FROM {AWS_CONFIG['table_id']}",
+            "SELECT column_name, data_type FROM information_schema.columns"], 'dev', 'bench-cluster', 'bench')
+        if len(results[0]) != rows:
+            raise ValueError(f"{len(results[0])} of {rows} rows are paged")
+        return rows
+
+    def metadata_probe():
+        # System tables of the stand-in cluster: the rows inserted after the previous load are in the log, then the
+        # log no longer covers the previous load and the first new record is probed
+        engine.connection.execute("CREATE OR REPLACE TABLE svv_table_info AS SELECT 1 AS table_id, "
+                                  "'dev' AS \"database\", 'public' AS \"schema\", 'bench' AS \"table\"")
+        engine.connection.execute("CREATE OR REPLACE TABLE stl_insert AS SELECT 1 AS tbl, 1000 AS \"rows\", "
+                                  f"TIMESTAMP '{EXPORT_DATETIME}' - INTERVAL 1 DAY AS starttime, "
+                                  f"TIMESTAMP '{EXPORT_DATETIME}' AS endtime")
+        metadata_sql = file_operations.read_sql_file(
+            'redshift_migration_ENTITY_NAME/sql/redshift/new_records_metadata_probe.sql')
+        exists_sql = file_operations.read_sql_file(
+            'redshift_migration_ENTITY_NAME/sql/redshift/new_record_exists_after_ts.sql')
+        for insert_time, source in (('2023-05-31 12:00:00', change_probe.METADATA_SOURCE),
+                                    ('1970-01-01 00:00:00', change_probe.EXISTS_SOURCE)):
+            params = {'column_name': 'insert_time', 'table_id': AWS_CONFIG['table_id'], 'insert_time': insert_time}
+            probe = change_probe.probe_new_records(metadata_sql % params, exists_sql % params, 'dev', 'bench-cluster',
+                                                   'bench')
+            if probe['source'] != source or not probe['has_new_records']:
+                raise ValueError(f"Probe of the records after {insert_time} is {probe}")
+        return rows
+
+    def get_latest_load_ts():
+        bq_data_operations.get_latest_load_ts(project_id=GCP_CONFIG['project'], dataset_id=GCP_CONFIG['dataset_id'],
+                                              table_id=GCP_CONFIG['table_id'], column_name='insert_time')
+        return rows
+
+    def calculate_total_rows():
+        return file_operations.calculate_total_rows(GCP_CONFIG['bucket'], export_prefix)
+
+    def query_bq_single_value():
+        sql = file_operations.read_sql_file('redshift_migration_ENTITY_NAME/sql/bq/get_amount_of_inserted_rows.sql') % {
+            'table_id': table_id, 'export_datetime': EXPORT_DATETIME.replace('T', ' ')}
+        return int(bq_data_operations.query_bq_single_value(sql))
+
+    def s3_copy():
+        # The export is copied to S3 and back to a separate GCS prefix, so the other stages keep their files
+        s3_prefix = f"{AWS_CONFIG['path']}{EXPORT_DATETIME}/"
+        os.makedirs(os.path.dirname(store.path(AWS_CONFIG['bucket'], s3_prefix)), exist_ok=True)
+        for name in store.list(GCP_CONFIG['bucket'], f"{GCP_CONFIG['path']}{EXPORT_DATETIME}/"):
+            shutil.copyfile(store.path(GCP_CONFIG['bucket'], name),
+                            store.path(AWS_CONFIG['bucket'], s3_prefix + name.rsplit('/', 1)[1]))
+        s3_copier.copy_export_to_gcs(AWS_CONFIG['bucket'], s3_prefix, GCP_CONFIG['bucket'], f"s3-copy/{EXPORT_DATETIME}/")
+        return rows
+
+    def skip_existing():
+        # The export of s3_copy is transferred again to the same prefix, so every object is skipped, none is read
+        s3_prefix = f"{AWS_CONFIG['path']}{EXPORT_DATETIME}/"
+        for name in store.list(GCP_CONFIG['bucket'], f"s3-copy/{EXPORT_DATETIME}/"):
+            shutil.copyfile(store.path(GCP_CONFIG['bucket'], name),
+                            store.path(AWS_CONFIG['bucket'], s3_prefix + name.rsplit('/', 1)[1]))
+        copied = s3_copier.copy_export_to_gcs(AWS_CONFIG['bucket'], s3_prefix, GCP_CONFIG['bucket'],
+                                              f"s3-copy/{EXPORT_DATETIME}/", skip_existing=True)
+        if copied:
+            raise ValueError(f"{copied} bytes of the copied objects are copied from S3 again")
+        return rows
+
+    def run_schema_check():
+        # One export file on S3, the table matches it, so the second check uses the cached schema
+        s3_prefix = f"schema-check/{EXPORT_DATETIME}/"
+        name = store.list(GCP_CONFIG['bucket'], export_prefix)[0]
+        os.makedirs(os.path.dirname(store.path(AWS_CONFIG['bucket'], s3_prefix)), exist_ok=True)
+        shutil.copyfile(store.path(GCP_CONFIG['bucket'], name),
+                        store.path(AWS_CONFIG['bucket'], s3_prefix + name.rsplit('/', 1)[1]))
+        dataplex_stub.tables[table_id] = {'lastModifiedTime': '1', 'schema': {'fields': [
+            {'name': field.name, 'type': schema_check.get_bq_type(field.type), 'mode': 'NULLABLE'}
+            for field in pq.read_schema(store.path(GCP_CONFIG['bucket'], name))]}}
+        ddl = f"CREATE TABLE IF NOT EXISTS {table_id} (" + ", ".join(
+            f"{field['name']} {field['type']}" for field in dataplex_stub.tables[table_id]['schema']['fields']) + ")"
+        for _ in range(2):
+            if schema_check.check_export_schema(AWS_CONFIG['bucket'], s3_prefix, GCP_CONFIG['file_format'],
+                                                table_id, ddl, ENTITY_NAME):
+                raise ValueError("Synthetic export schema doesn't match its table")
+        return None
+
+    def verify_checksums():
+        if not checksum.verify_export_checksums(GCP_CONFIG['bucket'], export_prefix):
+            raise ValueError("Synthetic export checksums don't match")
+        return rows
+
+    def run_local_dq():
+        local_dq.validate_export_dq(GCP_CONFIG['bucket'], export_prefix, write_dq_config(store), ENTITY_NAME)
+        return rows
+
+    def run_dataplex():
+        ti = SimpleNamespace(xcom_pull=lambda task_ids: data_quality.get_configs_path(GCP_CONFIG, ENTITY_NAME))
+        task_id = f"{ENTITY_NAME}-dq-check"
+        run_id = f"manual__{EXPORT_DATETIME}"
+        data_quality.ensure_dataplex_task_and_submit(ENTITY_NAME, GCP_CONFIG, task_id, ti=ti, run_id=run_id)
+        # A task deleted outside of Airflow is created again despite the cached fingerprint
+        dataplex_stub.tasks.pop(task_id, None)
+        data_quality.ensure_dataplex_task_and_submit(ENTITY_NAME, GCP_CONFIG, task_id, ti=ti, run_id=run_id)
+        if task_id not in dataplex_stub.tasks:
+            raise RuntimeError(f"Deleted Dataplex task {task_id} isn't created again")
+        dataplex.get_dataplex_job_state(GCP_CONFIG['dataplex']['project'], GCP_CONFIG['dataplex']['region'],
+                                        GCP_CONFIG['dataplex']['lake_id'], task_id)
+        return None
+
+    def run_dataplex_shards():
+        configs_paths = [data_quality.get_configs_path(GCP_CONFIG, ENTITY_NAME, shard=shard) for shard in range(4)]
+        xcoms = {data_quality.RENDER_SHARDS_TASK_ID: configs_paths}
+        ti = SimpleNamespace(xcom_pull=lambda task_ids: xcoms[task_ids])
+        xcoms[data_quality.SUBMIT_SHARDS_TASK_ID] = data_quality.submit_dataplex_dq_shards(
+            ENTITY_NAME, GCP_CONFIG, ti=ti, run_id=f"manual__{EXPORT_DATETIME}")
+        state = data_quality.wait_dataplex_dq_shards(ENTITY_NAME, GCP_CONFIG, ti=ti)
+        if state != "SUCCEEDED":
+            raise RuntimeError(f"Dataplex shard jobs are {state}")
+        return None
+
+    def run_compaction():
+        # Export copy is compacted, so the other stages keep their files
+        compaction_prefix = f"compaction/{EXPORT_DATETIME}/{GCP_CONFIG['file_prefix']}"
+        shutil.copytree(export_dir, os.path.dirname(store.path(GCP_CONFIG['bucket'], compaction_prefix)))
+        return compaction.compact_export(GCP_CONFIG['bucket'], compaction_prefix, small_file_mb=1024)
+
+    stage_functions = {
+        "generate": generate,
+        "sql_generators": sql_generators,
+        "redshift_probe": redshift_probe,
+        "redshift_paging": redshift_paging,
+        "get_latest_load_ts": get_latest_load_ts,
+        "calculate_total_rows": calculate_total_rows,
+        "query_bq_single_value": query_bq_single_value,
+        "metadata_probe": metadata_probe,
+        "s3_copy": s3_copy,
+        "schema_check": run_schema_check,
+        "skip_existing": skip_existing,
+        "verify_checksums": verify_checksums,
+        "local_dq": run_local_dq,
+        "dataplex": run_dataplex,
+        "dataplex_shards": run_dataplex_shards,
+        "compaction": run_compaction,
+    }
+    with stand_ins.DataplexStub(polls_to_succeed=1) as dataplex_stub:
+        install_stand_ins(store, engine, dataplex_stub.endpoint)
+        common_redshift.redshift_data = SimpleNamespace(
+            RedshiftDataHook=lambda **kwargs: SimpleNamespace(conn=redshift))
+        # The exported files are required by all the other stages
+        report = [run_stage(stage, stage_functions[stage], store) for stage in STAGES
+                  if stage == "generate" or stage in stages]
+
+    print(f"{'stage':<24}{'wall time, s':>14}{'rows':>12}{'rows/s':>14}{'bytes read':>16}{'peak RSS, MB':>14}")
+    for stage_report in report:
+        print(f"{stage_report['stage']:<24}{stage_report['wall_time_s']:>14}{str(stage_report['rows']):>12}"
+              f"{str(stage_report['rows_per_s']):>14}{stage_report['bytes_read']:>16}{stage_report['peak_rss_mb']:>14}")
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'rows': rows, 'width': width, 'files': files, 'stages': report}, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Offline benchmark of the migration DAG callables.')
+    parser.add_argument('--rows', default=1_000_000, type=int, help='Total rows of the synthetic export')
+    parser.add_argument('--width', default=10, type=int, help='Data columns of the synthetic export')
+    parser.add_argument('--files', default=4, type=int, help='Parquet files of the synthetic export')
+    parser.add_argument('--stages', default=','.join(STAGES), type=str,
+                        help=f"Comma separated stages to run, from {', '.join(STAGES)}")
+    parser.add_argument('--work_dir', default=None, type=str, help='Directory of the stand-in object stores')
+    parser.add_argument('--output', default=None, type=str, help='JSON file to write the report to')
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    benchmark_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix='migration-bench-')
+    os.makedirs(benchmark_dir, exist_ok=True)
+    try:
+        main(args.rows, args.width, args.files, args.stages.split(','), benchmark_dir,
+             os.path.abspath(args.output) if args.output else None)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(benchmark_dir, ignore_errors=True)
@@ -0,0 +1,433 @@
+"""
+Local stand-ins of the cloud services used by the DAG callables, so the pipeline can be benchmarked offline.
+Object stores are directories, BigQuery and Redshift queries run on DuckDB and Dataplex is a local HTTP stub.
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import duckdb
+
+
+class ObjectStore:
+    """Directory backed object store with a counter of the bytes served to the readers."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.bytes_read = 0
+        # Custom metadata of the objects by bucket and name
+        self.metadata = {}
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, bucket_name: str, name: str) -> str:
+        return os.path.join(self.root, bucket_name, name)
+
+    def list(self, bucket_name: str, prefix: str = '') -> list:
+        bucket_root = os.path.join(self.root, bucket_name)
+        names = []
+        for directory, _, files in os.walk(bucket_root):
+            for file in files:
+                name = os.path.relpath(os.path.join(directory, file), bucket_root).replace(os.sep, '/')
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+    def read(self, bucket_name: str, name: str, start: int = 0, end: int = None) -> bytes:
+        with open(self.path(bucket_name, name), 'rb') as f:
+            f.seek(start)
+            data = f.read() if end is None else f.read(end - start + 1)
+        self.bytes_read += len(data)
+        return data
+
+    def write(self, bucket_name: str, name: str, data: bytes, metadata: dict = None) -> None:
+        path = self.path(bucket_name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.metadata[(bucket_name, name)] = metadata
+
+    def delete(self, bucket_name: str, name: str) -> None:
+        os.remove(self.path(bucket_name, name))
+        self.metadata.pop((bucket_name, name), None)
+
+    def md5(self, bucket_name: str, name: str) -> bytes:
+        with open(self.path(bucket_name, name), 'rb') as f:
+            return hashlib.md5(f.read()).digest()
+
+
+class FakeBlob:
+    def __init__(self, store: ObjectStore, bucket_name: str, name: str):
+        self._store = store
+        self.bucket_name = bucket_name
+        self.name = name
+        self.metadata = store.metadata.get((bucket_name, name))
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self._store.path(self.bucket_name, self.name))
+
+    @property
+    def md5_hash(self) -> str:
+        return base64.b64encode(self._store.md5(self.bucket_name, self.name)).decode('ascii')
+
+    def exists(self) -> bool:
+        return os.path.exists(self._store.path(self.bucket_name, self.name))
+
+    def reload(self) -> None:
+        pass
+
+    def download_to_filename(self, file_name: str) -> None:
+        with open(file_name, 'wb') as f:
+            f.write(self._store.read(self.bucket_name, self.name))
+
+    def download_as_bytes(self, start: int = None, end: int = None) -> bytes:
+        return self._store.read(self.bucket_name, self.name, start or 0, end)
+
+    def download_as_text(self) -> str:
+        return self.download_as_bytes().decode('utf-8')
+
+    def upload_from_string(self, data, content_type: str = None) -> None:
+        self._store.write(self.bucket_name, self.name, data.encode('utf-8') if isinstance(data, str) else data,
+                          self.metadata)
+
+    def upload_from_filename(self, file_name: str) -> None:
+        with open(file_name, 'rb') as f:
+            self.upload_from_string(f.read())
+
+    def open(self, mode: str = 'r', chunk_size: int = None):
+        if mode != 'wb':
+            raise ValueError(f"Mode {mode} isn't supported")
+        return _BlobWriter(self)
+
+    def delete(self) -> None:
+        self._store.delete(self.bucket_name, self.name)
+
+
+class _BlobWriter(io.BytesIO):
+    """Buffers the writes and uploads them on close, like the resumable upload BlobWriter does chunk by chunk."""
+
+    def __init__(self, blob: FakeBlob):
+        super().__init__()
+        self._blob = blob
+
+    def close(self) -> None:
+        if not self.closed:
+            self._blob.upload_from_string(self.getvalue())
+        super().close()
+
+
+class FakeBucket:
+    def __init__(self, store: ObjectStore, name: str):
+        self._store = store
+        self.name = name
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self._store, self.name, name)
+
+    def get_blob(self, name: str):
+        blob = self.blob(name)
+        return blob if blob.exists() else None
+
+    def copy_blob(self, blob: FakeBlob, destination_bucket, new_name: str) -> FakeBlob:
+        destination = FakeBlob(self._store, destination_bucket.name, new_name)
+        os.makedirs(os.path.dirname(self._store.path(destination_bucket.name, new_name)), exist_ok=True)
+        shutil.copyfile(self._store.path(self.name, blob.name), self._store.path(destination_bucket.name, new_name))
+        return destination
+
+
+class FakeStorageClient:
+    """Subset of google.cloud.storage.Client used by the common package."""
+
+    def __init__(self, store: ObjectStore):
+        self._store = store
+
+    def bucket(self, bucket_name: str) -> FakeBucket:
+        return FakeBucket(self._store, bucket_name)
+
+    def list_blobs(self, bucket_name, prefix: str = ''):
+        bucket_name = getattr(bucket_name, 'name', bucket_name)
+        return [FakeBlob(self._store, bucket_name, name) for name in self._store.list(bucket_name, prefix)]
+
+
+class FakeStorageModule:
+    """Replaces the google.cloud.storage module reference of the common modules."""
+
+    def __init__(self, store: ObjectStore):
+        self._store = store
+
+    def Client(self, *args, **kwargs) -> FakeStorageClient:
+        return FakeStorageClient(self._store)
+
+
+class FakeS3Client:
+    """Subset of the boto3 S3 client API over a directory backed object store."""
+
+    def __init__(self, store: ObjectStore):
+        self._store = store
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = '', **kwargs) -> dict:
+        contents = [{'Key': name, 'Size': os.path.getsize(self._store.path(Bucket, name)),
+                     'ETag': f'"{self._store.md5(Bucket, name).hex()}"'}
+                    for name in self._store.list(Bucket, Prefix)]
+        return {'Contents': contents, 'KeyCount': len(contents), 'IsTruncated': False}
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        return {'ContentLength': os.path.getsize(self._store.path(Bucket, Key)),
+                'ETag': f'"{self._store.md5(Bucket, Key).hex()}"'}
+
+    def get_object(self, Bucket: str, Key: str, Range: str = None) -> dict:
+        start, end = 0, None
+        if Range:
+            start, end = (int(value) for value in Range[len('bytes='):].split('-'))
+        return {'Body': _Body(self._store.read(Bucket, Key, start, end))}
+
+    def delete_object(self, Bucket: str, Key: str) -> dict:
+        self._store.delete(Bucket, Key)
+        return {}
+
+
+class _Body:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def read(self) -> bytes:
+        return self._data
+
+
+class SqlEngine:
+    """
+    DuckDB engine answering the BigQuery and Redshift queries of the DAG callables.
+    Tables are registered by their fully qualified names, e.g. project.dataset.table or dev.public.table.
+    """
+
+    def __init__(self):
+        self.connection = duckdb.connect()
+        self.connection.execute("SET TimeZone = 'UTC'")
+
+    def register_parquet_table(self, table_id: str, parquet_glob: str) -> None:
+        self.connection.execute(f"CREATE OR REPLACE VIEW \"{table_id}\" AS SELECT * FROM read_parquet('{parquet_glob}')")
+
+    def translate(self, sql: str) -> str:
+        # BigQuery `project.dataset.table` and Redshift dev.public.table identifiers, but not literals, are quoted
+        sql = re.sub(r'`([^`]+)`', r'"\1"', sql)
+        sql = re.sub(r'(?<!["\'\w])(\w+\.\w+\.\w+)(?![\w"\'])', r'"\1"', sql)
+        return re.sub(r"TIMESTAMP\('([^']*)'\)", r"CAST('\1' AS TIMESTAMPTZ)", sql)
+
+    def query_df(self, sql: str):
+        return self.connection.execute(self.translate(sql)).fetchdf()
+
+    def query_records(self, sql: str) -> list:
+        return self.connection.execute(self.translate(sql)).fetchall()
+
+
+class FakeQueryJob:
+    def __init__(self, table, page_rows: int):
+        self._table = table
+        self._page_rows = page_rows
+        self.total_rows = table.num_rows
+        # On-demand BigQuery pricing bills at least 10 MB per query
+        self.total_bytes_processed = table.nbytes
+        self.total_bytes_billed = max(self.total_bytes_processed, 10 * 1024 * 1024)
+
+    def result(self):
+        return self
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        return iter(self._table.to_batches(max_chunksize=self._page_rows))
+
+
+class FakeBigQueryModule:
+    """Replaces the google.cloud.bigquery module reference of common.bq_data_operations."""
+
+    def __init__(self, engine: SqlEngine, page_rows: int = 64 * 1024):
+        self._engine = engine
+        self._page_rows = page_rows
+        self.project = 'benchmark'
+
+    def Client(self, *args, **kwargs):
+        return self
+
+    def query(self, sql: str, *args, **kwargs) -> FakeQueryJob:
+        table = self._engine.connection.execute(self._engine.translate(sql)).fetch_arrow_table()
+        return FakeQueryJob(table, self._page_rows)
+
+
+class FakeBigQueryStorageModule:
+    """Replaces the google.cloud.bigquery_storage module reference, the results are paged by FakeQueryJob."""
+
+    def BigQueryReadClient(self, *args, **kwargs):
+        return self
+
+
+class FakeRedshiftDataClient:
+    """
+    Subset of the boto3 redshift-data client API, statements run synchronously on the SQL engine. Results are
+    paged by page_records like the Data API pages them by size.
+    """
+
+    def __init__(self, engine: SqlEngine, page_records: int = 10000):
+        self._engine = engine
+        self._results = {}
+        self.page_records = page_records
+
+    def execute_statement(self, Sql: str, **kwargs) -> dict:
+        return self.batch_execute_statement(Sqls=[Sql])
+
+    def batch_execute_statement(self, Sqls: list, **kwargs) -> dict:
+        statement_id = str(uuid.uuid4())
+        for index, sql in enumerate(Sqls):
+            self._results[f"{statement_id}:{index + 1}"] = self._engine.query_records(sql)
+        self._results[statement_id] = self._results[f"{statement_id}:{len(Sqls)}"]
+        return {'Id': statement_id}
+
+    def describe_statement(self, Id: str) -> dict:
+        sub_statements = [{'Id': key, 'Status': 'FINISHED', 'HasResultSet': True}
+                          for key in self._results if key.startswith(f"{Id}:")]
+        # Single statements have no sub-statements
+        return {'Id': Id, 'Status': 'FINISHED', 'HasResultSet': True,
+                'SubStatements': sub_statements if len(sub_statements) > 1 else []}
+
+    def get_statement_result(self, Id: str, NextToken: str = None) -> dict:
+        start = int(NextToken or 0)
+        records = self._results[Id][start:start + self.page_records]
+        page = {'Records': [[_to_field(value) for value in record] for record in records]}
+        if start + self.page_records < len(self._results[Id]):
+            page['NextToken'] = str(start + self.page_records)
+        return page
+
+
+def _to_field(value) -> dict:
+    if value is None:
+        return {'isNull': True}
+    if isinstance(value, bool):
+        return {'booleanValue': value}
+    if isinstance(value, int):
+        return {'longValue': value}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class DataplexStub:
+    """
+    Local HTTP stub of the Dataplex tasks API and the BigQuery tables.get. Jobs succeed after the configured number
+    of status polls.
+    """
+
+    def __init__(self, polls_to_succeed: int = 2):
+        self.polls_to_succeed = polls_to_succeed
+        self.tasks = {}
+        # project.dataset.table to the tables.get resource
+        self.tables = {}
+        self.requests = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: dict) -> None:
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _task_id(self) -> str:
+                path = self.path.split('?')[0]
+                match = re.search(r'/tasks/([^/:]+)', path)
+                if match:
+                    return match.group(1)
+                return re.search(r'taskId=([^&]+)', self.path).group(1)
+
+            def _get_table(self):
+                match = re.search(r'/projects/([^/]+)/datasets/([^/]+)/tables/([^/?]+)', self.path)
+                table = stub.tables.get('.'.join(match.groups()))
+                if table is None:
+                    return self._reply(404, {'error': {'code': 404}})
+                fields = re.search(r'fields=([^&]+)', self.path)
+                if fields:
+                    selected = unquote(fields.group(1)).split(',')
+                    table = {name: value for name, value in table.items() if name in selected}
+                return self._reply(200, table)
+
+            def do_GET(self):
+                stub.requests += 1
+                if self.path.startswith('/bigquery/v2/'):
+                    return self._get_table()
+                task_id = self._task_id()
+                if task_id not in stub.tasks:
+                    return self._reply(404, {'error': {'code': 404}})
+                if self.path.split('?')[0].endswith('/jobs'):
+                    task = stub.tasks[task_id]
+                    task['polls'] += 1
+                    state = 'SUCCEEDED' if task['polls'] >= stub.polls_to_succeed else 'RUNNING'
+                    return self._reply(200, {'jobs': [{'state': state}]})
+                return self._reply(200, {'name': task_id})
+
+            def do_POST(self):
+                stub.requests += 1
+                task_id = self._task_id()
+                if self.path.split('?')[0].endswith(':run'):
+                    if task_id not in stub.tasks:
+                        return self._reply(404, {'error': {'code': 404}})
+                    stub.tasks[task_id]['polls'] = 0
+                    return self._reply(200, {'job': {}})
+                stub.tasks[task_id] = {'polls': 0}
+                return self._reply(200, {'name': task_id})
+
+            def do_PATCH(self):
+                stub.requests += 1
+                return self._reply(200, {'name': self._task_id()})
+
+            def do_DELETE(self):
+                stub.requests += 1
+                if stub.tasks.pop(self._task_id(), None) is None:
+                    return self._reply(404, {'error': {'code': 404}})
+                return self._reply(200, {})
+
+        return Handler
+
+
+class FakeVariable:
+    """In-memory replacement of airflow.models.Variable, so no Airflow metadata DB is needed."""
+    values = {}
+
+    @classmethod
+    def get(cls, key: str, default_var=None, deserialize_json: bool = False):
+        if key not in cls.values:
+            return default_var
+        return json.loads(cls.values[key]) if deserialize_json else cls.values[key]
+
+    @classmethod
+    def set(cls, key: str, value, serialize_json: bool = False) -> None:
+        cls.values[key] = value
+
+    @classmethod
+    def delete(cls, key: str) -> None:
+        cls.values.pop(key, None)
@@ -0,0 +1,65 @@
+"""
+Synthetic Parquet exports shaped like the Redshift unload output: data columns, export_datetime and checksum.
+"""
+import os
+
+import duckdb
+import pyarrow.parquet as pq
+
+from common import checksum
+
+# Data column types are cycled through to reach the requested width
+COLUMN_TYPES = [
+    ("BIGINT", "i * 7 + {n}"),
+    ("VARCHAR", "'value_' || (i % 1000 + {n})"),
+    ("DOUBLE", "(i % 10000) / 100.0 + {n}"),
+    ("BOOLEAN", "(i + {n}) % 3 = 0"),
+    ("TIMESTAMP", "TIMESTAMP '2023-01-01 00:00:00' + to_seconds(i + {n})"),
+]
+CHUNK_ROWS = 64 * 1024
+
+
+def get_select_sql(width: int, export_datetime: str) -> str:
+    columns = ["TIMESTAMP '2023-01-01 00:00:00' + to_seconds(i) AS insert_time"]
+    for n in range(width):
+        column_type, expression = COLUMN_TYPES[n % len(COLUMN_TYPES)]
+        columns.append(f"CAST({expression.format(n=n)} AS {column_type}) AS c{n}")
+    columns.append(f"TIMESTAMP '{export_datetime.replace('T', ' ')}' AS export_datetime")
+    return ", ".join(columns)
+
+
+def generate_export(directory: str, file_prefix: str, export_datetime: str, rows: int, width: int,
+                    files: int = 1, row_group_size: int = CHUNK_ROWS) -> list:
+    """
+    This method will write `files` Parquet files with `rows` rows in total and `width` data columns.
+    Rows are generated and checksummed in chunks, so memory doesn't depend on the export size.
+    Args:
+    Returns: list of the written file paths
+    """
+    os.makedirs(directory, exist_ok=True)
+    connection = duckdb.connect()
+    select_sql = get_select_sql(width, export_datetime)
+    rows_per_file = -(-rows // files)
+    paths = []
+    for file_index in range(files):
+        first_row = file_index * rows_per_file
+        last_row = min(rows, first_row + rows_per_file)
+        path = os.path.join(directory, f"{file_prefix}{file_index:04d}_part_00.parquet")
+        writer = None
+        for chunk_start in range(first_row, last_row, CHUNK_ROWS):
+            chunk_end = min(last_row, chunk_start + CHUNK_ROWS)
+            chunk = connection.execute(
+                f"SELECT {select_sql} FROM range({chunk_start}, {chunk_end}) t(i)").fetch_arrow_table()
+            batch = chunk.combine_chunks().to_batches()[0]
+            columns = checksum.get_checksum_columns(chunk.schema)
+            chunk = chunk.append_column(checksum.CHECKSUM_COLUMN,
+                                        checksum.compute_batch_checksums(batch, columns, connection))
+            if writer is None:
+                writer = pq.ParquetWriter(path, chunk.schema)
+            writer.write_table(chunk, row_group_size=row_group_size)
+        if writer is not None:
+            writer.close()
+            paths.append(path)
+    connection.close()
+    return paths
+
@@ -0,0 +1,242 @@
+import logging
+from datetime import datetime, timedelta
+from functools import partial
+
+from airflow import DAG
+from airflow.exceptions import AirflowSkipException
+from airflow.operators.python import PythonOperator
+from airflow.operators.trigger_dagrun import TriggerDagRunOperator
+from airflow.utils.task_group import TaskGroup
+
+from common import checkpoints
+from common import file_operations
+from common import lazy_operators
+from common import metrics
+from common import polling
+from common import s3_copier
+from common import scheduler
+from common import sinks
+from common import unload
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+REDSHIFT_TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+# The incremental predicate of the unload SQL generated by generate_sql.py
+INSERT_TIME_PREDICATE = "''%(insert_time)s''"
+
+
+def get_backfill_windows(start: datetime, end: datetime, window_days: int) -> list:
+    """
+    This method will split the (start, end] history into windows of window_days, the last one may be shorter.
+    Args:
+    Returns: list of (window_start, window_end) tuples
+    """
+    windows = []
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + timedelta(days=window_days), end)
+        windows.append((window_start, window_end))
+        window_start = window_end
+    return windows
+
+
+def get_window_unload_sql(unload_sql: str, column_name: str) -> str:
+    """
+    This method will bound the incremental unload SQL from above, so it unloads the
+    column_name > insert_time AND column_name <= insert_time_to window only.
+    Args:
+    Returns: str with the insert_time_to placeholder
+    """
+    if INSERT_TIME_PREDICATE not in unload_sql:
+        raise ValueError(f"Unload SQL has no {INSERT_TIME_PREDICATE} predicate to bound the window")
+    return unload_sql.replace(INSERT_TIME_PREDICATE,
+                              f"{INSERT_TIME_PREDICATE} AND {column_name} <= ''%(insert_time_to)s''", 1)
+
+
+def has_window_rows(response: dict) -> bool:
+    records = (response or {}).get('Records', [])
+    if records and isinstance(records[0], list) and isinstance(records[0][0], dict):
+        # Checkpoints of the earlier backfill runs keep the has_rows boolean
+        return bool(records[0][0].get('longValue', records[0][0].get('booleanValue', False)))
+    return False
+
+
+def restore_window_stage(context: dict, checkpoint_location: str, export_datetime: str, check_task_id: str) -> None:
+    """
+    This method is a window task pre_execute hook. Tasks of an empty window are skipped, otherwise the
+    completed stages of the window are restored from their checkpoints.
+    Args:
+    Returns: None
+    """
+    ti = context['ti']
+    if ti.task_id != check_task_id and not has_window_rows(ti.xcom_pull(task_ids=check_task_id)):
+        raise AirflowSkipException(f"Window of export {export_datetime} has no rows")
+    checkpoints.restore_stage(context, checkpoint_location, export_datetime)
+
+
+def __window_tasks(dag: DAG, entity_name: str, config: dict, group_id: str, window_start: datetime,
+                   window_end: datetime, checkpoint_location: str) -> TaskGroup:
+    gcp_config = config['gcp']
+    aws_config = config['aws']
+    # Window end is the export datetime, so every window is validated and checkpointed on its own
+    export_datetime = window_end.isoformat(timespec="seconds")
+    gcs_prefix = f"{gcp_config['path']}{export_datetime}/{gcp_config['file_prefix']}"
+    column_name = config['ts_incremental_column_name']
+    unload_sql = get_window_unload_sql(
+        file_operations.read_sql_file(f'redshift_migration_{entity_name}/sql/redshift/unload_{entity_name}.sql'),
+        column_name)
+    check_task_id = f"{group_id}.check_window_has_rows"
+    # Sensors poll by the durations of the incremental migration runs scaled to the window rows
+    tune_window_sensor = partial(polling.tune_sensor, metrics_table_id=metrics.get_run_metrics_table_id(gcp_config),
+                                 policy=polling.get_polling_policy(config),
+                                 pre_execute=partial(restore_window_stage, checkpoint_location=checkpoint_location,
+                                                     export_datetime=export_datetime, check_task_id=check_task_id),
+                                 dag_id=f'redshift-to-bq-{entity_name}-migration', batch_rows_task_id=check_task_id)
+
+    # Tasks of empty windows are skipped by the pre_execute hook, the rest of the DAG runs after skipped ones
+    window_default_args = {
+        'pre_execute': partial(restore_window_stage, checkpoint_location=checkpoint_location,
+                               export_datetime=export_datetime, check_task_id=check_task_id),
+        'on_success_callback': [metrics.emit_task_metrics,
+                                partial(checkpoints.mark_stage_completed, checkpoint_location=checkpoint_location,
+                                        export_datetime=export_datetime)],
+    }
+    with TaskGroup(group_id=group_id, dag=dag, default_args=window_default_args) as window_group:
+        check_window_has_rows = lazy_operators.lazy_operator(
+            task_id='check_window_has_rows',
+            operator=lazy_operators.REDSHIFT_DATA,
+            operator_kwargs={
+                'aws_conn_id': 'aws_default',
+                'db_user': 'awsuser',
+                'sql': f"SELECT count(*) AS window_rows FROM {aws_config['table_id']} "
+                       f"WHERE {column_name} > '{window_start.strftime(REDSHIFT_TS_FORMAT)}' "
+                       f"AND {column_name} <= '{window_end.strftime(REDSHIFT_TS_FORMAT)}'",
+                'database': 'dev',
+                'cluster_identifier': '<RS_CLUSTER_ID>',
+                'return_sql_result': True,
+            },
+            dag=dag
+        )
+
+        unload_to_s3 = PythonOperator(
+            task_id=unload.UNLOAD_TASK_ID,
+            python_callable=unload.unload_export,
+            op_kwargs={
+                'unload_sql': unload_sql % {'table_id': aws_config['table_id'],
+                                            'insert_time': window_start.strftime(REDSHIFT_TS_FORMAT),
+                                            'insert_time_to': window_end.strftime(REDSHIFT_TS_FORMAT),
+                                            'export_datetime': export_datetime},
+                'rows_sql': file_operations.read_sql_file(
+                    f'redshift_migration_{entity_name}/sql/redshift/unload_rows_sum.sql'),
+                'database': 'dev',
+                'cluster_identifier': '<RS_CLUSTER_ID>',
+                'db_user': 'awsuser',
+            },
+            pool=config.get('redshift_unload_pool', scheduler.REDSHIFT_UNLOAD_POOL),
+            dag=dag
+        )
+
+        s3_key_sensor = lazy_operators.lazy_sensor(
+            task_id='s3_key_sensor',
+            sensor=lazy_operators.S3_KEY_SENSOR,
+            sensor_kwargs={
+                'bucket_key': f"s3://{aws_config['bucket']}/{aws_config['path']}{export_datetime}/"
+                              f"{aws_config['file_prefix']}*{aws_config['file_format']}",
+                'wildcard_match': True,
+            },
+            pre_execute=tune_window_sensor,
+            dag=dag
+        )
+
+        create_s3_transfer_job = lazy_operators.lazy_operator(
+            task_id='create_s3_transfer_job',
+            operator=lazy_operators.S3_TO_GCS_TRANSFER,
+            operator_kwargs={
+                's3_bucket': aws_config['bucket'],
+                'gcs_bucket': gcp_config['bucket'],
+                's3_path': aws_config['path'] + export_datetime,
+                'gcs_path': gcp_config['path'] + export_datetime,
+                'project_id': gcp_config['project'],
+                'aws_conn_id': "aws_default",
+                'schedule': None,
+                'transfer_options': s3_copier.get_transfer_options(config.get('skip_existing_objects', False)),
+                'description': f"S3 {entity_name} backfill transfer for {export_datetime}",
+            },
+            dag=dag
+        )
+
+        count_files_total_rows = PythonOperator(
+            task_id='count_files_total_rows',
+            python_callable=file_operations.calculate_total_rows,
+            op_kwargs={'bucket_name': gcp_config['bucket'], 'prefix': gcs_prefix},
+            execution_timeout=timedelta(minutes=10),
+            dag=dag
+        )
+
+        # Windows are loaded to the sinks by the tasks of the incremental migration, in the load_mode of the entity.
+        # A window which isn't loaded fails the backfill, short circuits would skip the incremental migration silently
+        load_kwargs = {'sensor_pre_execute': tune_window_sensor, 'replace_export_rows': True, 'fail_on_mismatch': True}
+        export_datetime_suffix = export_datetime.replace('-', '').replace(':', '').lower()
+        load_start, _, _ = sinks.load_tasks(dag, entity_name, config, sinks.get_primary_sink(gcp_config),
+                                            export_datetime, export_datetime_suffix, count_files_total_rows,
+                                            **load_kwargs)
+
+        check_window_has_rows >> unload_to_s3 >> s3_key_sensor >> create_s3_transfer_job >> \
+            [load_start, count_files_total_rows]
+        for sink in sinks.get_sinks(gcp_config):
+            create_s3_transfer_job >> sinks.sink_tasks(dag, entity_name, config, sink, export_datetime,
+                                                       export_datetime_suffix, count_files_total_rows,
+                                                       default_args=window_default_args, **load_kwargs)
+
+    return window_group
+
+
+def backfill_tasks(dag: DAG, entity_name: str, config: dict) -> None:
+    backfill_config = config['backfill']
+    windows = get_backfill_windows(datetime.fromisoformat(backfill_config['start']),
+                                   datetime.fromisoformat(backfill_config['end']),
+                                   backfill_config.get('window_days', 30))
+    checkpoint_location = checkpoints.get_checkpoint_location(config['gcp'])
+
+    bq_create_table = lazy_operators.lazy_operator(
+        task_id='bq_create_table',
+        operator=lazy_operators.BQ_QUERY,
+        operator_kwargs={
+            'sql': file_operations.read_sql_file(f'redshift_migration_{entity_name}/sql/bq/{entity_name}_schema.sql'),
+            'use_legacy_sql': False,
+        },
+        dag=dag)
+
+    # The incremental DAG continues from the latest loaded insert time, which is at most the backfill end
+    trigger_incremental_migration = TriggerDagRunOperator(
+        task_id='trigger_incremental_migration',
+        trigger_dag_id=f'redshift-to-bq-{entity_name}-migration',
+        conf={'resume': False},
+        trigger_rule='none_failed',
+        dag=dag
+    )
+
+    for index, (window_start, window_end) in enumerate(windows):
+        window_group = __window_tasks(dag, entity_name, config, f"window_{index:04d}", window_start, window_end,
+                                      checkpoint_location)
+        bq_create_table >> window_group >> trigger_incremental_migration
+
+
+def create_dag(entity_name: str, config: dict, start_date: datetime.date = None, dag_name: str = None) -> DAG:
+    if dag_name is None:
+        dag_name = f'redshift-to-bq-{entity_name}-backfill'
+    dag = DAG(
+        dag_id=dag_name,
+        start_date=start_date,
+        default_args={'retries': 1, 'retry_delay': timedelta(minutes=5), 'trigger_rule': 'none_failed'},
+        description=f'Redshift {entity_name} table backfill DAG',
+        schedule=None,
+        catchup=False,
+        max_active_tasks=config['backfill'].get('max_active_tasks', 16),
+        tags=['redshift-data-migration', 'beta-6.0', 'backfill'],
+    )
+
+    backfill_tasks(dag, entity_name, config)
+
+    return dag
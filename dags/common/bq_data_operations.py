@@ -1,18 +1,61 @@
+from __future__ import annotations
+
+import functools
 import logging
+from typing import Iterator
+
+from common.lazy_imports import lazy_import
+from common.metrics import record_stage_metrics
+from common.profiling import profiled
 
-import pandas_gbq
-from pandas import DataFrame
+pa = lazy_import('pyarrow')
+pd = lazy_import('pandas')
+bigquery = lazy_import('google.cloud.bigquery')
+bigquery_storage = lazy_import('google.cloud.bigquery_storage')
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger()
 
 
-def query_bq_df(sql: str) -> DataFrame:
-    return pandas_gbq.read_gbq(sql, dialect='standard').dropna()
+@functools.lru_cache(maxsize=None)
+def get_read_client():
+    # Shared by the queries of the worker process, its channel is only opened by the results which use it
+    return bigquery_storage.BigQueryReadClient()
+
+
+def query_bq_arrow_batches(sql: str, columns: list = None, job_stats: dict = None) -> Iterator[pa.RecordBatch]:
+    """
+    This method will run the query and stream its result as Arrow record batches. Results bigger than the first
+    page are read with the BigQuery Storage Read API, small ones, e.g. single values, by the REST API page the
+    query returned. Only one batch is held in memory at a time, the query ORDER BY is kept.
+    Args: columns projects the result to the given columns, by default all of them are read, job_stats is filled
+    with the result rows and the bytes processed and billed by the query
+    Returns: Iterator[pa.RecordBatch]
+    """
+    query_job = bigquery.Client().query(sql)
+    row_iterator = query_job.result()
+    if job_stats is not None:
+        job_stats.update(rows=row_iterator.total_rows or 0, bytes_processed=query_job.total_bytes_processed or 0,
+                         bytes_billed=query_job.total_bytes_billed or 0)
+    for batch in row_iterator.to_arrow_iterable(bqstorage_client=get_read_client()):
+        yield pa.RecordBatch.from_arrays([batch.column(name) for name in columns], names=columns) if columns \
+            else batch
 
 
+def query_bq_df(sql: str, columns: list = None, job_stats: dict = None) -> pd.DataFrame:
+    batches = list(query_bq_arrow_batches(sql, columns, job_stats))
+    if not batches:
+        return pd.DataFrame(columns=columns)
+    return pa.Table.from_batches(batches).to_pandas().dropna()
+
+
+@profiled
 def query_bq_single_value(sql: str) -> str:
-    df = query_bq_df(sql)
+    # Task callable of the query stages, e.g. the validations, so the query is the stage. Helpers running queries
+    # for other stages, e.g. the sensor polling history, don't record theirs
+    job_stats = {}
+    df = query_bq_df(sql, job_stats=job_stats)
+    record_stage_metrics(**job_stats)
     sql_data = []
     for index, row in df.iterrows():
         single_row = []
@@ -25,10 +68,15 @@ def query_bq_single_value(sql: str) -> str:
         return sql_data[0][0]
 
 
+def get_latest_load_ts_sql(full_table_path: str, column_name: str) -> str:
+    return f"SELECT COALESCE(MAX({column_name}), TIMESTAMP('1970-01-01 00:00:00 UTC')) FROM `{full_table_path}`"
+
+
+@profiled
 def get_latest_load_ts(**context: dict) -> str:
     full_table_path = get_full_table_id(context['project_id'], context['dataset_id'], context['table_id'])
     column_name = context['column_name']
-    sql = f"SELECT COALESCE(MAX({column_name}), TIMESTAMP('1970-01-01 00:00:00 UTC')) FROM `{full_table_path}`"
+    sql = get_latest_load_ts_sql(full_table_path, column_name)
     log.info(f"SQL: {sql}")
     load_ts = query_bq_single_value(sql)
     if not load_ts:
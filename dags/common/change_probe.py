@@ -0,0 +1,77 @@
+import logging
+
+from airflow.exceptions import AirflowSkipException
+
+from common import redshift
+from common.metrics import record_stage_metrics
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+PROBE_TASK_ID = "check_if_table_has_new_records"
+COUNT = "count"
+METADATA = "metadata"
+METADATA_SOURCE = "metadata"
+EXISTS_SOURCE = "exists"
+
+
+def evaluate_metadata(in_log_retention, table_found, inserted_rows) -> dict:
+    """
+    This method will decide whether the metadata probe is conclusive. Rows newer than the previous load are
+    committed after it, so they are in stl_insert if the system log still covers the previous load and the table
+    is visible to the probe user. System tables show only the user's own statements to users without
+    SYSLOG ACCESS UNRESTRICTED, their log has no rows then and the probe is inconclusive.
+    Args: values of the new_records_metadata_probe.sql row
+    Returns: dict with has_new_records and estimated_rows or None if the metadata is inconclusive
+    """
+    if not in_log_retention or not table_found:
+        return None
+    return {'has_new_records': inserted_rows > 0, 'estimated_rows': inserted_rows, 'source': METADATA_SOURCE}
+
+
+def probe_new_records(metadata_sql: str, exists_sql: str, database: str, cluster_identifier: str, db_user: str,
+                      aws_conn_id: str = 'aws_default') -> dict:
+    """
+    This method will check whether the table has records newer than the previous load without scanning it. The
+    rows inserted since the previous load are read from the Redshift system tables, and only if they are
+    inconclusive the existence query stops at the first new record. The metadata estimate of the new rows sizes
+    the downstream stages, the existence query gives no estimate.
+    Args: metadata_sql of new_records_metadata_probe.sql, exists_sql of new_record_exists_after_ts.sql
+    Returns: dict with has_new_records, estimated_rows and the source of the decision
+    """
+    client = redshift.get_client(aws_conn_id)
+    probe = None
+    try:
+        records = redshift.run_statements(client, [metadata_sql], database, cluster_identifier, db_user)[0]
+        probe = evaluate_metadata(*records[0]) if records else None
+    except Exception as e:
+        # The probe user may have no access to the system tables
+        log.warning(f"Redshift metadata probe failed: {e}")
+    if probe is None:
+        log.info("Redshift metadata is inconclusive, probing the first new record")
+        records = redshift.run_statements(client, [exists_sql], database, cluster_identifier, db_user)[0]
+        probe = {'has_new_records': bool(records), 'estimated_rows': None, 'source': EXISTS_SOURCE}
+
+    record_stage_metrics(metadata_probe=int(probe['source'] == METADATA_SOURCE),
+                         **({'estimated_rows': probe['estimated_rows']} if probe['estimated_rows'] is not None else {}))
+    log.info(f"New records: {probe['has_new_records']}, estimated rows: {probe['estimated_rows']}, "
+             f"by {probe['source']}")
+    return probe
+
+
+def get_estimated_rows(ti, task_id: str = PROBE_TASK_ID):
+    probe = ti.xcom_pull(task_ids=task_id)
+    return probe.get('estimated_rows') if isinstance(probe, dict) else None
+
+
+def skip_if_estimated(context: dict, probe_task_id: str = PROBE_TASK_ID, pre_execute=None) -> None:
+    """
+    This method is a pre_execute hook of the exact count of the new records, skipped if the probe estimated
+    them from the metadata.
+    Args: pre_execute hook run if the task isn't skipped, e.g. the checkpoint restore
+    Returns: None
+    """
+    if get_estimated_rows(context['ti'], probe_task_id) is not None:
+        raise AirflowSkipException(f"New records are estimated by {probe_task_id}")
+    if pre_execute:
+        pre_execute(context)
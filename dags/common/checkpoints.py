@@ -0,0 +1,261 @@
+import json
+import logging
+import os
+from datetime import datetime
+
+from airflow.exceptions import AirflowSkipException
+from airflow.models import XCom
+from airflow.operators.python import ShortCircuitOperator
+from airflow.utils.session import create_session
+from airflow.utils.state import State
+
+from common.lazy_imports import lazy_import
+
+storage = lazy_import('google.cloud.storage')
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+EXPORT_DATETIME_TASK_ID = "generate_export_datetime"
+RUN_COMPLETED_MARKER = "_COMPLETED"
+# Exports whose validation failed, resumed only if the run conf asks for them
+RUN_FAILED_MARKER = "_FAILED"
+STAGE_SUFFIX = ".json"
+# Stages checkpointed only once the stage they are completed by succeeded, so a resumed run doesn't sense the
+# failed DTS run of the previous one again but creates and runs the transfer anew
+COMPLETED_BY = {'create_bq_transfer': 'bq_transfer_job_succeeded', 'run_bq_transfer_job': 'bq_transfer_job_succeeded'}
+# Validation queries aren't checkpointed, a resumed run queries the loaded table and the export files again instead of
+# failing the validation on the results of the previous run
+VALIDATION_QUERY_STAGES = {'plan_validations', 'count_files_total_rows', 'get_bq_total_rows',
+                           'compare_redshift_checksum_with_bq'}
+
+
+def get_checkpoint_location(_gcp_config: dict) -> str:
+    """
+    This method will return the checkpoints location of the entity, a gs:// path or a local directory.
+    Args:
+    Returns: str ending with /
+    """
+    return _gcp_config.get('checkpoint_location', f"gs://{_gcp_config['bucket']}/{_gcp_config['path']}checkpoints/")
+
+
+def __split_gcs_path(path: str) -> tuple:
+    bucket_name, blob_name = path[len("gs://"):].split('/', 1)
+    return bucket_name, blob_name
+
+
+def __read(path: str):
+    if path.startswith("gs://"):
+        bucket_name, blob_name = __split_gcs_path(path)
+        blob = storage.Client().bucket(bucket_name).get_blob(blob_name)
+        return blob.download_as_text() if blob else None
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read()
+
+
+def __write(path: str, data: str) -> None:
+    if path.startswith("gs://"):
+        bucket_name, blob_name = __split_gcs_path(path)
+        storage.Client().bucket(bucket_name).blob(blob_name).upload_from_string(data, content_type='application/json')
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(data)
+
+
+def __list(location: str) -> list:
+    # Object names relative to the location
+    if location.startswith("gs://"):
+        bucket_name, prefix = __split_gcs_path(location)
+        return [blob.name[len(prefix):] for blob in storage.Client().list_blobs(bucket_name, prefix=prefix)]
+    names = []
+    for directory, _, files in os.walk(location):
+        names.extend(os.path.relpath(os.path.join(directory, file), location).replace(os.sep, '/') for file in files)
+    return names
+
+
+def get_completed_stages(checkpoint_location: str, export_datetime: str) -> list:
+    """
+    This method will list the stages completed for the export.
+    Args:
+    Returns: list of the stage (task) ids
+    """
+    return [name[:-len(STAGE_SUFFIX)] for name in __list(f"{checkpoint_location}{export_datetime}/")
+            if name.endswith(STAGE_SUFFIX)]
+
+
+def get_latest_incomplete_export(checkpoint_location: str):
+    """
+    This method will find the latest export having checkpoints but marked neither as completed nor as failed.
+    Args:
+    Returns: str export_datetime or None
+    """
+    exports = {}
+    for name in __list(checkpoint_location):
+        export_datetime, _, stage = name.partition('/')
+        exports.setdefault(export_datetime, set()).add(stage)
+    incomplete = [export_datetime for export_datetime, stages in exports.items()
+                  if RUN_COMPLETED_MARKER not in stages and RUN_FAILED_MARKER not in stages]
+    return max(incomplete) if incomplete else None
+
+
+def get_export_datetime(checkpoint_location: str, resume_incomplete_runs: bool = True, **context) -> str:
+    """
+    This method will return the export datetime of the run: resume_export_datetime of the run conf, the latest
+    incomplete export if resuming is on (conf resume overrides the config) or a new one. Exports whose validation
+    failed are resumed only by resume_export_datetime.
+    Args:
+    Returns: str
+    """
+    conf = context['dag_run'].conf or {}
+    export_datetime = conf.get('resume_export_datetime')
+    if not export_datetime and conf.get('resume', resume_incomplete_runs):
+        export_datetime = get_latest_incomplete_export(checkpoint_location)
+    if export_datetime:
+        log.info(f"Resuming export {export_datetime}, completed stages: "
+                 f"{get_completed_stages(checkpoint_location, export_datetime)}")
+        return export_datetime
+    return datetime.utcnow().isoformat(timespec="seconds")
+
+
+def __split_stage(task_id: str) -> tuple:
+    # Task group prefix, e.g. of the backfill windows or the sinks, and the stage
+    prefix, _, stage = task_id.rpartition('.')
+    return f"{prefix}." if prefix else "", stage
+
+
+def __is_checkpointed(task) -> bool:
+    # Short circuit validations are cheap and re-evaluated from the results of the stages they check
+    return task.task_id != EXPORT_DATETIME_TASK_ID and not isinstance(task, ShortCircuitOperator) \
+        and __split_stage(task.task_id)[1] not in VALIDATION_QUERY_STAGES
+
+
+def get_checkpointed_task_ids(task_id: str) -> list:
+    """
+    This method will return the task ids checkpointed when the task succeeds: none for the stages completed by
+    another one, the task and the stages it completes otherwise.
+    Args:
+    Returns: list
+    """
+    prefix, stage = __split_stage(task_id)
+    if stage in COMPLETED_BY:
+        return []
+    return [task_id] + [f"{prefix}{completed_stage}" for completed_stage, completed_by in COMPLETED_BY.items()
+                        if completed_by == stage]
+
+
+def restore_stage(context: dict, checkpoint_location: str, export_datetime: str = None) -> None:
+    """
+    This method is a task pre_execute hook. If the stage is completed for the export, its XComs are restored
+    for the downstream tasks and the task is skipped.
+    Args: export_datetime defaults to the one generated by the run
+    Returns: None
+    """
+    ti = context['ti']
+    if not __is_checkpointed(context['task']):
+        return
+    export_datetime = export_datetime or ti.xcom_pull(task_ids=EXPORT_DATETIME_TASK_ID)
+    checkpoint = __read(f"{checkpoint_location}{export_datetime}/{ti.task_id}{STAGE_SUFFIX}")
+    if checkpoint is None:
+        return
+    checkpoint = json.loads(checkpoint)
+    for key, value in checkpoint['xcom'].items():
+        ti.xcom_push(key=key, value=value)
+    raise AirflowSkipException(f"Stage {ti.task_id} of export {export_datetime} is completed "
+                               f"at {checkpoint['completed_at']}")
+
+
+def restore_chosen_stage(context: dict, checkpoint_location: str, choices: dict) -> None:
+    """
+    This method is a pre_execute hook of the tasks of alternative paths, e.g. S3 or direct transfer. The task is
+    skipped if any of the choice tasks has chosen another path, otherwise its stage is restored as usual.
+    Args: choices dict of the choice task id to the path value the task belongs to
+    Returns: None
+    """
+    ti = context['ti']
+    for choice_task_id, path in choices.items():
+        chosen_path = ti.xcom_pull(task_ids=choice_task_id)
+        if chosen_path is not None and chosen_path != path:
+            raise AirflowSkipException(f"Path {chosen_path} is chosen by {choice_task_id}")
+    restore_stage(context, checkpoint_location)
+
+
+def mark_stage_completed(context: dict, checkpoint_location: str, export_datetime: str = None) -> None:
+    """
+    This method is a task success callback saving the stage XComs as the export checkpoint, together with the
+    ones of the stages the task completes.
+    Args: export_datetime defaults to the one generated by the run
+    Returns: None
+    """
+    ti = context['ti']
+    if not __is_checkpointed(context['task']):
+        return
+    export_datetime = export_datetime or ti.xcom_pull(task_ids=EXPORT_DATETIME_TASK_ID)
+    completed_at = datetime.utcnow().isoformat(timespec="seconds")
+    for task_id in get_checkpointed_task_ids(ti.task_id):
+        with create_session() as session:
+            xcom = {row.key: XCom.deserialize_value(row)
+                    for row in XCom.get_many(run_id=ti.run_id, dag_ids=ti.dag_id, task_ids=task_id, session=session)}
+        checkpoint = {'completed_at': completed_at, 'run_id': ti.run_id, 'xcom': xcom}
+        __write(f"{checkpoint_location}{export_datetime}/{task_id}{STAGE_SUFFIX}", json.dumps(checkpoint, default=str))
+        log.info(f"Stage {task_id} of export {export_datetime} is checkpointed")
+
+
+def get_failed_validations(dag_run, dag, gate_task_ids: tuple = ()) -> list:
+    """
+    This method will return the short circuit validations of the run whose condition was false. They skip the rest
+    of the run instead of failing it, so the run succeeds although the export isn't loaded.
+    Args: gate_task_ids short circuit tasks which end the run by design, e.g. when there are no new records
+    Returns: list of the task ids
+    """
+    return [ti.task_id for ti in dag_run.get_task_instances()
+            if ti.task_id not in gate_task_ids and dag.has_task(ti.task_id)
+            and isinstance(dag.get_task(ti.task_id), ShortCircuitOperator)
+            # A false condition is the only way a short circuit succeeds without a result
+            and ti.state == State.SUCCESS and ti.xcom_pull(task_ids=ti.task_id) is None]
+
+
+def __get_run_export_datetime(dag_run):
+    return dag_run.get_task_instance(EXPORT_DATETIME_TASK_ID).xcom_pull(task_ids=EXPORT_DATETIME_TASK_ID)
+
+
+def __mark_run_failed(dag_run, checkpoint_location: str, export_datetime: str, failed_validations: list) -> None:
+    log.warning(f"Export {export_datetime} isn't completed, validations {failed_validations} failed. "
+                f"Resume it with the resume_export_datetime run conf")
+    __write(f"{checkpoint_location}{export_datetime}/{RUN_FAILED_MARKER}",
+            json.dumps({'failed_at': datetime.utcnow().isoformat(timespec="seconds"), 'run_id': dag_run.run_id,
+                        'validations': failed_validations}))
+
+
+def mark_run_completed(context: dict, checkpoint_location: str, gate_task_ids: tuple = ()) -> None:
+    """
+    This method is a DAG success callback marking the export as completed, so it isn't resumed. Exports whose
+    validation returned False are marked as failed instead, so the next runs start a new export rather than failing
+    the same validation again, until the failed one is resumed by resume_export_datetime.
+    Args: gate_task_ids short circuit tasks which end the run by design
+    Returns: None
+    """
+    export_datetime = __get_run_export_datetime(context['dag_run'])
+    if not export_datetime:
+        return
+    failed_validations = get_failed_validations(context['dag_run'], context['dag'], gate_task_ids)
+    if failed_validations:
+        __mark_run_failed(context['dag_run'], checkpoint_location, export_datetime, failed_validations)
+        return
+    __write(f"{checkpoint_location}{export_datetime}/{RUN_COMPLETED_MARKER}", "{}")
+
+
+def mark_run_failed(context: dict, checkpoint_location: str, validation_task_ids: tuple) -> None:
+    """
+    This method is a DAG failure callback marking the export as failed if one of the validations failing the run,
+    e.g. the DQ results gate, failed. Runs failed by other tasks aren't marked, so the next run resumes them.
+    Args: validation_task_ids tasks failing the run when their validation fails
+    Returns: None
+    """
+    export_datetime = __get_run_export_datetime(context['dag_run'])
+    failed_validations = [ti.task_id for ti in context['dag_run'].get_task_instances()
+                          if ti.task_id in validation_task_ids and ti.state == State.FAILED]
+    if export_datetime and failed_validations:
+        __mark_run_failed(context['dag_run'], checkpoint_location, export_datetime, failed_validations)
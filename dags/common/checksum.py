@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import logging
+
+from common.lazy_imports import lazy_import
+from common.metrics import record_stage_metrics
+from common.profiling import profiled
+
+duckdb = lazy_import('duckdb')
+pa = lazy_import('pyarrow')
+pc = lazy_import('pyarrow.compute')
+pq = lazy_import('pyarrow.parquet')
+fs = lazy_import('pyarrow.fs')
+storage = lazy_import('google.cloud.storage')
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+CHECKSUM_COLUMN = "checksum"
+# Columns added by the unload SQL which are not a part of the checksum
+EXCLUDED_COLUMNS = [CHECKSUM_COLUMN, "export_datetime"]
+COLUMNS_SEPARATOR = ", "
+DEFAULT_BATCH_SIZE = 64 * 1024
+
+
+def __canonicalize(column: pa.Array) -> pa.Array:
+    # Mirrors COALESCE(CAST(<column> AS VARCHAR), '') of the unload SQL generated by generate_sql.py
+    if pa.types.is_boolean(column.type):
+        # CASE WHEN <column> THEN 'true' ELSE 'false' END, so NULL is 'false'
+        canonical = pc.if_else(pc.fill_null(column, False), 'true', 'false')
+    elif pa.types.is_timestamp(column.type):
+        # Redshift drops trailing zeros of the fractional seconds and the fraction itself if it's zero
+        canonical = pc.strftime(column, format='%Y-%m-%d %H:%M:%S')
+        canonical = pc.replace_substring_regex(canonical, pattern=r'(\.\d*?)0+$', replacement=r'\1')
+        canonical = pc.replace_substring_regex(canonical, pattern=r'\.$', replacement='')
+    elif pa.types.is_date(column.type):
+        canonical = pc.strftime(column, format='%Y-%m-%d')
+    else:
+        canonical = pc.cast(column, pa.string())
+    return pc.fill_null(canonical, '')
+
+
+def get_checksum_columns(schema: pa.Schema) -> list:
+    return [name for name in schema.names if name not in EXCLUDED_COLUMNS]
+
+
+def compute_batch_checksums(batch: pa.RecordBatch, columns: list,
+                            connection: duckdb.DuckDBPyConnection) -> pa.ChunkedArray:
+    """
+    This method will compute the checksum of every batch row the way the unload SQL does.
+    Columns are canonicalized and concatenated with Arrow compute kernels and hashed with the DuckDB md5 function,
+    so no per-row Python code is run.
+    Args:
+    Returns: pa.ChunkedArray of hex md5 strings
+    """
+    canonical_columns = [__canonicalize(batch.column(name)) for name in columns]
+    payload_batch = pa.table({'payload': pc.binary_join_element_wise(*canonical_columns, COLUMNS_SEPARATOR)})
+    connection.register('payload_batch', payload_batch)
+    checksums = connection.execute("SELECT md5(payload) AS checksum FROM payload_batch").fetch_arrow_table()['checksum']
+    connection.unregister('payload_batch')
+    return checksums
+
+
+def count_batch_mismatches(batch: pa.RecordBatch, columns: list, connection: duckdb.DuckDBPyConnection) -> int:
+    """
+    This method will recompute the checksum of every batch row and count the ones differing from the unloaded one.
+    Args:
+    Returns: int
+    """
+    checksums = compute_batch_checksums(batch, columns, connection)
+    matches = pc.equal(checksums, batch.column(CHECKSUM_COLUMN))
+    return batch.num_rows - pc.sum(pc.fill_null(matches, False)).as_py()
+
+
+def verify_parquet_checksum(parquet_file: pq.ParquetFile, columns: list = None,
+                            batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+    """
+    This method will stream the Parquet file record batches and verify their checksum column.
+    Only one batch of the checksum columns is held in memory regardless of the file size.
+    Args:
+    Returns: dict with rows and mismatches
+    """
+    if columns is None:
+        columns = get_checksum_columns(parquet_file.schema_arrow)
+    connection = duckdb.connect()
+    rows = 0
+    mismatches = 0
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns + [CHECKSUM_COLUMN]):
+        rows += batch.num_rows
+        mismatches += count_batch_mismatches(batch, columns, connection)
+    connection.close()
+    return {'rows': rows, 'mismatches': mismatches}
+
+
+@profiled
+def verify_export_checksums(bucket_name: str, prefix: str, columns: list = None,
+                            batch_size: int = DEFAULT_BATCH_SIZE) -> bool:
+    """
+    This method will verify the checksum column of every exported Parquet file at GCS before the BQ load.
+    Files are read with ranged requests, they are not downloaded to the worker disk.
+    Args: columns overrides the checksum columns order, by default it's the Parquet schema order
+    Returns: bool True if all the checksums match
+    """
+    client = storage.Client()
+    gcs = fs.GcsFileSystem()
+    report = {}
+    log.info(f"Starting checksum verification of files at {bucket_name}/{prefix}")
+    for blob in client.list_blobs(bucket_name, prefix=prefix):
+        with gcs.open_input_file(f"{bucket_name}/{blob.name}") as f:
+            report[blob.name] = verify_parquet_checksum(pq.ParquetFile(f), columns, batch_size)
+        log.info(f"File {blob.name} has {report[blob.name]['rows']} rows, "
+                 f"{report[blob.name]['mismatches']} checksum mismatches")
+
+    mismatched_files = {name: result for name, result in report.items() if result['mismatches']}
+    record_stage_metrics(files=len(report), rows=sum(result['rows'] for result in report.values()),
+                         mismatches=sum(result['mismatches'] for result in report.values()))
+    if mismatched_files:
+        log.error(f"Checksum mismatches found in files: {mismatched_files}")
+    return not mismatched_files
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+
+from common.lazy_imports import lazy_import
+from common.metrics import record_stage_metrics
+
+pa = lazy_import('pyarrow')
+pq = lazy_import('pyarrow.parquet')
+fs = lazy_import('pyarrow.fs')
+storage = lazy_import('google.cloud.storage')
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+COMPACT_EXPORT_TASK_ID = "compact_export_files"
+MANIFEST_NAME = "_compaction_manifest.json"
+COMPACTED_INFIX = "compacted_"
+DEFAULT_SMALL_FILE_MB = 64
+DEFAULT_TARGET_FILE_MB = 256
+DEFAULT_ROW_GROUP_MB = 128
+DEFAULT_BATCH_SIZE = 64 * 1024
+
+
+def get_compacted_name(prefix: str, index: int, file_format: str = ".parquet") -> str:
+    return f"{prefix}{COMPACTED_INFIX}{index:04d}{file_format}"
+
+
+def get_manifest_name(prefix: str) -> str:
+    return f"{os.path.dirname(prefix)}/{MANIFEST_NAME}"
+
+
+def plan_compaction(files: list, small_file_mb: int = DEFAULT_SMALL_FILE_MB,
+                    target_file_mb: int = DEFAULT_TARGET_FILE_MB) -> list:
+    """
+    This method will group the small files in the name order into groups of about target_file_mb.
+    Files of at least small_file_mb are kept as they are, single small files aren't rewritten.
+    Args: files list of (name, size in bytes) tuples
+    Returns: list of lists of the file names, one per compacted file
+    """
+    small_files = sorted((name, size) for name, size in files if size < small_file_mb * 1024 ** 2)
+    if len(small_files) < 2:
+        return []
+    groups, group, group_bytes = [], [], 0
+    for name, size in small_files:
+        if group and group_bytes + size > target_file_mb * 1024 ** 2:
+            groups.append(group)
+            group, group_bytes = [], 0
+        group.append(name)
+        group_bytes += size
+    groups.append(group)
+    return groups
+
+
+def __get_row_group_rows(metadata: pq.FileMetaData, row_group_mb: int) -> int:
+    # Uncompressed bytes per row of the source file
+    total_byte_size = sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+    bytes_per_row = total_byte_size / metadata.num_rows if metadata.num_rows else 1
+    return max(int(row_group_mb * 1024 ** 2 / max(bytes_per_row, 1)), DEFAULT_BATCH_SIZE)
+
+
+def compact_files(gcs: fs.FileSystem, bucket_name: str, names: list, compacted_name: str,
+                  row_group_mb: int = DEFAULT_ROW_GROUP_MB, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    This method will stream the record batches of the Parquet files into a single file. Batches are buffered up to
+    a row group of about row_group_mb uncompressed, so memory doesn't depend on the files size.
+    Args:
+    Returns: int written rows
+    """
+    writer, row_group_rows, buffered, buffered_rows, rows = None, 0, [], 0, 0
+    with gcs.open_output_stream(f"{bucket_name}/{compacted_name}") as sink:
+        for name in names:
+            with gcs.open_input_file(f"{bucket_name}/{name}") as source:
+                parquet_file = pq.ParquetFile(source)
+                if writer is None:
+                    row_group_rows = __get_row_group_rows(parquet_file.metadata, row_group_mb)
+                    writer = pq.ParquetWriter(sink, parquet_file.schema_arrow, compression='snappy')
+                elif not parquet_file.schema_arrow.equals(writer.schema):
+                    raise ValueError(f"File {name} schema differs from the one of {names[0]}")
+                for batch in parquet_file.iter_batches(batch_size=batch_size):
+                    buffered.append(batch)
+                    buffered_rows += batch.num_rows
+                    if buffered_rows >= row_group_rows:
+                        writer.write_table(pa.Table.from_batches(buffered), row_group_size=row_group_rows)
+                        rows += buffered_rows
+                        buffered, buffered_rows = [], 0
+        if buffered:
+            writer.write_table(pa.Table.from_batches(buffered), row_group_size=row_group_rows)
+            rows += buffered_rows
+        writer.close()
+    return rows
+
+
+def __count_rows(gcs: fs.FileSystem, bucket_name: str, name: str) -> int:
+    with gcs.open_input_file(f"{bucket_name}/{name}") as source:
+        return pq.ParquetFile(source).metadata.num_rows
+
+
+def compact_export(bucket_name: str, prefix: str, file_format: str = ".parquet",
+                   small_file_mb: int = DEFAULT_SMALL_FILE_MB, target_file_mb: int = DEFAULT_TARGET_FILE_MB,
+                   row_group_mb: int = DEFAULT_ROW_GROUP_MB) -> int:
+    """
+    This method will merge the small Parquet files of the export into files of about target_file_mb, so the
+    transfer, load and validation stages handle fewer files. The compacted files match the export prefix, their
+    rows are verified against the source files before these are deleted. The manifest next to the export
+    lists the export files with their rows, so a retried compaction finishes the previous one instead of
+    duplicating the rows.
+    Args: prefix of the export files, e.g. path/export_datetime/file_prefix
+    Returns: int total rows of the export
+    """
+    client = storage.Client()
+    bucket = client.bucket(bucket_name)
+    gcs = fs.GcsFileSystem()
+    manifest_name = get_manifest_name(prefix)
+
+    manifest_blob = bucket.get_blob(manifest_name)
+    if manifest_blob is None:
+        # Compacted files of a failed try aren't listed by any manifest
+        for blob in client.list_blobs(bucket_name, prefix=f"{prefix}{COMPACTED_INFIX}"):
+            log.info(f"Deleting {blob.name} of a failed compaction")
+            blob.delete()
+        files = [(blob.name, blob.size) for blob in client.list_blobs(bucket_name, prefix=prefix)
+                 if blob.name.endswith(file_format)]
+        groups = plan_compaction(files, small_file_mb, target_file_mb)
+        compacted = {}
+        for index, names in enumerate(groups):
+            compacted_name = get_compacted_name(prefix, index, file_format)
+            source_rows = sum(__count_rows(gcs, bucket_name, name) for name in names)
+            rows = compact_files(gcs, bucket_name, names, compacted_name, row_group_mb)
+            if rows != source_rows or __count_rows(gcs, bucket_name, compacted_name) != source_rows:
+                raise ValueError(f"Compacted file {compacted_name} rows don't match {source_rows} source rows")
+            compacted[compacted_name] = names
+            log.info(f"{len(names)} files of {rows} rows are compacted to {compacted_name}")
+
+        compacted_sources = {name for names in compacted.values() for name in names}
+        export_files = [name for name, _ in files if name not in compacted_sources] + list(compacted)
+        manifest = {
+            'files': [{'name': name, 'rows': __count_rows(gcs, bucket_name, name)} for name in sorted(export_files)],
+            'compacted': compacted,
+        }
+        manifest['rows'] = sum(file['rows'] for file in manifest['files'])
+        bucket.blob(manifest_name).upload_from_string(json.dumps(manifest), content_type='application/json')
+    else:
+        manifest = json.loads(manifest_blob.download_as_text())
+        log.info(f"Export is compacted by a previous try, manifest {manifest_name}")
+
+    # Sources are deleted after the manifest is written, a retry deletes the ones left
+    sources = [name for names in manifest['compacted'].values() for name in names]
+    for name in sources:
+        blob = bucket.get_blob(name)
+        if blob is not None:
+            blob.delete()
+
+    record_stage_metrics(rows=manifest['rows'], files=len(manifest['files']), compacted_files=len(sources))
+    log.info(f"Export has {len(manifest['files'])} files of {manifest['rows']} rows, "
+             f"{len(sources)} files are compacted")
+    return manifest['rows']
@@ -0,0 +1,123 @@
+import logging
+import re
+
+from airflow.exceptions import AirflowSkipException
+
+from common.bq_data_operations import query_bq_single_value
+from common.lazy_imports import lazy_import
+from common.metrics import record_stage_metrics
+
+bigquery = lazy_import('google.cloud.bigquery')
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+PLAN_VALIDATIONS_TASK_ID = "plan_validations"
+FULL = "full"
+SAMPLED = "sampled"
+SKIP = "skip"
+# On-demand pricing, used for the reports only
+PRICE_PER_TIB_USD = 6.25
+# The sample has to fit sampled_max_gb for tables above full_max_gb, e.g. 1 percent of up to 1 TB
+DEFAULT_BUDGETS = {
+    'full_max_gb': 100,
+    'sampled_max_gb': 10,
+    'sample_percent': 1,
+}
+TABLE_REFERENCE_PATTERN = re.compile(r"(FROM\s+`[^`]+`)", re.IGNORECASE)
+RESULT_ALIAS_PATTERN = re.compile(r"\bAS\s+(\w+)\s+FROM\s+`", re.IGNORECASE)
+
+
+def estimate_query_bytes(sql: str) -> int:
+    """
+    This method will dry run the query, which is free, to get the bytes it would process.
+    Args:
+    Returns: int
+    """
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    return bigquery.Client().query(sql, job_config=job_config).total_bytes_processed or 0
+
+
+def estimate_cost_usd(bytes_processed: int) -> float:
+    return bytes_processed / 1024 ** 4 * PRICE_PER_TIB_USD
+
+
+def get_sampled_sql(sql: str, sample_percent: int) -> str:
+    """
+    This method will sample the blocks of the query table, so only the sample is scanned and billed, and
+    aggregate the per row boolean result column, e.g. equal_checksum, to whether all the sampled rows passed.
+    An empty sample passes.
+    Args:
+    Returns: str
+    """
+    alias = RESULT_ALIAS_PATTERN.search(sql)
+    if not alias or not TABLE_REFERENCE_PATTERN.search(sql):
+        raise ValueError("Query has no <expr> AS <alias> FROM `table` to sample")
+    sampled_sql = TABLE_REFERENCE_PATTERN.sub(rf"\1 TABLESAMPLE SYSTEM ({sample_percent} PERCENT)", sql, count=1)
+    return f"SELECT COALESCE(LOGICAL_AND({alias.group(1)}), TRUE) AS {alias.group(1)} " \
+           f"FROM ({sampled_sql.strip().rstrip(';')})"
+
+
+def choose_strategy(full_bytes: int, budgets: dict, can_sample: bool) -> str:
+    """
+    This method will choose the full validation if its estimated bytes fit the full budget, the sampled one
+    if the sample fits the sampled budget, otherwise the validation is skipped.
+    Args:
+    Returns: str full, sampled or skip
+    """
+    if full_bytes <= budgets['full_max_gb'] * 1024 ** 3:
+        return FULL
+    if can_sample and full_bytes * budgets['sample_percent'] / 100 <= budgets['sampled_max_gb'] * 1024 ** 3:
+        return SAMPLED
+    return SKIP
+
+
+def plan_validations(validations: dict, budgets: dict = None, **context) -> dict:
+    """
+    This method will dry run the full query of every validation and choose its strategy by the cost budgets.
+    Estimated bytes are recorded as the stage metrics.
+    Args: validations dict of the validation name to dict with sql and sample (whether it can be sampled);
+    a validation with required set is always run in full, e.g. the watermark query, and only reported
+    Returns: dict of the validation name to its strategy
+    """
+    budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+    plan, estimates = {}, {}
+    for name, validation in validations.items():
+        full_bytes = estimate_query_bytes(validation['sql'])
+        estimates[f"{name}_estimated_bytes"] = full_bytes
+        if validation.get('required'):
+            plan[name] = FULL
+            if full_bytes > budgets['full_max_gb'] * 1024 ** 3:
+                log.warning(f"Required {name} query exceeds the full validation budget")
+        else:
+            plan[name] = choose_strategy(full_bytes, budgets, validation.get('sample', False))
+        log.info(f"Validation {name}: {full_bytes} bytes, ${estimate_cost_usd(full_bytes):.4f} in full, "
+                 f"strategy {plan[name]}")
+    record_stage_metrics(**estimates)
+    return plan
+
+
+def get_planned_strategy(ti, validation: str) -> str:
+    # Validations run in full if they aren't planned
+    plan = ti.xcom_pull(task_ids=PLAN_VALIDATIONS_TASK_ID) or {}
+    return plan.get(validation, FULL)
+
+
+def run_planned_query(validation: str, sql: str, sample_percent: int = DEFAULT_BUDGETS['sample_percent'],
+                      **context) -> str:
+    """
+    This method will run the validation query the way the plan chose: in full, sampled or not at all.
+    Args:
+    Returns: str single value of the query
+    """
+    strategy = get_planned_strategy(context['ti'], validation)
+    if strategy == SKIP:
+        raise AirflowSkipException(f"Validation {validation} exceeds the cost budgets")
+    if strategy == SAMPLED:
+        sql = get_sampled_sql(sql, sample_percent)
+    log.info(f"Running {strategy} {validation} validation")
+    return query_bq_single_value(sql)
+
+
+def is_planned_skip(ti, validation: str) -> bool:
+    return get_planned_strategy(ti, validation) == SKIP
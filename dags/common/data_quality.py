@@ -1,23 +1,184 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
 import logging
 from datetime import timedelta, datetime
 
 from airflow import DAG
+from airflow.models import Variable
 from airflow.operators.bash import BashOperator
 from airflow.operators.python import BranchPythonOperator, PythonOperator
-from airflow.providers.google.cloud.operators.dataplex import (
-    DataplexCreateTaskOperator,
-)
-from airflow.utils.trigger_rule import TriggerRule
 
-from common.dataplex import get_dataplex_task, get_dataplex_job_state, submit_dataplex_task
+from common import polling
+from common import profiling
+from common.lazy_imports import lazy_import
+from common.metrics import get_run_metrics_table_id
+from common.dataplex import get_dataplex_task, get_dataplex_job_state, get_dataplex_jobs_states, submit_dataplex_task, \
+    create_dataplex_task, update_dataplex_task, delete_dataplex_task
+
+yaml = lazy_import('yaml')
+exceptions = lazy_import('google.api_core.exceptions')
+bigquery = lazy_import('google.cloud.bigquery')
+storage = lazy_import('google.cloud.storage')
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger()
 
 PUBLIC_CLOUDDQ_EXECUTABLE_BUCKET_NAME = "dataplex-clouddq-artifacts"
+# Row filter which the compiled rules are bound to when they are compiled with the --incremental flag
+EXPORT_BATCH_ROW_FILTER_ID = "EXPORT_BATCH"
+FULL_SWEEP_FILTER_SQL_EXPR = "True"
+RENDER_SHARDS_TASK_ID = "render_dq_shard_configs"
+SUBMIT_SHARDS_TASK_ID = "submit_dataplex_dq_shards"
+WAIT_SHARDS_TASK_ID = "wait_dataplex_dq_shards"
+SUBMIT_JOB_TASK_ID = "submit_dataplex_dq_job"
+WAIT_JOB_TASK_ID = "wait_dataplex_dq_job"
+MERGE_RESULTS_TASK_ID = "merge_dq_results"
+RECORD_FULL_SWEEP_TASK_ID = "record_full_sweep"
+FULL_SWEEP_XCOM_KEY = "full_sweep"
+
+
+def get_shards(_gcp_config: dict) -> int:
+    return _gcp_config['dataplex'].get('shards', 1)
 
 
-def __get_task_api_body(_gcp_config: dict, entity_name: str):
+def get_configs_path(_gcp_config: dict, entity_name: str, export_datetime: str = None, shard: int = None) -> str:
+    yaml_bucket_name = _gcp_config['dataplex']['yaml_bucket_name']
+    environment = _gcp_config['environment']
+    # Shards are compiled by tests/compile.py --shards next to the full config
+    shard_suffix = f"-shard{shard:02d}" if shard is not None else ""
+    if not export_datetime:
+        return f"gs://{yaml_bucket_name}/{entity_name}-{environment}{shard_suffix}.yaml"
+    run_suffix = export_datetime.replace('-', '').replace(':', '')
+    return f"gs://{yaml_bucket_name}/runs/{entity_name}-{environment}-{run_suffix}{shard_suffix}.yaml"
+
+
+def get_summary_table(_gcp_config: dict, suffix: str = None) -> str:
+    """
+    This method will return the BigQuery table the DQ summary results are stored at, or the table of a single
+    job of the run if the suffix is set.
+    Args:
+    Returns: str project.dataset.table
+    """
+    table_id = _gcp_config['table_id'] if suffix is None else f"{_gcp_config['table_id']}_{suffix.replace('-', '_')}"
+    return f"{_gcp_config['project']}.{_gcp_config['dataset_id']}_dq_results.{table_id}"
+
+
+def __get_task_args(_gcp_config: dict, entity_name: str, configs_path: str, target_table: str = None) -> str:
+    # The Google Cloud Project where the BQ jobs will be created
+    gcp_project_id = _gcp_config['project']
+    # The BigQuery dataset used for storing the intermediate data quality summary results
+    # and the BigQuery views associated with each rule binding
+    gcp_bq_dataset_id = f"{_gcp_config['dataset_id']}_dq_results"
+    gcp_bq_region = _gcp_config['dataset_region_id']  # GCP BQ region where the data is stored
+    # The BigQuery table where the final results of the data quality checks are stored.
+    full_target_table_name = target_table or get_summary_table(_gcp_config)
+
+    return f"clouddq-executable.zip, \
+               ALL, \
+               {configs_path}, \
+              --gcp_project_id=\"{gcp_project_id}\", \
+              --gcp_region_id=\"{gcp_bq_region}\", \
+              --gcp_bq_dataset_id=\"{gcp_bq_dataset_id}\", \
+              --target_bigquery_summary_table=\"{full_target_table_name}\""
+
+
+def is_full_sweep_due(entity_name: str, _gcp_config: dict, **context) -> bool:
+    """
+    This method decides whether the DQ run checks the whole table instead of the latest export batch only.
+    A full sweep is done when the DAG was triggered without an export_datetime, when it is requested explicitly
+    with the full_sweep conf flag or when full_sweep_interval_days passed since the previous full sweep.
+    Args:
+    Returns: bool
+    """
+    conf = context['dag_run'].conf or {}
+    if not conf.get('export_datetime') or conf.get('full_sweep', False):
+        return True
+    interval_days = _gcp_config['dataplex'].get('full_sweep_interval_days')
+    if interval_days is None:
+        return False
+    last_full_sweep = Variable.get(f"{entity_name}-dq-last-full-sweep", default_var=None)
+    if last_full_sweep is None:
+        return True
+    return datetime.utcnow() - datetime.fromisoformat(last_full_sweep) >= timedelta(days=interval_days)
+
+
+def __get_filter_sql_expr(entity_name: str, _gcp_config: dict, **context) -> str:
+    export_datetime = (context['dag_run'].conf or {}).get('export_datetime')
+    if is_full_sweep_due(entity_name, _gcp_config, **context):
+        log.info(f"Running full sweep DQ checks for {entity_name}")
+        # Recorded as done by record_full_sweep once the DQ job succeeded
+        context['ti'].xcom_push(key=FULL_SWEEP_XCOM_KEY, value=True)
+        return FULL_SWEEP_FILTER_SQL_EXPR
+    log.info(f"Running DQ checks for {entity_name} export batch {export_datetime}")
+    return f"export_datetime = TIMESTAMP('{export_datetime}')"
+
+
+def __render_config(bucket: storage.Bucket, source_path: str, target_path: str, get_filter_sql_expr) -> str:
+    yaml_data = yaml.safe_load(bucket.blob(source_path.split('/', 3)[3]).download_as_text())
+    if EXPORT_BATCH_ROW_FILTER_ID not in yaml_data.get('row_filters', {}):
+        log.info(f"DQ config {source_path} has no {EXPORT_BATCH_ROW_FILTER_ID} row filter, running it as is")
+        return source_path
+
+    yaml_data['row_filters'][EXPORT_BATCH_ROW_FILTER_ID]['filter_sql_expr'] = get_filter_sql_expr()
+    bucket.blob(target_path.split('/', 3)[3]).upload_from_string(yaml.dump(yaml_data, default_flow_style=False))
+    log.info(f"DQ config {target_path} created")
+    return target_path
+
+
+def __get_run_key(**context) -> str:
+    # Runs triggered without an export_datetime, e.g. the manual full sweeps, render their config by the run ts
+    return (context['dag_run'].conf or {}).get('export_datetime') or context['ts_nodash']
+
+
+def render_dq_config(entity_name: str, _gcp_config: dict, **context) -> str:
+    """
+    This method renders the compiled DQ config for the export batch of the triggering migration DAG run.
+    The EXPORT_BATCH row filter is replaced by the export_datetime predicate, so the rules bound to it scan
+    only the newly loaded rows. Configs compiled without the --incremental flag are passed as is.
+    Args:
+    Returns: str GCS path of the config to run
+    """
+    bucket = storage.Client().bucket(_gcp_config['dataplex']['yaml_bucket_name'])
+    return __render_config(bucket, get_configs_path(_gcp_config, entity_name),
+                           get_configs_path(_gcp_config, entity_name, __get_run_key(**context)),
+                           lambda: __get_filter_sql_expr(entity_name, _gcp_config, **context))
+
+
+def render_dq_shard_configs(entity_name: str, _gcp_config: dict, shards: int, **context) -> list:
+    """
+    This method renders the compiled DQ config shards for the export batch of the triggering migration DAG
+    run the way render_dq_config does. The full sweep is decided once for all the shards.
+    Args:
+    Returns: list of GCS paths of the shard configs to run
+    """
+    run_key = __get_run_key(**context)
+    bucket = storage.Client().bucket(_gcp_config['dataplex']['yaml_bucket_name'])
+    get_filter_sql_expr = functools.lru_cache(maxsize=None)(
+        lambda: __get_filter_sql_expr(entity_name, _gcp_config, **context))
+    return [__render_config(bucket, get_configs_path(_gcp_config, entity_name, shard=shard),
+                            get_configs_path(_gcp_config, entity_name, run_key, shard),
+                            get_filter_sql_expr)
+            for shard in range(shards)]
+
+
+def record_full_sweep(entity_name: str, render_task_id: str, **context) -> bool:
+    """
+    This method will record the full sweep of the run as done, so the next one is due full_sweep_interval_days
+    after it. It runs only after the DQ job succeeded, failed or aborted full sweeps are run again by the next run.
+    Args: render_task_id task rendering the DQ config of the run
+    Returns: bool whether the run was a full sweep
+    """
+    if not context['ti'].xcom_pull(task_ids=render_task_id, key=FULL_SWEEP_XCOM_KEY):
+        return False
+    Variable.set(f"{entity_name}-dq-last-full-sweep", datetime.utcnow().isoformat(timespec="seconds"))
+    log.info(f"Full sweep DQ checks of {entity_name} are recorded")
+    return True
+
+
+def __get_task_api_body(_gcp_config: dict, entity_name: str, configs_path: str = None, target_table: str = None):
     dataplex_region = _gcp_config['dataplex']['region']
     service_acc = _gcp_config['dataplex']['service_acc']
 
@@ -31,19 +192,8 @@ def __get_task_api_body(_gcp_config: dict, entity_name: str):
 
     # The gcs bucket to store data quality YAML configurations input to the data quality task.
     # You can have a single yaml file in .yml or yaml format or a .zip archive containing multiple YAML files.
-    yaml_bucket_name = _gcp_config['dataplex']['yaml_bucket_name']
-    environment = _gcp_config['environment']
-    configs_path = f"gs://{yaml_bucket_name}/{entity_name}-{environment}.yaml"
-
-    # The Google Cloud Project where the BQ jobs will be created
-    gcp_project_id = _gcp_config['project']
-    # The BigQuery dataset used for storing the intermediate data quality summary results
-    # and the BigQuery views associated with each rule binding
-    gcp_bq_dataset_id = f"{_gcp_config['dataset_id']}_dq_results"
-    # The BigQuery table where the final results of the data quality checks are stored.
-    target_bq_table = _gcp_config['table_id']
-    gcp_bq_region = _gcp_config['dataset_region_id']  # GCP BQ region where the data is stored
-    full_target_table_name = f"{gcp_project_id}.{gcp_bq_dataset_id}.{target_bq_table}"
+    if configs_path is None:
+        configs_path = get_configs_path(_gcp_config, entity_name)
 
     return {
         "spark": {
@@ -61,84 +211,256 @@ def __get_task_api_body(_gcp_config: dict, entity_name: str):
         "execution_spec": {
             "service_account": service_acc,
             "args": {
-                "TASK_ARGS": f"clouddq-executable.zip, \
-               ALL, \
-               {configs_path}, \
-              --gcp_project_id=\"{gcp_project_id}\", \
-              --gcp_region_id=\"{gcp_bq_region}\", \
-              --gcp_bq_dataset_id=\"{gcp_bq_dataset_id}\", \
-              --target_bigquery_summary_table=\"{full_target_table_name}\""
+                "TASK_ARGS": __get_task_args(_gcp_config, entity_name, configs_path, target_table)
             }
         },
         "trigger_spec": {
-            "type_": "ON_DEMAND"
+            "type": "ON_DEMAND"
         },
         "description": "CloudDQ Airflow Task"
     }
 
 
+def get_task_fingerprint(task_body: dict, configs_md5_hash: str) -> str:
+    """
+    This method will return the fingerprint of the dataplex task body and the compiled DQ config content.
+    Args:
+    Returns: str
+    """
+    fingerprint = hashlib.sha256(json.dumps(task_body, sort_keys=True).encode('utf-8'))
+    fingerprint.update((configs_md5_hash or '').encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
+def __get_configs_md5_hash(_gcp_config: dict, configs_path: str) -> str:
+    # Object metadata only, the compiled config isn't downloaded
+    bucket = storage.Client().bucket(_gcp_config['dataplex']['yaml_bucket_name'])
+    blob = bucket.get_blob(configs_path.split('/', 3)[3])
+    return blob.md5_hash if blob is not None else None
+
+
+def ensure_dataplex_task_and_submit(entity_name: str, _gcp_config: dict, task_id: str, **context) -> None:
+    """
+    This method will submit the DQ job for the rendered config of the run. The dataplex task is only created
+    or updated when the fingerprint of its body and the compiled config differs from the cached one, so in the
+    common case the job is submitted with a single API call. Tasks deleted outside of Airflow are created again.
+    The job writes its summary results to the table of the run merged by merge_dq_results.
+    Args:
+    Returns: list with the dict of the dataplex task_id and target_table of the job
+    """
+    project_id = _gcp_config['dataplex']['project']
+    region = _gcp_config['dataplex']['region']
+    lake_id = _gcp_config['dataplex']['lake_id']
+    run_configs_path = context['ti'].xcom_pull(task_ids='render_dq_config')
+    target_table = get_summary_table(_gcp_config, __get_run_hash(context['run_id']))
+    run_args = {"TASK_ARGS": __get_task_args(_gcp_config, entity_name, run_configs_path, target_table)}
+    run_jobs = [{'task_id': task_id, 'target_table': target_table}]
+
+    configs_path = get_configs_path(_gcp_config, entity_name)
+    task_body = __get_task_api_body(_gcp_config, entity_name, configs_path)
+    fingerprint = get_task_fingerprint(task_body, __get_configs_md5_hash(_gcp_config, configs_path))
+    fingerprint_key = f"{task_id}-fingerprint"
+
+    if Variable.get(fingerprint_key, default_var=None) == fingerprint:
+        log.info(f"Dataplex task {task_id} is up to date, submitting the job")
+        if submit_dataplex_task(project_id, region, lake_id, task_id, args=run_args) != "task_not_exist":
+            return run_jobs
+        # Deleted outside of Airflow, the cached fingerprint would fail every retry the same way
+        log.warning(f"Dataplex task {task_id} was deleted, recreating it")
+        Variable.delete(fingerprint_key)
+
+    task_state = get_dataplex_task(project_id, region, lake_id, task_id)
+    if task_state == "task_exist":
+        log.info(f"Dataplex task {task_id} fingerprint changed, updating it")
+        # The trigger spec of the existing task is left as is
+        update_dataplex_task(project_id, region, lake_id, task_id,
+                             {key: value for key, value in task_body.items() if key != "trigger_spec"})
+        task_state = submit_dataplex_task(project_id, region, lake_id, task_id, args=run_args)
+    if task_state == "task_not_exist":
+        # ON_DEMAND tasks run right after the creation, so the run config is set at the task body
+        log.info(f"Dataplex task {task_id} not found, creating it")
+        Variable.delete(fingerprint_key)
+        create_dataplex_task(project_id, region, lake_id, task_id,
+                             __get_task_api_body(_gcp_config, entity_name, run_configs_path, target_table))
+    elif task_state != "job_submitted":
+        log.error(f"Error in fetching dataplex task {task_id} details")
+        raise Exception()
+    Variable.set(fingerprint_key, fingerprint)
+    return run_jobs
+
+
+def wait_dataplex_job(entity_name: str, _gcp_config: dict, task_id: str, policy: dict = None, **context) -> str:
+    """
+    This method will wait for the Dataplex task job, polling by the DQ check duration predicted from the
+    migration run metrics.
+    Args:
+    Returns: str job state
+    """
+    expected_duration_s = polling.predict_stage_duration(get_run_metrics_table_id(_gcp_config),
+                                                         f'redshift-to-bq-{entity_name}-migration',
+                                                         'trigger_data_quality_dag', policy=policy)
+    return get_dataplex_job_state(_gcp_config['dataplex']['project'], _gcp_config['dataplex']['region'],
+                                  _gcp_config['dataplex']['lake_id'], task_id, expected_duration_s, policy)
+
+
+def __get_run_hash(run_id: str) -> str:
+    return hashlib.sha1(run_id.encode('utf-8')).hexdigest()[:8]
+
+
+def get_shard_run_id(entity_name: str, run_id: str, shard: int) -> str:
+    # Dataplex task ids are lowercase letters, digits and hyphens
+    return f"{entity_name}-dq-{__get_run_hash(run_id)}-s{shard:02d}".replace('_', '-').lower()
+
+
+def submit_dataplex_dq_shards(entity_name: str, _gcp_config: dict, **context) -> list:
+    """
+    This method will create a Dataplex task per rendered config shard, which runs its job right away, so the
+    shards are checked concurrently. The tasks are per DAG run, each writes its summary results to its own
+    table merged by merge_dq_shard_results. Tasks created by a previous try of the run aren't created again.
+    Args:
+    Returns: list of dicts with the dataplex task_id and target_table of every shard
+    """
+    project_id = _gcp_config['dataplex']['project']
+    region = _gcp_config['dataplex']['region']
+    lake_id = _gcp_config['dataplex']['lake_id']
+    shard_jobs = []
+    for shard, configs_path in enumerate(context['ti'].xcom_pull(task_ids=RENDER_SHARDS_TASK_ID)):
+        task_id = get_shard_run_id(entity_name, context['run_id'], shard)
+        target_table = get_summary_table(_gcp_config, task_id[len(entity_name) + len("-dq-"):])
+        task_state = get_dataplex_task(project_id, region, lake_id, task_id)
+        if task_state == "task_not_exist":
+            create_dataplex_task(project_id, region, lake_id, task_id,
+                                 __get_task_api_body(_gcp_config, entity_name, configs_path, target_table))
+            log.info(f"Dataplex task {task_id} of {configs_path} is created")
+        elif task_state == "task_exist":
+            log.info(f"Dataplex task {task_id} is created by a previous try")
+        else:
+            log.error(f"Error in fetching dataplex task {task_id} details")
+            raise Exception()
+        shard_jobs.append({'task_id': task_id, 'target_table': target_table})
+    return shard_jobs
+
+
+def wait_dataplex_dq_shards(entity_name: str, _gcp_config: dict, policy: dict = None, **context) -> str:
+    """
+    This method will wait for the jobs of all the shard tasks and delete the tasks once they are finished.
+    Args:
+    Returns: str SUCCEEDED if all the shard jobs succeeded, otherwise FAILED
+    """
+    project_id = _gcp_config['dataplex']['project']
+    region = _gcp_config['dataplex']['region']
+    lake_id = _gcp_config['dataplex']['lake_id']
+    task_ids = [job['task_id'] for job in context['ti'].xcom_pull(task_ids=SUBMIT_SHARDS_TASK_ID)]
+    expected_duration_s = polling.predict_stage_duration(get_run_metrics_table_id(_gcp_config),
+                                                         f'redshift-to-bq-{entity_name}-migration',
+                                                         'trigger_data_quality_dag', policy=policy)
+    states = get_dataplex_jobs_states(project_id, region, lake_id, task_ids, expected_duration_s, policy)
+    for task_id, task_status in states.items():
+        log.info(f"Dataplex task {task_id} job is {task_status}")
+        delete_dataplex_task(project_id, region, lake_id, task_id)
+    return "SUCCEEDED" if all(task_status == "SUCCEEDED" for task_status in states.values()) else "FAILED"
+
+
+def merge_dq_results(entity_name: str, _gcp_config: dict, submit_task_id: str, **context) -> list:
+    """
+    This method will append the summary results of the jobs of the run to the summary table and drop their run
+    tables. Rows of the invocations already in the summary table aren't appended again, so a retry doesn't
+    duplicate them.
+    Args: submit_task_id task returning the dataplex task_id and target_table of the jobs
+    Returns: list of the invocation ids of the run, the migration DAG gates on their results only
+    """
+    client = bigquery.Client()
+    summary_table = get_summary_table(_gcp_config)
+    invocation_ids = []
+    for job in context['ti'].xcom_pull(task_ids=submit_task_id):
+        try:
+            client.get_table(job['target_table'])
+        except exceptions.NotFound:
+            log.warning(f"Dataplex task {job['task_id']} has no summary results {job['target_table']}")
+            continue
+        invocation_ids += [row['invocation_id'] for row in client.query(
+            f"SELECT DISTINCT invocation_id FROM `{job['target_table']}`").result()]
+        client.query(f"""CREATE TABLE IF NOT EXISTS `{summary_table}` LIKE `{job['target_table']}`;
+                         INSERT INTO `{summary_table}`
+                         SELECT * FROM `{job['target_table']}`
+                         WHERE invocation_id NOT IN (SELECT DISTINCT invocation_id FROM `{summary_table}`);
+                         DROP TABLE `{job['target_table']}`;""").result()
+        log.info(f"Summary results of {job['task_id']} are merged to {summary_table}")
+    return invocation_ids
+
+
 # Dag is returned by a factory method
-def dq_tasks(dag: DAG, entity_name: str, gcp_config: dict):
-    dataplex_task_id = f"{entity_name}-dq-check"  # The unique identifier for the task
-    # The Google Cloud Project, region and lake where the Dataplex task will be created
-    dataplex_project_id = gcp_config['dataplex']['project']
-    dataplex_region = gcp_config['dataplex']['region']
-    dataplex_lake_id = gcp_config['dataplex']['lake_id']
-
-    # this will check for the existing dataplex task
-    get_dataplex_dq_task = BranchPythonOperator(
-        task_id="get_dataplex_dq_task",
-        python_callable=lambda: get_dataplex_task(dataplex_project_id, dataplex_region, dataplex_lake_id,
-                                                  dataplex_task_id),
-        provide_context=True,
-        dag=dag,
-    )
+def dq_tasks(dag: DAG, entity_name: str, gcp_config: dict, polling_policy: dict = None):
+    shards = get_shards(gcp_config)
+    if shards > 1:
+        # this will render the DQ config shards compiled with tests/compile.py --shards
+        render_config = PythonOperator(
+            task_id=RENDER_SHARDS_TASK_ID,
+            python_callable=render_dq_shard_configs,
+            op_kwargs={'entity_name': entity_name, '_gcp_config': gcp_config, 'shards': shards},
+            dag=dag,
+        )
 
-    dataplex_task_exists = BashOperator(
-        task_id="task_exist",
-        bash_command="echo 'Task Already Exists'",
-        dag=dag,
-    )
-    dataplex_task_not_exists = BashOperator(
-        task_id="task_not_exist",
-        bash_command="echo 'Task not Present'",
-        dag=dag,
-    )
-    dataplex_task_error = BashOperator(
-        task_id="task_error",
-        bash_command="echo 'Error in fetching dataplex task details'",
-        dag=dag,
-    )
+        # this will submit the shards as concurrent dataplex jobs of per run tasks
+        submit_dataplex_dq_job = PythonOperator(
+            task_id=SUBMIT_SHARDS_TASK_ID,
+            python_callable=submit_dataplex_dq_shards,
+            op_kwargs={'entity_name': entity_name, '_gcp_config': gcp_config},
+            dag=dag,
+        )
 
-    # this will check for the existing dataplex task
-    create_dataplex_task_job = PythonOperator(
-        task_id="create_dataplex_task_job",
-        python_callable=lambda: submit_dataplex_task(dataplex_project_id, dataplex_region, dataplex_lake_id,
-                                                     dataplex_task_id),
-        provide_context=True
-    )
+        wait_dataplex_dq_jobs = PythonOperator(
+            task_id=WAIT_SHARDS_TASK_ID,
+            python_callable=wait_dataplex_dq_shards,
+            op_kwargs={'entity_name': entity_name, '_gcp_config': gcp_config, 'policy': polling_policy},
+            dag=dag,
+        )
+    else:
+        dataplex_task_id = f"{entity_name}-dq-check"  # The unique identifier for the task
+
+        # this will render the DQ config scoped to the export batch of the triggering migration DAG run
+        render_config = PythonOperator(
+            task_id="render_dq_config",
+            python_callable=render_dq_config,
+            op_kwargs={'entity_name': entity_name, '_gcp_config': gcp_config},
+            dag=dag,
+        )
 
-    # this will create a new dataplex task with a given task id
-    create_dataplex_task = DataplexCreateTaskOperator(
-        project_id=dataplex_project_id,
-        region=dataplex_region,
-        lake_id=dataplex_lake_id,
-        body=__get_task_api_body(gcp_config, entity_name),
-        dataplex_task_id=dataplex_task_id,
-        task_id="create_dataplex_task",
-        trigger_rule="none_failed_min_one_success",
+        # this will create or update the dataplex task only if its fingerprint changed and submit the job
+        submit_dataplex_dq_job = PythonOperator(
+            task_id=SUBMIT_JOB_TASK_ID,
+            python_callable=ensure_dataplex_task_and_submit,
+            op_kwargs={'entity_name': entity_name, '_gcp_config': gcp_config, 'task_id': dataplex_task_id},
+            dag=dag,
+        )
+
+        # this will get the status of dataplex task job
+        wait_dataplex_dq_jobs = PythonOperator(
+            task_id=WAIT_JOB_TASK_ID,
+            python_callable=wait_dataplex_job,
+            op_kwargs={'entity_name': entity_name, '_gcp_config': gcp_config, 'task_id': dataplex_task_id,
+                       'policy': polling_policy},
+            dag=dag,
+        )
+
+    # this will merge the summary results of the run jobs and return their invocation ids
+    merge_results = PythonOperator(
+        task_id=MERGE_RESULTS_TASK_ID,
+        python_callable=merge_dq_results,
+        op_kwargs={'entity_name': entity_name, '_gcp_config': gcp_config,
+                   'submit_task_id': submit_dataplex_dq_job.task_id},
+        dag=dag,
     )
 
-    # this will get the status of dataplex task job
+    # this will branch by the state of the jobs
     dataplex_task_state = BranchPythonOperator(
         task_id="dataplex_task_state",
-        python_callable=lambda: get_dataplex_job_state(dataplex_project_id, dataplex_region, dataplex_lake_id,
-                                                       dataplex_task_id),
-        trigger_rule=TriggerRule.NONE_FAILED_MIN_ONE_SUCCESS,
-        provide_context=True,
-
+        python_callable=lambda ti: ti.xcom_pull(task_ids=wait_dataplex_dq_jobs.task_id),
+        dag=dag,
     )
 
+    render_config >> submit_dataplex_dq_job >> wait_dataplex_dq_jobs >> merge_results >> dataplex_task_state
+
     dataplex_task_success = BashOperator(
         task_id="SUCCEEDED",
         bash_command="echo 'Job Completed Successfully'",
@@ -150,27 +472,33 @@ def dq_tasks(dag: DAG, entity_name: str, gcp_config: dict):
         dag=dag,
     )
 
-    get_dataplex_dq_task >> [dataplex_task_exists, dataplex_task_not_exists, dataplex_task_error]
-
-    dataplex_task_exists >> create_dataplex_task_job >> dataplex_task_state
-    dataplex_task_not_exists >> create_dataplex_task >> dataplex_task_state
+    # this will record the full sweep of the run once its DQ job succeeded
+    record_full_sweep_task = PythonOperator(
+        task_id=RECORD_FULL_SWEEP_TASK_ID,
+        python_callable=record_full_sweep,
+        op_kwargs={'entity_name': entity_name, 'render_task_id': render_config.task_id},
+        dag=dag,
+    )
 
     dataplex_task_state >> [dataplex_task_success, dataplex_task_failed]
+    dataplex_task_success >> record_full_sweep_task
 
 
-def create_dag(entity_name: str, gcp_config: dict, start_date: datetime.date = None, dag_name: str = None) -> DAG:
+def create_dag(entity_name: str, gcp_config: dict, start_date: datetime.date = None, dag_name: str = None,
+               polling_policy: dict = None) -> DAG:
     if dag_name is None:
         dag_name = f"{entity_name}-dq-check"
     dag = DAG(
         dag_id=dag_name,
         start_date=start_date,
         default_args={'retries': 1, 'retry_delay': timedelta(minutes=5), 'email': 'odash@softserveinc.com'},
+        params={profiling.PROFILE_LOCATION_PARAM: f"gs://{gcp_config['bucket']}/{gcp_config['path']}"},
         description=f'{entity_name} data quality checks DAG',
         schedule=None,
         catchup=False,
         tags=['dataplex-tests', 'beta-8.1', entity_name],
     )
 
-    dq_tasks(dag, entity_name, gcp_config)
+    dq_tasks(dag, entity_name, gcp_config, polling_policy)
 
     return dag
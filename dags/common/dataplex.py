@@ -1,12 +1,20 @@
+from __future__ import annotations
+
 import json
 import logging
 import time
 
-import google.auth
-import requests
+from common import polling
+from common.lazy_imports import lazy_import
+from common.metrics import record_stage_metrics
+from common.profiling import profiled
 
 DATAPLEX_ENDPOINT = 'https://dataplex.googleapis.com'
 
+requests = lazy_import('requests')
+google_auth = lazy_import('google.auth')
+google_auth_requests = lazy_import('google.auth.transport.requests')
+
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger()
 
@@ -18,10 +26,10 @@ def __get_session_headers() -> dict:
     Returns: dict
     """
     # getting the credentials and project details for gcp project
-    credentials, your_project_id = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+    credentials, your_project_id = google_auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
 
     # getting request object
-    auth_req = google.auth.transport.requests.Request()
+    auth_req = google_auth_requests.Request()
 
     credentials.refresh(auth_req)  # refresh token
     auth_token = credentials.token
@@ -64,35 +72,69 @@ def get_clouddq_task_status(project_id: str, region: str, lake_id: str, task_id:
     return __handle_dataplex_job_state(res)
 
 
-def submit_dataplex_task(project_id: str, region: str, lake_id: str, task_id: str) -> None:
+def submit_dataplex_task(project_id: str, region: str, lake_id: str, task_id: str, args: dict = None) -> str:
     """
     This method will submit the job for the task.
-    Args:
-    Returns: str
+    Args: args overrides the task execution spec args (e.g. TASK_ARGS) for this job only
+    Returns: str job_submitted or task_not_exist if the task was deleted
     """
     res = requests.post(
         f"{DATAPLEX_ENDPOINT}/v1/projects/{project_id}/locations/{region}/lakes/{lake_id}/tasks/{task_id}:run",
-        headers=__get_session_headers())
+        headers=__get_session_headers(),
+        json={"args": args} if args else None)
     log.info(f"Dataplex submit job response: HTTP {res.status_code} {res.text}")
+    if res.status_code == 404:
+        return "task_not_exist"
     if res.status_code != 200:
         log.error(f"Dataplex job submission failed")
         raise Exception()
+    return "job_submitted"
+
 
+def __is_job_finished(task_status: str) -> bool:
+    return task_status in ('SUCCEEDED', 'FAILED', 'CANCELLED', 'ABORTED')
 
-def get_dataplex_job_state(project_id: str, region: str, lake_id: str, task_id: str) -> str:
+
+@profiled
+def get_dataplex_jobs_states(project_id: str, region: str, lake_id: str, task_ids: list,
+                             expected_duration_s: float = None, policy: dict = None) -> dict:
+    """
+    This method will try to get the status of the jobs of the tasks till all of them are in a final state, e.g.
+    the jobs of the DQ config shards running concurrently. Polls back off from a fraction of the expected
+    duration, the wait fails after the policy deadline.
+    Args: expected_duration_s defaults to the policy default_duration_s
+    Returns: dict of the task id to its job state
+    """
+    policy = policy or polling.DEFAULT_POLLING_POLICY
+    expected_duration_s = expected_duration_s or policy['default_duration_s']
+    deadline = polling.get_deadline(expected_duration_s, policy)
+    started = time.monotonic()
+    polls = 1
+    states = {task_id: get_clouddq_task_status(project_id, region, lake_id, task_id) for task_id in task_ids}
+    while not all(__is_job_finished(task_status) for task_status in states.values()):
+        if time.monotonic() - started > deadline:
+            pending = [task_id for task_id, task_status in states.items() if not __is_job_finished(task_status)]
+            raise TimeoutError(f"Dataplex tasks {pending} jobs aren't finished in {deadline:.0f} s")
+        log.info(time.ctime())
+        time.sleep(polling.get_poll_interval(polls, expected_duration_s, policy))
+        for task_id, task_status in states.items():
+            # Finished jobs aren't polled again
+            if not __is_job_finished(task_status):
+                states[task_id] = get_clouddq_task_status(project_id, region, lake_id, task_id)
+                log.info(f"CloudDQ task {task_id} status is {states[task_id]}")
+        polls += 1
+    record_stage_metrics(polls=polls, wait_duration_s=time.monotonic() - started, jobs=len(states))
+    return states
+
+
+def get_dataplex_job_state(project_id: str, region: str, lake_id: str, task_id: str, expected_duration_s: float = None,
+                           policy: dict = None) -> str:
     """
     This method will try to get the status of the job till it is in either 'SUCCEEDED' or 'FAILED' state.
-    Args:
+    Args: expected_duration_s defaults to the policy default_duration_s
     Returns: str
     """
-    task_status = get_clouddq_task_status(project_id, region, lake_id, task_id)
-    while (task_status != 'SUCCEEDED' and task_status != 'FAILED' and task_status != 'CANCELLED'
-           and task_status != 'ABORTED'):
-        log.info(time.ctime())
-        time.sleep(30)
-        task_status = get_clouddq_task_status(project_id, region, lake_id, task_id)
-        log.info(f"CloudDQ task status is {task_status}")
-    return task_status
+    return get_dataplex_jobs_states(project_id, region, lake_id, [task_id], expected_duration_s, policy)[task_id]
 
 
 def get_dataplex_task(project_id: str, region: str, lake_id: str, task_id: str) -> str:
@@ -111,3 +153,52 @@ def get_dataplex_task(project_id: str, region: str, lake_id: str, task_id: str)
         return "task_exist"
     else:
         return "task_error"
+
+
+def create_dataplex_task(project_id: str, region: str, lake_id: str, task_id: str, body: dict) -> None:
+    """
+    This method will create the task. ON_DEMAND tasks are run once right after the creation.
+    Args:
+    Returns: None
+    """
+    res = requests.post(
+        f"{DATAPLEX_ENDPOINT}/v1/projects/{project_id}/locations/{region}/lakes/{lake_id}/tasks",
+        params={"taskId": task_id},
+        headers=__get_session_headers(),
+        json=body)
+    log.info(f"Dataplex create task response: HTTP {res.status_code} {res.text}")
+    if res.status_code != 200:
+        log.error(f"Dataplex task creation failed")
+        raise Exception()
+
+
+def update_dataplex_task(project_id: str, region: str, lake_id: str, task_id: str, body: dict) -> None:
+    """
+    This method will update the task spec with the given body.
+    Args:
+    Returns: None
+    """
+    res = requests.patch(
+        f"{DATAPLEX_ENDPOINT}/v1/projects/{project_id}/locations/{region}/lakes/{lake_id}/tasks/{task_id}",
+        params={"updateMask": ",".join(body.keys())},
+        headers=__get_session_headers(),
+        json=body)
+    log.info(f"Dataplex update task response: HTTP {res.status_code} {res.text}")
+    if res.status_code != 200:
+        log.error(f"Dataplex task update failed")
+        raise Exception()
+
+
+def delete_dataplex_task(project_id: str, region: str, lake_id: str, task_id: str) -> None:
+    """
+    This method will delete the task, e.g. the per run tasks of the DQ config shards once their jobs finished.
+    Args:
+    Returns: None
+    """
+    res = requests.delete(
+        f"{DATAPLEX_ENDPOINT}/v1/projects/{project_id}/locations/{region}/lakes/{lake_id}/tasks/{task_id}",
+        headers=__get_session_headers())
+    log.info(f"Dataplex delete task response: HTTP {res.status_code} {res.text}")
+    if res.status_code not in (200, 404):
+        log.error(f"Dataplex task deletion failed")
+        raise Exception()
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+
+from common import polling
+from common import redshift
+from common.lazy_imports import lazy_import
+from common.metrics import record_stage_metrics
+
+bigquery = lazy_import('google.cloud.bigquery')
+bigquery_storage_v1 = lazy_import('google.cloud.bigquery_storage_v1')
+types = lazy_import('google.cloud.bigquery_storage_v1.types')
+writer = lazy_import('google.cloud.bigquery_storage_v1.writer')
+descriptor_pb2 = lazy_import('google.protobuf.descriptor_pb2')
+descriptor_pool = lazy_import('google.protobuf.descriptor_pool')
+message_factory = lazy_import('google.protobuf.message_factory')
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+S3_PATH = "s3"
+DIRECT_PATH = "direct"
+CHOOSE_TRANSFER_PATH_TASK_ID = "choose_transfer_path"
+DIRECT_TRANSFER_TASK_ID = "direct_transfer_to_bq"
+# AppendRows requests are limited to 10 MB
+MAX_REQUEST_BYTES = 9 * 1024 * 1024
+MAX_REQUESTS_IN_FLIGHT = 8
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Timestamp or timestamptz, e.g. 2023-01-01 10:00:00.123 or 2023-01-01 10:00:00+00
+REDSHIFT_TS_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})(?:\.(\d{1,6}))?"
+                                 r"(?:([+-]\d{2})(?::?(\d{2}))?)?$")
+UNLOAD_SELECT_PATTERN = re.compile(r"^\s*unload\s*\(\s*'(.*)'\s*\)\s*to\s+'", re.IGNORECASE | re.DOTALL)
+
+
+def get_unload_select_sql(unload_sql: str) -> str:
+    """
+    This method will extract the SELECT of the unload SQL generated by generate_sql.py, so the direct transfer
+    reads exactly the same columns, export_datetime and checksum as the unloaded files have.
+    Args:
+    Returns: str
+    """
+    match = UNLOAD_SELECT_PATTERN.match(unload_sql)
+    if not match:
+        raise ValueError("Unload SQL has no unload ('<select>') to '<path>' statement")
+    return match.group(1).replace("''", "'")
+
+
+def choose_transfer_path(max_rows: int, probe_task_id: str = None, **context) -> str:
+    """
+    This method will choose the direct transfer for the batches of at most max_rows new records
+    and the S3 UNLOAD and transfer services for the bigger ones.
+    Args: probe_task_id of the change probe, its estimate is used if the count was skipped
+    Returns: str s3 or direct
+    """
+    new_records = polling.get_batch_rows(context['ti'], polling.BATCH_ROWS_TASK_ID)
+    if new_records is None and probe_task_id:
+        new_records = polling.get_batch_rows(context['ti'], probe_task_id)
+    # A batch of unknown size may be of any size, the S3 path loads it in any case
+    path = DIRECT_PATH if new_records is not None and new_records <= max_rows else S3_PATH
+    log.info(f"{new_records} new records, transfer path: {path}")
+    return path
+
+
+def __get_proto_descriptor(schema: list) -> descriptor_pb2.DescriptorProto:
+    # Built here, reading the protobuf types at the DAG import would load the lazy module
+    field_types = descriptor_pb2.FieldDescriptorProto
+    proto_types = {
+        'INTEGER': field_types.TYPE_INT64,
+        'INT64': field_types.TYPE_INT64,
+        'FLOAT': field_types.TYPE_DOUBLE,
+        'FLOAT64': field_types.TYPE_DOUBLE,
+        'BOOLEAN': field_types.TYPE_BOOL,
+        'BOOL': field_types.TYPE_BOOL,
+        # Epoch microseconds
+        'TIMESTAMP': field_types.TYPE_INT64,
+    }
+    proto = descriptor_pb2.DescriptorProto(name="ExportRow")
+    for number, field in enumerate(schema, start=1):
+        if field.mode == 'REPEATED' or field.field_type in ('RECORD', 'STRUCT'):
+            raise ValueError(f"Column {field.name} of {field.field_type} {field.mode} type isn't supported")
+        # Other types, e.g. NUMERIC, DATE, DATETIME, are written as strings
+        proto.field.add(name=field.name, number=number,
+                        type=proto_types.get(field.field_type, field_types.TYPE_STRING),
+                        label=field_types.LABEL_OPTIONAL)
+    return proto
+
+
+def __get_message_class(proto: descriptor_pb2.DescriptorProto):
+    file_proto = descriptor_pb2.FileDescriptorProto(name="export_row.proto", syntax="proto2")
+    file_proto.message_type.add().CopyFrom(proto)
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    return message_factory.GetMessageClass(pool.FindMessageTypeByName(proto.name))
+
+
+def to_epoch_micros(value: str) -> int:
+    """
+    This method will convert the Redshift timestamp or timestamptz string to epoch microseconds, UTC if no offset.
+    Args:
+    Returns: int
+    """
+    match = REDSHIFT_TS_PATTERN.match(value)
+    if not match:
+        raise ValueError(f"Unexpected timestamp format {value}")
+    date, time, fraction, offset_hours, offset_minutes = match.groups()
+    timestamp = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    if offset_hours:
+        sign = -1 if offset_hours[0] == '-' else 1
+        timestamp -= timedelta(hours=int(offset_hours), minutes=sign * int(offset_minutes or 0))
+    delta = timestamp - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 6 + int((fraction or '0').ljust(6, '0'))
+
+
+def __to_proto_value(value, field_type: str):
+    if field_type == 'TIMESTAMP':
+        return to_epoch_micros(value)
+    if field_type in ('INTEGER', 'INT64'):
+        return int(value)
+    if field_type in ('FLOAT', 'FLOAT64'):
+        return float(value)
+    if field_type in ('BOOLEAN', 'BOOL'):
+        return bool(value)
+    return str(value)
+
+
+def __iter_serialized_chunks(pages, message_class, field_types: dict):
+    # Serialized rows grouped into chunks fitting a single AppendRows request
+    chunk, chunk_bytes, columns = [], 0, None
+    for page in pages:
+        columns = columns or [column['name'] for column in page['ColumnMetadata']]
+        for record in page['Records']:
+            message = message_class()
+            for column, field in zip(columns, record):
+                if field.get('isNull'):
+                    continue
+                setattr(message, column, __to_proto_value(next(iter(field.values())), field_types[column]))
+            row = message.SerializeToString()
+            if chunk and chunk_bytes + len(row) > MAX_REQUEST_BYTES:
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk.append(row)
+            chunk_bytes += len(row)
+    if chunk:
+        yield chunk
+
+
+def transfer_redshift_to_bq(select_sql: str, table_id: str, database: str, cluster_identifier: str, db_user: str,
+                            aws_conn_id: str = 'aws_default') -> int:
+    """
+    This method will page the SELECT result from the Redshift Data API and write it to the BQ table with the
+    Storage Write API. Rows are written to a pending stream and committed at once after all of them are
+    appended, so a failed or retried transfer never leaves a partial batch behind.
+    Args: table_id in project.dataset.table format
+    Returns: int number of the transferred rows
+    """
+    schema = bigquery.Client().get_table(table_id).schema
+    field_types = {field.name: field.field_type for field in schema}
+    proto_descriptor = __get_proto_descriptor(schema)
+    message_class = __get_message_class(proto_descriptor)
+
+    client = redshift.get_client(aws_conn_id)
+    statement_id = redshift.submit_statements(client, [select_sql], database, cluster_identifier, db_user)
+    redshift.wait_for_statement(client, statement_id)
+    log.info(f"Redshift statement {statement_id} finished")
+
+    project_id, dataset_id, table_name = table_id.split('.')
+    table_path = bigquery_storage_v1.BigQueryWriteClient.table_path(project_id, dataset_id, table_name)
+    write_client = bigquery_storage_v1.BigQueryWriteClient()
+    write_stream = write_client.create_write_stream(
+        parent=table_path, write_stream=types.WriteStream(type_=types.WriteStream.Type.PENDING))
+    request_template = types.AppendRowsRequest(
+        write_stream=write_stream.name,
+        proto_rows=types.AppendRowsRequest.ProtoData(
+            writer_schema=types.ProtoSchema(proto_descriptor=proto_descriptor)))
+    append_rows_stream = writer.AppendRowsStream(write_client, request_template)
+
+    rows, bytes_written, futures = 0, 0, []
+    try:
+        for chunk in __iter_serialized_chunks(redshift.iter_result_pages(client, statement_id), message_class, field_types):
+            request = types.AppendRowsRequest(offset=rows, proto_rows=types.AppendRowsRequest.ProtoData(
+                rows=types.ProtoRows(serialized_rows=chunk)))
+            futures.append(append_rows_stream.send(request))
+            rows += len(chunk)
+            bytes_written += sum(len(row) for row in chunk)
+            if len(futures) >= MAX_REQUESTS_IN_FLIGHT:
+                futures.pop(0).result()
+        for future in futures:
+            future.result()
+    finally:
+        append_rows_stream.close()
+
+    write_client.finalize_write_stream(name=write_stream.name)
+    commit_response = write_client.batch_commit_write_streams(
+        types.BatchCommitWriteStreamsRequest(parent=table_path, write_streams=[write_stream.name]))
+    if commit_response.stream_errors:
+        raise RuntimeError(f"Write stream {write_stream.name} commit failed: {commit_response.stream_errors}")
+    log.info(f"{rows} rows are written to {table_id}")
+    record_stage_metrics(rows=rows, bytes=bytes_written)
+    return rows
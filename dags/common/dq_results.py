@@ -0,0 +1,126 @@
+import logging
+from datetime import datetime, timezone
+
+from airflow.exceptions import AirflowFailException
+from airflow.models import DagRun
+
+from common import bq_data_operations
+from common.data_quality import MERGE_RESULTS_TASK_ID
+from common.metrics import record_stage_metrics
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+GATE_DQ_RESULTS_TASK_ID = "gate_dq_results"
+TRIGGER_DQ_TASK_ID = "trigger_data_quality_dag"
+# Thresholds key of the dimensions without their own threshold
+DEFAULT_DIMENSION = "DEFAULT"
+# Rules without a dimension are summarized under it
+NO_DIMENSION = "NONE"
+
+
+def get_thresholds(dq_thresholds: dict) -> dict:
+    """
+    This method will return the minimum success ratio per upper case dimension, every dimension has to pass
+    all its rules unless the DEFAULT threshold is set.
+    Args: dq_thresholds dict of the dimension to its minimum success ratio, 0 to 1
+    Returns: dict
+    """
+    thresholds = {DEFAULT_DIMENSION: 1.0}
+    thresholds.update({dimension.upper(): float(ratio) for dimension, ratio in (dq_thresholds or {}).items()})
+    for dimension, ratio in thresholds.items():
+        if not 0 <= ratio <= 1:
+            raise ValueError(f"Threshold {ratio} of the {dimension} dimension isn't a ratio between 0 and 1")
+    return thresholds
+
+
+def get_run_summary_sql(summary_table: str, invocation_ids: list, started: datetime, finished: datetime) -> str:
+    """
+    This method will return the query summarizing the DQ results per dimension of the invocations of the DQ DAG
+    run, so the results of concurrent or later runs aren't counted. Only the execution_ts partitions between the
+    run start and end are scanned, not the whole results table.
+    Args: invocation_ids of the DQ jobs of the run
+    Returns: str
+    """
+    invocations = ", ".join(f"'{invocation_id}'" for invocation_id in invocation_ids)
+    return f"""SELECT UPPER(COALESCE(dimension, '{NO_DIMENSION}')) AS dimension,
+                      COUNT(DISTINCT invocation_id) AS invocations,
+                      COUNT(*) AS rules,
+                      SUM(COALESCE(rows_validated, 0)) AS rows_validated,
+                      SUM(COALESCE(failed_count, 0)) AS failed_rows,
+                      COUNTIF(complex_rule_validation_errors_count > 0
+                              OR complex_rule_validation_success_flag = FALSE) AS failed_complex_rules,
+                      COUNTIF(complex_rule_validation_errors_count IS NOT NULL
+                              OR complex_rule_validation_success_flag IS NOT NULL) AS complex_rules
+               FROM `{summary_table}`
+               WHERE execution_ts BETWEEN TIMESTAMP('{started.isoformat()}') AND TIMESTAMP('{finished.isoformat()}')
+                 AND invocation_id IN ({invocations})
+               GROUP BY dimension"""
+
+
+def get_success_ratio(summary: dict) -> float:
+    """
+    This method will return the share of the passed checks of the dimension: validated rows which didn't fail
+    the row level rules and the complex rules which had no errors.
+    Args: summary row of get_run_summary_sql
+    Returns: float 0 to 1, 1 if nothing was validated
+    """
+    checks = summary['rows_validated'] + summary['complex_rules']
+    failed = summary['failed_rows'] + summary['failed_complex_rules']
+    return 1 - failed / checks if checks else 1.0
+
+
+def evaluate_dimensions(summaries: list, thresholds: dict) -> dict:
+    """
+    This method will compare the success ratio of every dimension with its threshold.
+    Args: summaries rows of get_run_summary_sql, thresholds of get_thresholds
+    Returns: dict of the dimension to dict with success_ratio, threshold and passed
+    """
+    results = {}
+    for summary in summaries:
+        threshold = thresholds.get(summary['dimension'], thresholds[DEFAULT_DIMENSION])
+        success_ratio = get_success_ratio(summary)
+        results[summary['dimension']] = {'success_ratio': success_ratio, 'threshold': threshold,
+                                         'passed': success_ratio >= threshold}
+    return results
+
+
+def __get_dq_run(dq_dag_id: str, trigger_task_id: str, ti) -> tuple:
+    run_id = ti.xcom_pull(task_ids=trigger_task_id, key='trigger_run_id')
+    dag_runs = DagRun.find(dag_id=dq_dag_id, run_id=run_id) if run_id else []
+    if not dag_runs or dag_runs[0].start_date is None:
+        raise AirflowFailException(f"DQ DAG {dq_dag_id} run {run_id} of {trigger_task_id} isn't found")
+    merge_ti = dag_runs[0].get_task_instance(MERGE_RESULTS_TASK_ID)
+    invocation_ids = merge_ti.xcom_pull(task_ids=MERGE_RESULTS_TASK_ID) if merge_ti else None
+    if not invocation_ids:
+        raise AirflowFailException(f"DQ DAG {dq_dag_id} run {run_id} has no DQ jobs invocations")
+    # The end only bounds the scanned partitions, the rows are selected by the invocations of the run
+    return invocation_ids, dag_runs[0].start_date, dag_runs[0].end_date or datetime.now(timezone.utc)
+
+
+def gate_dq_results(summary_table: str, dq_dag_id: str, dq_thresholds: dict = None,
+                    trigger_task_id: str = TRIGGER_DQ_TASK_ID, **context) -> dict:
+    """
+    This method will read the DQ summary rows of the jobs of the DQ DAG run triggered by the migration run and
+    fail the migration if any dimension is below its threshold, so a DQ job which ran but found failing rows
+    doesn't pass. The per dimension success ratios are recorded as the stage metrics.
+    Args: summary_table project.dataset.table of the DQ results, dq_thresholds of the entity config
+    Returns: dict of the dimension to its evaluation
+    """
+    thresholds = get_thresholds(dq_thresholds)
+    invocation_ids, started, finished = __get_dq_run(dq_dag_id, trigger_task_id, context['ti'])
+    summaries = [row for batch in bq_data_operations.query_bq_arrow_batches(
+        get_run_summary_sql(summary_table, invocation_ids, started, finished)) for row in batch.to_pylist()]
+    if not summaries:
+        raise AirflowFailException(f"No DQ results of the invocations {invocation_ids} at {summary_table}")
+
+    results = evaluate_dimensions(summaries, thresholds)
+    record_stage_metrics(**{f"{dimension.lower()}_success_ratio": result['success_ratio']
+                            for dimension, result in results.items()})
+    for dimension, result in results.items():
+        log.info(f"DQ dimension {dimension}: success ratio {result['success_ratio']:.6f}, "
+                 f"threshold {result['threshold']}, {'passed' if result['passed'] else 'failed'}")
+    failed = sorted(dimension for dimension, result in results.items() if not result['passed'])
+    if failed:
+        raise AirflowFailException(f"DQ dimensions {failed} are below their thresholds")
+    return results
@@ -1,10 +1,15 @@
 import logging
 import os
 import json
-import pyarrow.parquet as pq
-from google.cloud import storage
 from airflow.plugins_manager import AirflowPlugin
 
+from common.lazy_imports import lazy_import
+from common.metrics import record_stage_metrics
+from common.profiling import profiled
+
+pq = lazy_import('pyarrow.parquet')
+storage = lazy_import('google.cloud.storage')
+
 log = logging.getLogger()
 
 dags_folder = os.getenv('DAGS_FOLDER')
@@ -25,11 +30,22 @@ def read_sql_file(file_path):
     return sql_file
 
 
-def calculate_total_rows(bucket_name, prefix):
+@profiled
+def calculate_total_rows(bucket_name, prefix, compaction_task_id=None, **context):
+    # The compaction counts the rows of every export file into its manifest, the files aren't read again
+    if compaction_task_id:
+        compacted_rows = context['ti'].xcom_pull(task_ids=compaction_task_id)
+        if compacted_rows is not None:
+            log.info(f"Total rows of the compaction manifest: {compacted_rows}")
+            record_stage_metrics(rows=compacted_rows)
+            return compacted_rows
+
     # Establish a client for interacting with GCS
     client = storage.Client()
     bucket = client.bucket(bucket_name)
     total_rows = 0
+    total_bytes = 0
+    total_files = 0
 
     log.info(f"Starting validation of total rows at {bucket_name}/{prefix}")
     # List all the parquet files in the GCS path
@@ -46,10 +62,13 @@ def calculate_total_rows(bucket_name, prefix):
         num_rows = parquet_file.metadata.num_rows
         log.info(f"File {file_name} has {num_rows} rows")
         total_rows += num_rows
+        total_bytes += blob.size or 0
+        total_files += 1
         # Delete the local file
         os.remove(file_name)
 
     log.info(f"Total rows: {total_rows}")
+    record_stage_metrics(rows=total_rows, bytes=total_bytes, files=total_files)
     return total_rows
 
 
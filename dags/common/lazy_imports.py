@@ -0,0 +1,32 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in of a module which is imported on the first attribute access. The client libraries (pyarrow, duckdb,
+    the Google Cloud clients) are only needed by the task callables, so the DAG files don't import them when
+    they are parsed. The stand-in is replaced like a module, e.g. by the benchmark stand-ins.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        # Called only for the attributes missing at the stand-in, i.e. the ones of the module
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module '{self._name}'{' (imported)' if self._module is not None else ''}>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    This method will return the module stand-in imported on the first use, e.g.
+    pq = lazy_import('pyarrow.parquet') instead of import pyarrow.parquet as pq.
+    Args:
+    Returns: LazyModule
+    """
+    return LazyModule(name)
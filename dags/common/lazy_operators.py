@@ -0,0 +1,115 @@
+import importlib
+
+from airflow.operators.python import PythonOperator
+from airflow.sensors.python import PythonSensor
+
+# Provider operators run by the lazy tasks, their modules import the Google and AWS clients, e.g. the BigQuery
+# operators import pandas_gbq and the BigQuery Storage client, so the DAG files don't import them when parsed
+BQ_QUERY = "airflow.providers.google.cloud.operators.bigquery.BigQueryExecuteQueryOperator"
+BQ_CREATE_TRANSFER = "airflow.providers.google.cloud.operators.bigquery_dts.BigQueryCreateDataTransferOperator"
+BQ_START_TRANSFER_RUNS = \
+    "airflow.providers.google.cloud.operators.bigquery_dts.BigQueryDataTransferServiceStartTransferRunsOperator"
+BQ_TRANSFER_RUN_SENSOR = \
+    "airflow.providers.google.cloud.sensors.bigquery_dts.BigQueryDataTransferServiceTransferRunSensor"
+S3_TO_GCS_TRANSFER = \
+    "airflow.providers.google.cloud.operators.cloud_storage_transfer_service.CloudDataTransferServiceS3ToGCSOperator"
+REDSHIFT_DATA = "airflow.providers.amazon.aws.operators.redshift_data.RedshiftDataOperator"
+S3_KEY_SENSOR = "airflow.providers.amazon.aws.sensors.s3.S3KeySensor"
+# Extra links of the provider operators shown by the lazy tasks, their modules don't import the clients. The BigQuery
+# job link is defined by the BigQuery operators module, so the lazy query tasks have none
+BQ_TRANSFER_CONFIG_LINK = "airflow.providers.google.cloud.links.bigquery_dts.BigQueryDataTransferConfigLink"
+EXTRA_LINKS = {
+    BQ_CREATE_TRANSFER: (BQ_TRANSFER_CONFIG_LINK,),
+    BQ_START_TRANSFER_RUNS: (BQ_TRANSFER_CONFIG_LINK,),
+}
+
+
+def __import_class(path: str):
+    module_name, _, class_name = path.rpartition('.')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def __get_extra_links(operator: str) -> tuple:
+    return tuple(__import_class(link)() for link in EXTRA_LINKS.get(operator, ()))
+
+
+class LazyOperator(PythonOperator):
+    """
+    PythonOperator executing the provider operator. A kill of the task, e.g. by its execution timeout or by marking
+    it failed, is forwarded to the running provider operator, so its query, statement or job is cancelled too.
+    """
+
+    def __init__(self, *, operator_extra_links: tuple = (), **kwargs):
+        super().__init__(**kwargs)
+        self.operator_extra_links = operator_extra_links
+        self.provider_operator = None
+
+    def on_kill(self) -> None:
+        if self.provider_operator is not None:
+            self.provider_operator.on_kill()
+
+
+class LazySensor(PythonSensor):
+    """
+    PythonSensor poking with the provider sensor. A kill of the task is forwarded to the poking provider sensor.
+    """
+
+    def __init__(self, *, operator_extra_links: tuple = (), **kwargs):
+        super().__init__(**kwargs)
+        self.operator_extra_links = operator_extra_links
+        self.provider_operator = None
+
+    def on_kill(self) -> None:
+        if self.provider_operator is not None:
+            self.provider_operator.on_kill()
+
+
+def __get_operator(operator: str, operator_kwargs: dict, context: dict):
+    # The task id of the task, so the XComs pushed by the operator are the ones of the task
+    provider_operator = __import_class(operator)(task_id=context['ti'].task_id, **operator_kwargs)
+    # The running task kills the provider operator on kill
+    context['task'].provider_operator = provider_operator
+    return provider_operator
+
+
+def execute_operator(operator: str, operator_kwargs: dict, **context):
+    """
+    This method is a task callable executing the provider operator with the rendered arguments.
+    Args: operator module.Class path of the provider operator, operator_kwargs its arguments
+    Returns: the operator result
+    """
+    return __get_operator(operator, operator_kwargs, context).execute(context)
+
+
+def poke_sensor(sensor: str, sensor_kwargs: dict, **context) -> bool:
+    """
+    This method is a sensor callable poking the provider sensor with the rendered arguments.
+    Args: sensor module.Class path of the provider sensor, sensor_kwargs its arguments
+    Returns: bool
+    """
+    return __get_operator(sensor, sensor_kwargs, context).poke(context)
+
+
+def lazy_operator(task_id: str, operator: str, operator_kwargs: dict, **kwargs) -> LazyOperator:
+    """
+    This method will return the task running the provider operator, which is imported only when the task runs.
+    The operator arguments are templated the same way.
+    Args: operator module.Class path of the provider operator, operator_kwargs its arguments, kwargs the ones of
+    the task, e.g. pre_execute or pool
+    Returns: LazyOperator
+    """
+    return LazyOperator(task_id=task_id, python_callable=execute_operator,
+                        op_kwargs={'operator': operator, 'operator_kwargs': operator_kwargs},
+                        operator_extra_links=__get_extra_links(operator), **kwargs)
+
+
+def lazy_sensor(task_id: str, sensor: str, sensor_kwargs: dict, **kwargs) -> LazySensor:
+    """
+    This method will return the sensor poking with the provider sensor, which is imported only when the task runs.
+    Poke interval, timeout and mode are the ones of the returned sensor, e.g. set by polling.tune_sensor.
+    Args: sensor module.Class path of the provider sensor, sensor_kwargs its arguments, kwargs the ones of the task
+    Returns: LazySensor
+    """
+    return LazySensor(task_id=task_id, python_callable=poke_sensor,
+                      op_kwargs={'sensor': sensor, 'sensor_kwargs': sensor_kwargs},
+                      operator_extra_links=__get_extra_links(sensor), **kwargs)
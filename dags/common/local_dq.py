@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+from string import Template
+
+from common.lazy_imports import lazy_import
+from common.metrics import record_stage_metrics
+from common.profiling import profiled
+
+duckdb = lazy_import('duckdb')
+ds = lazy_import('pyarrow.dataset')
+fs = lazy_import('pyarrow.fs')
+yaml = lazy_import('yaml')
+storage = lazy_import('google.cloud.storage')
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+# Rule results of the local engine
+PASSED = "PASSED"
+FAILED = "FAILED"
+# The rule can't be run locally, e.g. it references other BigQuery tables
+SKIPPED = "SKIPPED"
+# The rule SQL isn't supported by the local engine dialect
+ERROR = "ERROR"
+
+SOURCE_VIEW_NAME = "source"
+
+
+def load_dq_config(config_path: str) -> dict:
+    """
+    This method will load the compiled CloudDQ YAML from the local file system or GCS.
+    Args:
+    Returns: dict
+    """
+    if config_path.startswith("gs://"):
+        bucket_name, blob_name = config_path[len("gs://"):].split('/', 1)
+        config_text = storage.Client().bucket(bucket_name).blob(blob_name).download_as_text()
+    else:
+        with open(config_path, 'r') as f:
+            config_text = f.read()
+    return yaml.safe_load(config_text)
+
+
+def __get_rule_params(rule_id) -> tuple:
+    # Rule ids are either plain names or {name: {argument: value}} mappings
+    if isinstance(rule_id, dict):
+        rule_name, rule_args = next(iter(rule_id.items()))
+        return rule_name, {name: str(value) for name, value in (rule_args or {}).items()}
+    return rule_id, {}
+
+
+def __get_failed_rows_sql(rule: dict, column: str, rule_args: dict) -> str:
+    params = rule.get('params', {})
+    substitutions = dict(rule_args, column=column)
+    rule_type = rule['rule_type']
+    if rule_type == 'NOT_NULL':
+        return f"SELECT count(*) FROM data WHERE {column} IS NULL"
+    if rule_type == 'NOT_BLANK':
+        return f"SELECT count(*) FROM data WHERE TRIM(CAST({column} AS VARCHAR)) = ''"
+    if rule_type == 'REGEX':
+        # Patterns are escaped for BigQuery string literals
+        pattern = params['pattern'].replace('\\\\', '\\').replace("'", "''")
+        return f"SELECT count(*) FROM data " \
+               f"WHERE {column} IS NOT NULL AND NOT regexp_matches(CAST({column} AS VARCHAR), '{pattern}')"
+    if rule_type == 'CUSTOM_SQL_EXPR':
+        expr = Template(params['custom_sql_expr']).safe_substitute(substitutions)
+        return f"SELECT count(*) FROM data WHERE {column} IS NOT NULL AND NOT COALESCE(({expr}), FALSE)"
+    if rule_type == 'CUSTOM_SQL_STATEMENT':
+        # The rows returned by the statement are the failed ones
+        statement = Template(params['custom_sql_statement']).safe_substitute(substitutions)
+        return f"SELECT count(*) FROM ({statement})"
+    return None
+
+
+def build_rule_queries(yaml_data: dict, entity_name: str) -> list:
+    """
+    This method will build the failed rows count query of every rule bound to the entity.
+    Args:
+    Returns: list of dicts with rule_binding_id, rule_id, dimension and sql (None if the rule can't be run locally)
+    """
+    rule_queries = []
+    for binding_id, binding in yaml_data.get('rule_bindings', {}).items():
+        if binding['entity_uri'].rstrip('/').split('/')[-1] != entity_name:
+            continue
+        row_filter = yaml_data.get('row_filters', {}).get(binding.get('row_filter_id', 'NONE'), {})
+        filter_sql_expr = row_filter.get('filter_sql_expr', 'True')
+        for rule_id in binding['rule_ids']:
+            rule_name, rule_args = __get_rule_params(rule_id)
+            rule = yaml_data['rules'][rule_name]
+            failed_rows_sql = __get_failed_rows_sql(rule, binding['column_id'], rule_args)
+            if failed_rows_sql is not None and '`' not in failed_rows_sql:
+                failed_rows_sql = f"WITH data AS (SELECT * FROM {SOURCE_VIEW_NAME} WHERE {filter_sql_expr}) " \
+                                  f"{failed_rows_sql}"
+            else:
+                failed_rows_sql = None
+            rule_queries.append({
+                'rule_binding_id': binding_id,
+                'rule_id': rule_name,
+                'dimension': rule.get('dimension'),
+                'sql': failed_rows_sql,
+            })
+    return rule_queries
+
+
+def run_local_dq_checks(yaml_data: dict, entity_name: str, parquet_paths: list,
+                        filesystem: fs.FileSystem = None) -> list:
+    """
+    This method will run the entity rules against the Parquet files with the embedded DuckDB engine.
+    Files are scanned lazily as an Arrow dataset, so only the columns used by a rule are read.
+    Args:
+    Returns: list of dicts with rule_binding_id, rule_id, dimension, status and failed_count
+    """
+    dataset = ds.dataset(parquet_paths, filesystem=filesystem, format='parquet')
+    connection = duckdb.connect()
+    connection.register(SOURCE_VIEW_NAME, dataset)
+
+    results = []
+    for rule_query in build_rule_queries(yaml_data, entity_name):
+        result = {key: rule_query[key] for key in ['rule_binding_id', 'rule_id', 'dimension']}
+        result['failed_count'] = None
+        if rule_query['sql'] is None:
+            result['status'] = SKIPPED
+        else:
+            try:
+                result['failed_count'] = connection.execute(rule_query['sql']).fetchone()[0]
+                result['status'] = PASSED if result['failed_count'] == 0 else FAILED
+            except duckdb.Error as e:
+                log.warning(f"Rule {rule_query['rule_id']} can't be run locally: {e}")
+                result['status'] = ERROR
+        log.info(f"Rule binding {result['rule_binding_id']} rule {result['rule_id']}: {result['status']}")
+        results.append(result)
+    connection.close()
+    return results
+
+
+@profiled
+def validate_export_dq(bucket_name: str, prefix: str, config_path: str, entity_name: str) -> bool:
+    """
+    This method will run the entity DQ rules against the exported Parquet files at GCS before the BQ load.
+    Args:
+    Returns: bool True if none of the rules failed
+    """
+    client = storage.Client()
+    parquet_paths = [f"{bucket_name}/{blob.name}" for blob in client.list_blobs(bucket_name, prefix=prefix)]
+    log.info(f"Running local DQ checks of {config_path} against {len(parquet_paths)} files at {bucket_name}/{prefix}")
+    if not parquet_paths:
+        return True
+    results = run_local_dq_checks(load_dq_config(config_path), entity_name, parquet_paths, fs.GcsFileSystem())
+    failed = [result for result in results if result['status'] == FAILED]
+    record_stage_metrics(files=len(parquet_paths), rules=len(results), failed_rules=len(failed))
+    for result in failed:
+        log.error(f"Rule binding {result['rule_binding_id']} rule {result['rule_id']} failed "
+                  f"for {result['failed_count']} rows")
+    return not failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run compiled DQ rules against local Parquet files.')
+    parser.add_argument('yaml_file', type=str, help='Path to the compiled (or self-contained) DQ YAML file')
+    parser.add_argument('entity_name', type=str, help='Entity name the rule bindings are filtered by')
+    parser.add_argument('parquet_files', type=str, nargs='+', help='Parquet files or directories to check')
+
+    args = parser.parse_args()
+    dq_results = run_local_dq_checks(load_dq_config(args.yaml_file), args.entity_name,
+                                     [os.path.abspath(path) for path in args.parquet_files])
+    if any(dq_result['status'] == FAILED for dq_result in dq_results):
+        raise SystemExit(1)
@@ -0,0 +1,134 @@
+import json
+import logging
+from datetime import datetime
+
+from airflow.operators.python import get_current_context
+from airflow.stats import Stats
+
+from common.lazy_imports import lazy_import
+
+bigquery = lazy_import('google.cloud.bigquery')
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+METRICS_PREFIX = "redshift_migration"
+STAGE_METRICS_XCOM_KEY = "stage_metrics"
+RUN_METRICS_TABLE_ID = "migration_run_metrics"
+
+
+def get_run_metrics_schema() -> list:
+    # Built on use, so the BigQuery client isn't imported when the DAG files are parsed
+    return [
+        bigquery.SchemaField("dag_id", "STRING"),
+        bigquery.SchemaField("run_id", "STRING"),
+        bigquery.SchemaField("export_datetime", "STRING"),
+        bigquery.SchemaField("state", "STRING"),
+        bigquery.SchemaField("start_date", "TIMESTAMP"),
+        bigquery.SchemaField("duration_s", "FLOAT"),
+        bigquery.SchemaField("stages", "RECORD", mode="REPEATED", fields=[
+            bigquery.SchemaField("stage", "STRING"),
+            bigquery.SchemaField("state", "STRING"),
+            bigquery.SchemaField("duration_s", "FLOAT"),
+            bigquery.SchemaField("metrics", "STRING", description="JSON of the metrics recorded by the stage"),
+        ]),
+    ]
+
+
+def get_run_metrics_table_id(_gcp_config: dict) -> str:
+    return f"{_gcp_config['project']}.{_gcp_config.get('metrics_dataset_id', _gcp_config['dataset_id'])}." \
+           f"{RUN_METRICS_TABLE_ID}"
+
+
+def __emit(dag_id: str, stage: str, metrics: dict) -> None:
+    # Airflow Stats sends the metrics to the StatsD or OpenTelemetry sink configured at the [metrics] section
+    for name, value in metrics.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            Stats.gauge(f"{METRICS_PREFIX}.{dag_id}.{stage}.{name}", value)
+
+
+def record_stage_metrics(stage: str = None, **metrics) -> dict:
+    """
+    This method will emit the stage metrics (rows, bytes, files, bytes_billed, ...) and keep them at the task XCom,
+    so they get into the run summary. Stage defaults to the current task id.
+    Args:
+    Returns: dict of all the metrics recorded by the task
+    """
+    try:
+        context = get_current_context()
+    except Exception:
+        # Called outside of a task, e.g. locally or in benchmarks
+        log.info(f"Stage {stage} metrics: {metrics}")
+        return metrics
+    ti = context['ti']
+    stage = stage or ti.task_id
+    __emit(ti.dag_id, stage, metrics)
+    recorded = ti.xcom_pull(task_ids=ti.task_id, key=STAGE_METRICS_XCOM_KEY) or {}
+    recorded.setdefault(stage, {}).update(metrics)
+    ti.xcom_push(key=STAGE_METRICS_XCOM_KEY, value=recorded)
+    log.info(f"Stage {stage} metrics: {recorded[stage]}")
+    return recorded
+
+
+def emit_task_metrics(context: dict) -> None:
+    """
+    This method is a task success and failure callback emitting the task duration and final state.
+    Args:
+    Returns: None
+    """
+    ti = context['ti']
+    # Tasks which never started, e.g. upstream failed or skipped ones, have no duration
+    duration = 0
+    if ti.start_date is not None:
+        duration = ((ti.end_date or datetime.now(ti.start_date.tzinfo)) - ti.start_date).total_seconds()
+    Stats.timing(f"{METRICS_PREFIX}.{ti.dag_id}.{ti.task_id}.duration", duration * 1000)
+    Stats.incr(f"{METRICS_PREFIX}.{ti.dag_id}.{ti.task_id}.{ti.state}")
+
+
+def get_run_summary(dag_run) -> dict:
+    """
+    This method will collect the durations and the recorded metrics of all the run tasks to a single row.
+    Args:
+    Returns: dict
+    """
+    stages = []
+    for ti in dag_run.get_task_instances():
+        duration = ti.duration
+        if duration is None and ti.start_date and ti.end_date:
+            duration = (ti.end_date - ti.start_date).total_seconds()
+        stage_metrics = ti.xcom_pull(task_ids=ti.task_id, key=STAGE_METRICS_XCOM_KEY) or {}
+        stages.append({
+            'stage': ti.task_id,
+            'state': ti.state,
+            'duration_s': duration,
+            'metrics': json.dumps(stage_metrics, default=str),
+        })
+    end_date = dag_run.end_date or datetime.now(dag_run.start_date.tzinfo)
+    export_ti = dag_run.get_task_instance('generate_export_datetime')
+    return {
+        'dag_id': dag_run.dag_id,
+        'run_id': dag_run.run_id,
+        'export_datetime': export_ti.xcom_pull(task_ids='generate_export_datetime') if export_ti else None,
+        'state': dag_run.state,
+        'start_date': dag_run.start_date.isoformat(),
+        'duration_s': (end_date - dag_run.start_date).total_seconds(),
+        'stages': stages,
+    }
+
+
+def persist_run_summary(context: dict, project_id: str, dataset_id: str,
+                        table_id: str = RUN_METRICS_TABLE_ID) -> None:
+    """
+    This method is a DAG success and failure callback appending the run summary row to the BQ metrics table.
+    Args:
+    Returns: None
+    """
+    summary = get_run_summary(context['dag_run'])
+    client = bigquery.Client(project=project_id)
+    table = client.create_table(bigquery.Table(f"{project_id}.{dataset_id}.{table_id}",
+                                               schema=get_run_metrics_schema()), exists_ok=True)
+    errors = client.insert_rows_json(table, [summary])
+    if errors:
+        log.error(f"Failed to persist the run summary: {errors}")
+    else:
+        log.info(f"Run summary persisted to {project_id}.{dataset_id}.{table_id}")
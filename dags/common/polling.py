@@ -0,0 +1,145 @@
+import logging
+import statistics
+from datetime import timedelta
+
+from common import bq_data_operations
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+DEFAULT_POLLING_POLICY = {
+    # Expected stage duration when the run metrics have no history of the stage yet
+    'default_duration_s': 600,
+    # First poll is after this fraction of the expected duration, the next ones back off by the factor
+    'initial_fraction': 0.125,
+    'backoff': 2,
+    'min_interval_s': 10,
+    'max_interval_s': 600,
+    # Stage fails after deadline_factor of the expected duration, within the deadline bounds
+    'deadline_factor': 4,
+    'min_deadline_s': 60 * 60,
+    'max_deadline_s': 18 * 60 * 60,
+}
+HISTORY_RUNS = 10
+BATCH_ROWS_TASK_ID = "count_new_records"
+
+
+def get_polling_policy(config: dict) -> dict:
+    """
+    This method will return the default polling policy overridden by the polling section of the entity config.
+    Args:
+    Returns: dict
+    """
+    return {**DEFAULT_POLLING_POLICY, **config.get('polling', {})}
+
+
+def get_stage_history(metrics_table_id: str, dag_id: str, stage: str, runs: int = HISTORY_RUNS) -> list:
+    """
+    This method will read the durations of the stage in the last successful runs with the rows of their exports
+    from the run metrics table. Stages restored from checkpoints aren't successful, so they aren't counted.
+    Args:
+    Returns: list of dicts with duration_s and batch_rows
+    """
+    sql = f"""SELECT s.duration_s,
+                     (SELECT CAST(JSON_VALUE(c.metrics, '$.count_files_total_rows.rows') AS INT64)
+                      FROM UNNEST(stages) c WHERE c.stage = 'count_files_total_rows') AS batch_rows
+              FROM `{metrics_table_id}`, UNNEST(stages) s
+              WHERE dag_id = '{dag_id}' AND state = 'success' AND s.stage = '{stage}' AND s.state = 'success'
+              ORDER BY start_date DESC
+              LIMIT {runs}"""
+    return [row for batch in bq_data_operations.query_bq_arrow_batches(sql) for row in batch.to_pylist()]
+
+
+def predict_duration(history: list, batch_rows: int = None, default_s: float = 600) -> float:
+    """
+    This method will predict the stage duration by the median seconds per row of the history runs if the batch
+    rows are known, otherwise by the median duration of the history runs.
+    Args:
+    Returns: float seconds
+    """
+    durations = [run['duration_s'] for run in history if run.get('duration_s')]
+    if not durations:
+        return default_s
+    rates = [run['duration_s'] / run['batch_rows'] for run in history
+             if run.get('duration_s') and run.get('batch_rows')]
+    if batch_rows and rates:
+        return statistics.median(rates) * batch_rows
+    return statistics.median(durations)
+
+
+def get_batch_rows(ti, task_id: str = BATCH_ROWS_TASK_ID):
+    response = ti.xcom_pull(task_ids=task_id)
+    # Estimate of the change probe or the count statement response
+    if response and 'estimated_rows' in response:
+        return response['estimated_rows']
+    records = response.get('Records', []) if response else []
+    return records[0][0].get('longValue') if records else None
+
+
+def predict_stage_duration(metrics_table_id: str, dag_id: str, stage: str, batch_rows: int = None,
+                           policy: dict = None) -> float:
+    """
+    This method will predict the stage duration from the run metrics history. A missing or failing
+    history falls back to the policy default_duration_s, e.g. before the first run persisted its metrics.
+    Args:
+    Returns: float seconds
+    """
+    policy = policy or DEFAULT_POLLING_POLICY
+    try:
+        history = get_stage_history(metrics_table_id, dag_id, stage)
+    except Exception as e:
+        log.warning(f"Stage {stage} history isn't available: {e}")
+        history = []
+    expected_s = predict_duration(history, batch_rows, policy['default_duration_s'])
+    log.info(f"Stage {stage} of {batch_rows} rows is expected to take {expected_s:.0f} s, "
+             f"{len(history)} runs of history")
+    return expected_s
+
+
+def __clamp(value: float, low: float, high: float) -> float:
+    return max(low, min(value, high))
+
+
+def get_poll_interval(poll_number: int, expected_s: float, policy: dict = None) -> float:
+    """
+    This method will return the interval before the next poll: a fraction of the expected duration first,
+    backing off with every poll, within the policy interval bounds.
+    Args: poll_number starts with 1
+    Returns: float seconds
+    """
+    policy = policy or DEFAULT_POLLING_POLICY
+    interval = expected_s * policy['initial_fraction'] * policy['backoff'] ** (poll_number - 1)
+    return __clamp(interval, policy['min_interval_s'], policy['max_interval_s'])
+
+
+def get_deadline(expected_s: float, policy: dict = None) -> float:
+    """
+    This method will return the time the stage may poll for.
+    Args:
+    Returns: float seconds
+    """
+    policy = policy or DEFAULT_POLLING_POLICY
+    return __clamp(expected_s * policy['deadline_factor'], policy['min_deadline_s'], policy['max_deadline_s'])
+
+
+def tune_sensor(context: dict, metrics_table_id: str, policy: dict = None, pre_execute=None, dag_id: str = None,
+                batch_rows_task_id: str = BATCH_ROWS_TASK_ID) -> None:
+    """
+    This method is a sensor pre_execute hook setting its poke interval, backoff and timeout by the predicted
+    stage duration. Sensors back off exponentially from the first interval up to the policy max_interval_s.
+    Args: pre_execute hook of the task run first, e.g. the checkpoint restore, dag_id of the history defaults
+    to the task DAG, the stage is the task id without the task group prefix
+    Returns: None
+    """
+    if pre_execute:
+        pre_execute(context)
+    policy = policy or DEFAULT_POLLING_POLICY
+    sensor, ti = context['task'], context['ti']
+    expected_s = predict_stage_duration(metrics_table_id, dag_id or ti.dag_id, ti.task_id.rsplit('.', 1)[-1],
+                                        get_batch_rows(ti, batch_rows_task_id), policy)
+    # Airflow waits between a half and the whole poke_interval before the first poke, doubling it afterwards
+    sensor.poke_interval = 2 * get_poll_interval(1, expected_s, policy)
+    sensor.exponential_backoff = True
+    sensor.max_wait = timedelta(seconds=policy['max_interval_s'])
+    sensor.timeout = get_deadline(expected_s, policy)
+    log.info(f"Sensor {ti.task_id} pokes in {sensor.poke_interval / 2:.0f} s, times out in {sensor.timeout:.0f} s")
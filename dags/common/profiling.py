@@ -0,0 +1,165 @@
+import cProfile
+import functools
+import io
+import logging
+import marshal
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+from airflow.models import Variable
+from airflow.operators.python import get_current_context
+
+from common.lazy_imports import lazy_import
+
+storage = lazy_import('google.cloud.storage')
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+PROFILING_VARIABLE = "migration_profiling"
+PROFILING_ENV = "MIGRATION_PROFILING"
+# DAG param of the location the export directories are at, e.g. gs://bucket/path/
+PROFILE_LOCATION_PARAM = "profile_location"
+PROFILES_DIRECTORY = "_profiles"
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 25
+TOP_FUNCTIONS = 40
+MEMORY_SAMPLE_INTERVAL_S = 1
+
+__enabled = None
+__active = threading.local()
+
+
+def is_profiling_enabled() -> bool:
+    """
+    This method will check the MIGRATION_PROFILING env var and, if it isn't set, the migration_profiling
+    Airflow Variable. The result is cached for the process.
+    Args:
+    Returns: bool
+    """
+    global __enabled
+    if __enabled is None:
+        value = os.getenv(PROFILING_ENV)
+        if value is None:
+            try:
+                value = Variable.get(PROFILING_VARIABLE, default_var='false')
+            except Exception as e:
+                log.info(f"Variable {PROFILING_VARIABLE} isn't available: {e}")
+                value = 'false'
+        __enabled = str(value).lower() in ('1', 'true', 'yes')
+    return __enabled
+
+
+def get_profile_location(context: dict):
+    """
+    This method will return the profiles location next to the run export, gs://bucket/path/export_datetime/_profiles/,
+    or None if the DAG has no profile_location param.
+    Args:
+    Returns: str or None
+    """
+    location = (context.get('params') or {}).get(PROFILE_LOCATION_PARAM)
+    if not location:
+        return None
+    export_datetime = context['ti'].xcom_pull(task_ids='generate_export_datetime') \
+        or (context['dag_run'].conf or {}).get('export_datetime') or context['run_id']
+    return f"{location}{export_datetime}/{PROFILES_DIRECTORY}/"
+
+
+def __sample_memory(stop: threading.Event, largest: dict) -> None:
+    # Keeps the snapshot of the largest traced memory, since most allocations are freed by the end of the call
+    while not stop.wait(MEMORY_SAMPLE_INTERVAL_S):
+        current, _ = tracemalloc.get_traced_memory()
+        if current > largest.get('current', -1):
+            largest.update(current=current, snapshot=tracemalloc.take_snapshot())
+
+
+def get_report(profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot, peak_bytes: int, wall_time: float) -> str:
+    """
+    This method will render the cumulative time top functions and the top allocation lines.
+    Args:
+    Returns: str
+    """
+    report = io.StringIO()
+    report.write(f"Wall time: {wall_time:.3f} s, traced memory peak: {peak_bytes / 1024 ** 2:.1f} MB\n\n")
+    pstats.Stats(profiler, stream=report).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+    report.write(f"Top {TOP_ALLOCATIONS} allocations by line at the largest sampled traced memory:\n")
+    for statistic in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+        report.write(f"{statistic}\n")
+    return report.getvalue()
+
+
+def __upload(location: str, name: str, data, content_type: str) -> None:
+    bucket_name, blob_name = location[len("gs://"):].split('/', 1)
+    storage.Client().bucket(bucket_name).blob(f"{blob_name}{name}").upload_from_string(data, content_type=content_type)
+
+
+def __save(func_name: str, profiler: cProfile.Profile, report: str) -> None:
+    try:
+        context = get_current_context()
+    except Exception:
+        # Called outside of a task, e.g. locally or in benchmarks
+        log.info(f"Profile of {func_name}:\n{report}")
+        return
+    location = get_profile_location(context)
+    if not location:
+        log.info(f"Profile of {func_name}:\n{report}")
+        return
+    ti = context['ti']
+    name = f"{ti.task_id}_{func_name}_try{ti.try_number}"
+    profiler.create_stats()
+    # Loaded with pstats.Stats or snakeviz once downloaded
+    __upload(location, f"{name}.prof", marshal.dumps(profiler.stats), 'application/octet-stream')
+    __upload(location, f"{name}.txt", report, 'text/plain')
+    log.info(f"Profile of {func_name} is uploaded to {location}{name}.prof")
+
+
+def profiled(func):
+    """
+    This method will wrap the task callable with cProfile and tracemalloc if profiling is enabled. The profile
+    and the report of the top functions and allocations are uploaded next to the run export. Nested profiled
+    calls run as they are, so only the outer callable is profiled.
+    Args:
+    Returns: wrapped callable with the signature of func
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(__active, 'profiling', False) or not is_profiling_enabled():
+            return func(*args, **kwargs)
+        __active.profiling = True
+        profiler = cProfile.Profile()
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        largest, stop = {}, threading.Event()
+        sampler = threading.Thread(target=__sample_memory, args=(stop, largest), daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                # The result is still referenced, so its allocations are in the last sample
+                stop.set()
+                sampler.join()
+                current, peak_bytes = tracemalloc.get_traced_memory()
+                if current > largest.get('current', -1):
+                    largest.update(current=current, snapshot=tracemalloc.take_snapshot())
+            return result
+        finally:
+            wall_time = time.perf_counter() - started
+            snapshot = largest['snapshot']
+            if not tracing:
+                tracemalloc.stop()
+            __active.profiling = False
+            try:
+                __save(func.__name__, profiler, get_report(profiler, snapshot, peak_bytes, wall_time))
+            except Exception as e:
+                # Profiling never fails the task
+                log.warning(f"Profile of {func.__name__} isn't saved: {e}")
+
+    return wrapper
@@ -0,0 +1,109 @@
+import logging
+import time
+
+from common.lazy_imports import lazy_import
+
+# Only the boto3 redshift-data client is needed, so the helpers run outside of Airflow too, e.g. in generate_sql.py
+redshift_data = lazy_import('airflow.providers.amazon.aws.hooks.redshift_data')
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+DEFAULT_STATEMENT_POLICY = {
+    # Short statements, e.g. the probes, finish within the first polls, long ones, e.g. UNLOADs, back off
+    'initial_interval_s': 0.25,
+    'backoff': 2,
+    'max_interval_s': 15,
+    'timeout_s': 6 * 60 * 60,
+}
+FINISHED = "FINISHED"
+FAILED_STATUSES = ("FAILED", "ABORTED")
+
+
+def get_client(aws_conn_id: str = 'aws_default'):
+    return redshift_data.RedshiftDataHook(aws_conn_id=aws_conn_id).conn
+
+
+def submit_statements(client, sqls: list, database: str, cluster_identifier: str, db_user: str) -> str:
+    """
+    This method will submit the statements at once. More statements run as a single batch in one transaction
+    and session, in order, so a statement can read the results of the previous ones, e.g. pg_last_query_id().
+    Args: client boto3 redshift-data client
+    Returns: str statement id
+    """
+    kwargs = {'ClusterIdentifier': cluster_identifier, 'Database': database, 'DbUser': db_user}
+    if len(sqls) == 1:
+        return client.execute_statement(Sql=sqls[0], **kwargs)['Id']
+    return client.batch_execute_statement(Sqls=sqls, **kwargs)['Id']
+
+
+def wait_for_statement(client, statement_id: str, policy: dict = None) -> dict:
+    """
+    This method will poll the statement until it finishes, backing off from the policy initial interval.
+    Args:
+    Returns: dict of describe_statement
+    """
+    policy = {**DEFAULT_STATEMENT_POLICY, **(policy or {})}
+    deadline = time.monotonic() + policy['timeout_s']
+    interval = policy['initial_interval_s']
+    while True:
+        description = client.describe_statement(Id=statement_id)
+        if description['Status'] == FINISHED:
+            return description
+        if description['Status'] in FAILED_STATUSES:
+            raise RuntimeError(f"Redshift statement {statement_id} is {description['Status']}: "
+                               f"{description.get('Error')}")
+        if time.monotonic() + interval > deadline:
+            raise TimeoutError(f"Redshift statement {statement_id} isn't finished in {policy['timeout_s']} s")
+        time.sleep(interval)
+        interval = min(interval * policy['backoff'], policy['max_interval_s'])
+
+
+def get_result_ids(description: dict) -> list:
+    """
+    This method will return the ids of the statement results in the submission order, None for the statements
+    without a result set. Batch statements have a result per sub-statement.
+    Args: description of wait_for_statement
+    Returns: list
+    """
+    statements = description.get('SubStatements') or [description]
+    return [statement['Id'] if statement.get('HasResultSet') else None for statement in statements]
+
+
+def iter_result_pages(client, result_id: str):
+    next_token = None
+    while True:
+        kwargs = {'Id': result_id, 'NextToken': next_token} if next_token else {'Id': result_id}
+        page = client.get_statement_result(**kwargs)
+        yield page
+        next_token = page.get('NextToken')
+        if not next_token:
+            break
+
+
+def get_value(field: dict):
+    return None if field.get('isNull') else next(iter(field.values()))
+
+
+def iter_records(client, result_id: str):
+    """
+    This method will page the result, so only a page of records is held in memory.
+    Args:
+    Returns: generator of the records as lists of values
+    """
+    for page in iter_result_pages(client, result_id):
+        for record in page.get('Records', []):
+            yield [get_value(field) for field in record]
+
+
+def run_statements(client, sqls: list, database: str, cluster_identifier: str, db_user: str,
+                   policy: dict = None) -> list:
+    """
+    This method will submit the statements as one batch, wait for it and read all the results.
+    Args:
+    Returns: list of the records list per statement, empty for the statements without a result set
+    """
+    statement_id = submit_statements(client, sqls, database, cluster_identifier, db_user)
+    description = wait_for_statement(client, statement_id, policy)
+    return [list(iter_records(client, result_id)) if result_id else [] for result_id in get_result_ids(description)]
+
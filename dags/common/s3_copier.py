@@ -0,0 +1,166 @@
+import base64
+import hashlib
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from common.lazy_imports import lazy_import
+from common.metrics import record_stage_metrics
+
+s3 = lazy_import('airflow.providers.amazon.aws.hooks.s3')
+storage = lazy_import('google.cloud.storage')
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+CHOOSE_COPY_METHOD_TASK_ID = "choose_s3_copy_method"
+WORKER_COPY = "worker"
+STS_COPY = "sts"
+# Resumable upload chunks must be a multiple of 256 KiB
+DEFAULT_PART_SIZE = 32 * 256 * 1024
+DEFAULT_MAX_CONCURRENCY = 8
+# GCS object metadata with the ETag of the S3 object it's copied from
+S3_ETAG_METADATA = "s3_etag"
+
+
+def get_transfer_options(skip_existing: bool = False) -> dict:
+    """
+    This method will return the Storage Transfer Service options of the export transfer. With skip_existing,
+    objects already in the sink with the same checksum or ETag, e.g. transferred by a previous try of the export,
+    aren't transferred again.
+    Args:
+    Returns: dict
+    """
+    options = {'deleteObjectsFromSourceAfterTransfer': True}
+    if skip_existing:
+        options['overwriteWhen'] = 'DIFFERENT'
+    else:
+        options['overwriteObjectsAlreadyExistingInSink'] = True
+    return options
+
+
+def list_export_objects(s3_client, bucket: str, prefix: str) -> list:
+    """
+    This method will list the export objects under the S3 prefix.
+    Args:
+    Returns: list of dicts with Key, Size and ETag
+    """
+    objects, kwargs = [], {'Bucket': bucket, 'Prefix': prefix}
+    while True:
+        response = s3_client.list_objects_v2(**kwargs)
+        objects.extend(response.get('Contents', []))
+        if not response.get('IsTruncated'):
+            return objects
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+
+def __get_range(s3_client, bucket: str, key: str, start: int, end: int) -> bytes:
+    return s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")['Body'].read()
+
+
+def copy_object(s3_client, executor: ThreadPoolExecutor, s3_object: dict, s3_bucket: str, gcs_bucket,
+                gcs_name: str, part_size: int = DEFAULT_PART_SIZE, max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> int:
+    """
+    This method will copy a single S3 object to GCS. Ranged GETs of part_size run concurrently and are written
+    in order to a resumable upload, so at most max_concurrency parts are held in memory and nothing touches
+    the local disk. The copy is verified by the size, the S3 ETag (single part uploads only) and the GCS MD5.
+    Args: s3_object dict of the list_objects_v2 response
+    Returns: int copied bytes
+    """
+    key, size = s3_object['Key'], s3_object['Size']
+    md5 = hashlib.md5()
+    ranges = deque((start, min(start + part_size, size) - 1) for start in range(0, size, part_size))
+    pending = deque()
+    etag = s3_object.get('ETag', '').strip('"')
+    blob = gcs_bucket.blob(gcs_name)
+    # Multipart ETags aren't the MD5 of the object, they are kept to find the copy of the same S3 object
+    blob.metadata = {S3_ETAG_METADATA: etag}
+    copied = 0
+    with blob.open('wb', chunk_size=part_size) as writer:
+        while ranges or pending:
+            while ranges and len(pending) < max_concurrency:
+                pending.append(executor.submit(__get_range, s3_client, s3_bucket, key, *ranges.popleft()))
+            part = pending.popleft().result()
+            md5.update(part)
+            writer.write(part)
+            copied += len(part)
+
+    try:
+        if copied != size:
+            raise ValueError(f"Copied {copied} bytes of s3://{s3_bucket}/{key} of {size} bytes")
+        # Multipart upload ETags, e.g. of the UNLOAD files, aren't an MD5 of the content
+        if etag and '-' not in etag and etag != md5.hexdigest():
+            raise ValueError(f"MD5 {md5.hexdigest()} of s3://{s3_bucket}/{key} doesn't match its ETag {etag}")
+        blob.reload()
+        if blob.md5_hash != base64.b64encode(md5.digest()).decode('ascii'):
+            raise ValueError(f"MD5 of gs://{gcs_bucket.name}/{gcs_name} doesn't match s3://{s3_bucket}/{key}")
+    except ValueError:
+        blob.delete()
+        raise
+    return copied
+
+
+def choose_s3_copy_method(s3_bucket: str, s3_prefix: str, max_mb: int, aws_conn_id: str = 'aws_default') -> str:
+    """
+    This method will choose the in-worker copy for the exports of at most max_mb and Storage Transfer Service
+    for the bigger ones.
+    Args:
+    Returns: str worker or sts
+    """
+    objects = list_export_objects(s3.S3Hook(aws_conn_id=aws_conn_id).get_conn(), s3_bucket, s3_prefix)
+    export_mb = sum(s3_object['Size'] for s3_object in objects) / 1024 ** 2
+    method = WORKER_COPY if export_mb <= max_mb else STS_COPY
+    log.info(f"{len(objects)} objects of {export_mb:.1f} MB, copy method: {method}")
+    return method
+
+
+def is_copied(blob, s3_object: dict) -> bool:
+    """
+    This method will check whether the GCS object has the content of the S3 object, by the metadata only: the size
+    and the MD5 for single part ETags, the ETag the object was copied from for the multipart ones.
+    Args: blob GCS object or None, s3_object dict of the list_objects_v2 response
+    Returns: bool
+    """
+    if blob is None or blob.size != s3_object['Size']:
+        return False
+    etag = s3_object.get('ETag', '').strip('"')
+    if not etag:
+        return False
+    if '-' not in etag and blob.md5_hash == base64.b64encode(bytes.fromhex(etag)).decode('ascii'):
+        return True
+    return (blob.metadata or {}).get(S3_ETAG_METADATA) == etag
+
+
+def copy_export_to_gcs(s3_bucket: str, s3_prefix: str, gcs_bucket: str, gcs_prefix: str,
+                       part_size: int = DEFAULT_PART_SIZE, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                       delete_source: bool = True, aws_conn_id: str = 'aws_default',
+                       skip_existing: bool = False) -> int:
+    """
+    This method will copy the export objects under the S3 prefix to the GCS prefix, keeping their relative names,
+    and delete the S3 objects after their copy is verified, like the Storage Transfer Service job does.
+    With skip_existing, objects already copied to the target, e.g. by a previous try of the export, are skipped
+    by their metadata, so they aren't read from S3 again.
+    Args: part_size of the ranged GETs, multiple of 256 KiB
+    Returns: int copied bytes
+    """
+    if part_size % (256 * 1024):
+        raise ValueError(f"Part size {part_size} isn't a multiple of 256 KiB")
+    s3_client = s3.S3Hook(aws_conn_id=aws_conn_id).get_conn()
+    bucket = storage.Client().bucket(gcs_bucket)
+    objects = list_export_objects(s3_client, s3_bucket, s3_prefix)
+
+    copied, skipped = 0, 0
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for s3_object in objects:
+            gcs_name = gcs_prefix + s3_object['Key'][len(s3_prefix):]
+            if skip_existing and is_copied(bucket.get_blob(gcs_name), s3_object):
+                skipped += 1
+                log.info(f"gs://{gcs_bucket}/{gcs_name} has the content of s3://{s3_bucket}/{s3_object['Key']}")
+            else:
+                copied += copy_object(s3_client, executor, s3_object, s3_bucket, bucket, gcs_name, part_size,
+                                      max_concurrency)
+                log.info(f"s3://{s3_bucket}/{s3_object['Key']} is copied to gs://{gcs_bucket}/{gcs_name}")
+            if delete_source:
+                s3_client.delete_object(Bucket=s3_bucket, Key=s3_object['Key'])
+    record_stage_metrics(files=len(objects), bytes=copied, skipped_files=skipped)
+    return copied
@@ -0,0 +1,172 @@
+import logging
+from datetime import datetime, time, timezone
+
+from airflow.models import DagRun, Pool
+from airflow.utils.state import DagRunState
+
+from common import bq_data_operations
+from common import file_operations
+from common import redshift
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+REDSHIFT_UNLOAD_POOL = "redshift_unload"
+# Entities never migrated are the most stale ones
+NEVER_MIGRATED_STALENESS_HOURS = 10 ** 6
+
+
+def get_migration_dag_id(entity_name: str) -> str:
+    return f'redshift-to-bq-{entity_name}-migration'
+
+
+def is_in_window(windows: list, now: datetime) -> bool:
+    """
+    This method will check if the time of now is in one of the HH:MM UTC windows. A window may wrap midnight.
+    No windows means any time is allowed.
+    Args:
+    Returns: bool
+    """
+    if not windows:
+        return True
+    current = now.time()
+    for window in windows:
+        start, end = time.fromisoformat(window['start']), time.fromisoformat(window['end'])
+        if (start <= current < end) if start <= end else (current >= start or current < end):
+            return True
+    return False
+
+
+def sync_unload_pool(max_concurrent_unloads: int, pool_name: str = REDSHIFT_UNLOAD_POOL) -> None:
+    """
+    This method will create or resize the Airflow pool the UNLOAD tasks of all the entities run in,
+    so at most max_concurrent_unloads of them hit the cluster at the same time, whoever triggered the runs.
+    Args:
+    Returns: None
+    """
+    Pool.create_or_update_pool(pool_name, max_concurrent_unloads,
+                               "Concurrent Redshift UNLOADs of the migration DAGs")
+    log.info(f"Pool {pool_name} has {max_concurrent_unloads} slots")
+
+
+def get_redshift_table_sizes(aws_config: dict, table_ids: list) -> dict:
+    """
+    This method will read the table sizes from svv_table_info.
+    Args: table_ids in database.schema.table format
+    Returns: dict of table id to size in MB
+    """
+    if not table_ids:
+        return {}
+    tables_list = ", ".join(f"'{table_id}'" for table_id in table_ids)
+    records = redshift.run_statements(
+        redshift.get_client(aws_config.get('conn_id', 'aws_default')),
+        [f"""SELECT "database" || '.' || "schema" || '.' || "table", size FROM svv_table_info
+             WHERE "database" || '.' || "schema" || '.' || "table" IN ({tables_list})"""],
+        database=aws_config['database'], cluster_identifier=aws_config['cluster_id'],
+        db_user=aws_config['db_user'])[0]
+    return {table_id: size for table_id, size in records}
+
+
+def get_run_history(metrics_table_id: str, dag_ids: list) -> dict:
+    """
+    This method will read the last successful run start and the last exported bytes of the migration DAGs
+    from the run metrics table.
+    Args:
+    Returns: dict of dag id to dict with last_success_ts and last_export_bytes
+    """
+    sql = file_operations.read_sql_file('redshift_migration_scheduler/sql/get_entity_run_history.sql') % {
+        'metrics_table_id': metrics_table_id,
+        'dag_ids': ", ".join(f"'{dag_id}'" for dag_id in dag_ids),
+    }
+    history = {}
+    for batch in bq_data_operations.query_bq_arrow_batches(sql):
+        for row in batch.to_pylist():
+            history[row['dag_id']] = row
+    return history
+
+
+def get_active_dag_ids(dag_ids: list) -> list:
+    return [dag_id for dag_id in dag_ids
+            if DagRun.find(dag_id=dag_id, state=DagRunState.RUNNING)
+            or DagRun.find(dag_id=dag_id, state=DagRunState.QUEUED)]
+
+
+def prioritize(candidates: list) -> list:
+    """
+    This method will order the candidates by staleness, the most stale first, and the smaller estimated
+    export first among equally stale ones, so more entities get fresh within the same budget.
+    Args:
+    Returns: list
+    """
+    return sorted(candidates, key=lambda candidate: (-int(candidate['staleness_hours']),
+                                                     candidate['estimated_mb']))
+
+
+def admit(candidates: list, budget: dict, active: list) -> list:
+    """
+    This method will greedily admit the prioritized candidates while the UNLOADs and estimated MB budgets allow.
+    Active runs take their share of the budget first.
+    Args:
+    Returns: list of the admitted candidates
+    """
+    slots = budget['max_concurrent_unloads'] - len(active)
+    mb_left = budget.get('max_unload_mb', float('inf')) - sum(candidate['estimated_mb'] for candidate in active)
+    admitted = []
+    for candidate in prioritize(candidates):
+        if slots <= 0:
+            break
+        # The first admitted entity may exceed the MB budget alone, otherwise a big table would never be migrated
+        if candidate['estimated_mb'] > mb_left and (admitted or active):
+            log.info(f"Entity {candidate['entity_name']} of {candidate['estimated_mb']} MB doesn't fit "
+                     f"{mb_left} MB left")
+            continue
+        admitted.append(candidate)
+        slots -= 1
+        mb_left -= candidate['estimated_mb']
+    return admitted
+
+
+def plan_entity_runs(scheduler_config: dict, **context) -> list:
+    """
+    This method will build the candidates of all the scheduler entities with their staleness and estimated
+    export size, and admit the ones fitting the budget in the current time window.
+    Args:
+    Returns: list of TriggerDagRunOperator kwargs of the admitted entities
+    """
+    budget = scheduler_config['budget']
+    now = datetime.now(timezone.utc)
+    if not is_in_window(budget.get('windows', []), now):
+        log.info(f"{now} is outside of the migration windows {budget.get('windows')}")
+        return []
+
+    entity_configs = {entity_name: file_operations.load_schema_from_json(
+        f'redshift_migration_{entity_name}/{entity_name}-entity-config.json')
+        for entity_name in scheduler_config['entities']}
+    dag_ids = [get_migration_dag_id(entity_name) for entity_name in entity_configs]
+    history = get_run_history(scheduler_config['metrics_table_id'], dag_ids)
+    table_sizes = get_redshift_table_sizes(scheduler_config['aws'],
+                                           [entity_config['aws']['table_id'] for entity_config in
+                                            entity_configs.values()])
+    active_dag_ids = get_active_dag_ids(dag_ids)
+
+    candidates, active = [], []
+    for entity_name, entity_config in entity_configs.items():
+        dag_id = get_migration_dag_id(entity_name)
+        run_history = history.get(dag_id, {})
+        last_success_ts = run_history.get('last_success_ts')
+        staleness_hours = (now.timestamp() - last_success_ts) / 3600 if last_success_ts \
+            else NEVER_MIGRATED_STALENESS_HOURS
+        # Entity never exported yet will unload the whole table
+        last_export_bytes = run_history.get('last_export_bytes')
+        estimated_mb = last_export_bytes / 1024 ** 2 if last_export_bytes is not None \
+            else table_sizes.get(entity_config['aws']['table_id'], 0)
+        candidate = {'entity_name': entity_name, 'staleness_hours': staleness_hours, 'estimated_mb': estimated_mb}
+        (active if dag_id in active_dag_ids else candidates).append(candidate)
+
+    admitted = admit(candidates, budget, active)
+    log.info(f"Active entities: {active}, admitted entities: {admitted}")
+    return [{'trigger_dag_id': get_migration_dag_id(candidate['entity_name']),
+             'conf': {'scheduled_by': context['dag_run'].run_id,
+                      'staleness_hours': round(candidate['staleness_hours'], 1),
+                      'estimated_mb': round(candidate['estimated_mb'], 1)}}
+            for candidate in admitted]
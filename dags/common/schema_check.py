@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import json
+import logging
+import re
+
+from airflow.exceptions import AirflowFailException
+from airflow.models import Variable
+
+from common.lazy_imports import lazy_import
+from common.metrics import record_stage_metrics
+from common.s3_copier import list_export_objects
+
+BIGQUERY_ENDPOINT = 'https://bigquery.googleapis.com'
+
+requests = lazy_import('requests')
+s3 = lazy_import('airflow.providers.amazon.aws.hooks.s3')
+pa = lazy_import('pyarrow')
+pq = lazy_import('pyarrow.parquet')
+bigquery = lazy_import('google.cloud.bigquery')
+google_auth = lazy_import('google.auth')
+google_auth_requests = lazy_import('google.auth.transport.requests')
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+CHECK_EXPORT_SCHEMA_TASK_ID = "check_export_schema"
+FAIL = "fail"
+EVOLVE = "evolve"
+PARQUET_MAGIC = b'PAR1'
+# Tail read at once, the footer of the UNLOAD files is a few KB unless the table is very wide
+FOOTER_READ_BYTES = 64 * 1024
+TYPE_ALIASES = {'INT': 'INT64', 'INTEGER': 'INT64', 'BIGINT': 'INT64', 'SMALLINT': 'INT64', 'TINYINT': 'INT64',
+                'BYTEINT': 'INT64', 'FLOAT': 'FLOAT64', 'BOOLEAN': 'BOOL', 'DECIMAL': 'NUMERIC',
+                'BIGDECIMAL': 'BIGNUMERIC', 'RECORD': 'STRUCT'}
+# Coercions of ALTER COLUMN SET DATA TYPE, the export type the column can be widened to
+WIDENINGS = {'INT64': {'NUMERIC', 'BIGNUMERIC', 'FLOAT64'}, 'NUMERIC': {'BIGNUMERIC', 'FLOAT64'},
+             'BIGNUMERIC': {'FLOAT64'}}
+# Export types the Parquet load writes to another column type as they are
+LOADABLE = {('TIMESTAMP', 'DATETIME'), ('DATETIME', 'TIMESTAMP'), ('INT64', 'NUMERIC'), ('INT64', 'BIGNUMERIC'),
+            ('NUMERIC', 'BIGNUMERIC')}
+DDL_COLUMN_PATTERN = re.compile(r"^`?(\w+)`?\s+(\w+)(.*)$", re.DOTALL)
+
+
+def normalize_bq_type(bq_type: str) -> str:
+    # Legacy names and parameterized types, e.g. INTEGER or NUMERIC(38, 9), compare by their standard SQL name
+    base_type = re.match(r"\w+", bq_type.strip()).group(0).upper()
+    return TYPE_ALIASES.get(base_type, base_type)
+
+
+def get_bq_type(arrow_type: pa.DataType) -> str:
+    """
+    This method will return the BigQuery type the Parquet load writes the Arrow type of the export column to.
+    Args:
+    Returns: str
+    """
+    if pa.types.is_integer(arrow_type):
+        return 'INT64'
+    if pa.types.is_floating(arrow_type):
+        return 'FLOAT64'
+    if pa.types.is_boolean(arrow_type):
+        return 'BOOL'
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return 'STRING'
+    if pa.types.is_binary(arrow_type) or pa.types.is_large_binary(arrow_type) \
+            or pa.types.is_fixed_size_binary(arrow_type):
+        return 'BYTES'
+    if pa.types.is_timestamp(arrow_type):
+        return 'TIMESTAMP' if arrow_type.tz else 'DATETIME'
+    if pa.types.is_date(arrow_type):
+        return 'DATE'
+    if pa.types.is_time(arrow_type):
+        return 'TIME'
+    if pa.types.is_decimal(arrow_type):
+        return 'NUMERIC' if arrow_type.precision - arrow_type.scale <= 29 and arrow_type.scale <= 9 else 'BIGNUMERIC'
+    raise ValueError(f"Arrow type {arrow_type} has no BigQuery type")
+
+
+def read_parquet_footer_schema(s3_client, bucket: str, key: str, size: int) -> pa.Schema:
+    """
+    This method will read the Arrow schema from the Parquet footer of the S3 object by ranged GETs of its tail,
+    so only the footer is downloaded, not the data pages.
+    Args: size of the object in bytes
+    Returns: pa.Schema
+    """
+    def get_tail(length: int) -> bytes:
+        start = max(0, size - length)
+        return s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{size - 1}")['Body'].read()
+
+    tail = get_tail(FOOTER_READ_BYTES)
+    if tail[-4:] != PARQUET_MAGIC:
+        raise ValueError(f"s3://{bucket}/{key} isn't a Parquet file")
+    footer_length = int.from_bytes(tail[-8:-4], 'little')
+    if footer_length + 8 > len(tail):
+        tail = get_tail(footer_length + 8)
+    # The footer offsets are relative to the end of the file, so the footer alone reads as a Parquet file
+    return pq.read_schema(pa.BufferReader(PARQUET_MAGIC + tail[-(footer_length + 8):]))
+
+
+def parse_ddl_columns(ddl: str) -> dict:
+    """
+    This method will parse the column list of the CREATE TABLE statement, e.g. of sql/bq/<entity>_schema.sql.
+    Args:
+    Returns: dict of the lower case column name to dict with type and mode
+    """
+    definitions, current, depth, quote = [], [], 0, None
+    for char in ddl[ddl.index('(') + 1:]:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in '"\'':
+            quote = char
+        elif char in '(<':
+            depth += 1
+        elif char in ')>':
+            depth -= 1
+            if depth < 0:
+                break
+        elif char == ',' and depth == 0:
+            definitions.append(''.join(current))
+            current = []
+            continue
+        current.append(char)
+    definitions.append(''.join(current))
+
+    columns = {}
+    for definition in definitions:
+        match = DDL_COLUMN_PATTERN.match(definition.strip())
+        if match:
+            mode = 'REQUIRED' if re.search(r"\bNOT\s+NULL\b", match.group(3), re.IGNORECASE) else 'NULLABLE'
+            columns[match.group(1).lower()] = {'type': normalize_bq_type(match.group(2)), 'mode': mode}
+    return columns
+
+
+def compare_schemas(export_columns: dict, target_columns: dict) -> dict:
+    """
+    This method will compare the export columns with the target columns.
+    Args: export_columns dict of the column name to its BigQuery type, target_columns of parse_ddl_columns
+    Returns: dict with added and widened dicts of the column name to the export type and incompatible list
+    """
+    changes = {'added': {}, 'widened': {}, 'incompatible': []}
+    for name, export_type in export_columns.items():
+        target = target_columns.get(name.lower())
+        if target is None:
+            changes['added'][name] = export_type
+        elif export_type in WIDENINGS.get(target['type'], ()):
+            changes['widened'][name] = export_type
+        elif export_type != target['type'] and (export_type, target['type']) not in LOADABLE:
+            changes['incompatible'].append(f"{name} is {export_type} in the export and {target['type']} in the table")
+    exported = {name.lower() for name in export_columns}
+    changes['incompatible'].extend(f"{name} is REQUIRED in the table and isn't exported"
+                                   for name, target in target_columns.items()
+                                   if target['mode'] == 'REQUIRED' and name not in exported)
+    return changes
+
+
+def get_evolution_ddl(table_id: str, changes: dict) -> list:
+    """
+    This method will return the statements adding the new export columns, as NULLABLE since the rows loaded
+    before have none, and widening the changed ones.
+    Args: changes of compare_schemas
+    Returns: list of str
+    """
+    statements = []
+    if changes['added']:
+        statements.append(f"ALTER TABLE `{table_id}` " + ", ".join(
+            f"ADD COLUMN IF NOT EXISTS {name} {bq_type}" for name, bq_type in changes['added'].items()))
+    statements.extend(f"ALTER TABLE `{table_id}` ALTER COLUMN {name} SET DATA TYPE {bq_type}"
+                      for name, bq_type in changes['widened'].items())
+    return statements
+
+
+def __get_headers() -> dict:
+    credentials, _ = google_auth.default(scopes=["https://www.googleapis.com/auth/bigquery.readonly"])
+    credentials.refresh(google_auth_requests.Request())
+    return {'Accept': 'application/json', 'Authorization': 'Bearer ' + credentials.token}
+
+
+def __get_table(table_id: str, fields: str):
+    # Partial response of tables.get, so the freshness check doesn't download the schema of wide tables
+    project_id, dataset_id, table_name = table_id.split('.')
+    res = requests.get(f"{BIGQUERY_ENDPOINT}/bigquery/v2/projects/{project_id}/datasets/{dataset_id}/tables/"
+                       f"{table_name}", params={'fields': fields}, headers=__get_headers())
+    if res.status_code == 404:
+        return None
+    res.raise_for_status()
+    return res.json()
+
+
+def get_table_schema(table_id: str, cache_key: str):
+    """
+    This method will return the columns of the BigQuery table. The schema is cached in the Airflow Variable and
+    fetched again only if the table lastModifiedTime changed since, e.g. by a schema change.
+    Args: table_id project.dataset.table
+    Returns: dict like parse_ddl_columns or None if the table doesn't exist
+    """
+    table = __get_table(table_id, 'lastModifiedTime')
+    if table is None:
+        return None
+    cached = Variable.get(cache_key, default_var=None, deserialize_json=True)
+    if cached and cached['last_modified_time'] == table['lastModifiedTime']:
+        record_stage_metrics(schema_cache_hit=1)
+        return cached['columns']
+
+    table = __get_table(table_id, 'lastModifiedTime,schema')
+    columns = {field['name'].lower(): {'type': normalize_bq_type(field['type']),
+                                       'mode': field.get('mode', 'NULLABLE')}
+               for field in table['schema']['fields']}
+    Variable.set(cache_key, json.dumps({'last_modified_time': table['lastModifiedTime'], 'columns': columns}))
+    record_stage_metrics(schema_cache_hit=0)
+    return columns
+
+
+def check_export_schema(s3_bucket: str, s3_prefix: str, file_format: str, table_id: str, ddl: str,
+                        entity_name: str, on_mismatch: str = FAIL, aws_conn_id: str = 'aws_default') -> list:
+    """
+    This method will compare the schema of the first export file with the BigQuery table before the export is
+    transferred, so a changed Redshift column fails the run without paying for the transfer and the load. New
+    columns and widened numeric types are applied to the table if on_mismatch is evolve, otherwise the run fails
+    with the DDL to apply. The DDL of the entity is compared too, its drift is logged.
+    Args: ddl of sql/bq/<entity>_schema.sql, on_mismatch fail or evolve
+    Returns: list of the applied DDL statements
+    """
+    if on_mismatch not in (FAIL, EVOLVE):
+        raise ValueError(f"Schema mismatch handling {on_mismatch} isn't {FAIL} or {EVOLVE}")
+    s3_client = s3.S3Hook(aws_conn_id=aws_conn_id).get_conn()
+    export_files = [s3_object for s3_object in list_export_objects(s3_client, s3_bucket, s3_prefix)
+                    if s3_object['Key'].endswith(file_format) and s3_object['Size'] > 0]
+    if not export_files:
+        raise AirflowFailException(f"No {file_format} export files at s3://{s3_bucket}/{s3_prefix}")
+    schema = read_parquet_footer_schema(s3_client, s3_bucket, export_files[0]['Key'], export_files[0]['Size'])
+    export_columns = {field.name: get_bq_type(field.type) for field in schema}
+
+    ddl_columns = parse_ddl_columns(ddl)
+    ddl_changes = compare_schemas(export_columns, ddl_columns)
+    ddl_drift = get_evolution_ddl(table_id, ddl_changes) + ddl_changes['incompatible']
+    if ddl_drift:
+        log.warning(f"Schema DDL of {entity_name} doesn't match the export: {ddl_drift}")
+
+    table_columns = get_table_schema(table_id, f"{entity_name}-bq-schema")
+    changes = compare_schemas(export_columns, ddl_columns if table_columns is None else table_columns)
+    record_stage_metrics(columns=len(export_columns), added_columns=len(changes['added']),
+                         widened_columns=len(changes['widened']), ddl_drift=len(ddl_drift))
+    if changes['incompatible']:
+        raise AirflowFailException(f"Export schema isn't compatible with {table_id}: {changes['incompatible']}")
+
+    statements = get_evolution_ddl(table_id, changes)
+    if not statements:
+        log.info(f"Export schema of {len(export_columns)} columns matches {table_id}")
+        return []
+    if on_mismatch == FAIL:
+        raise AirflowFailException(f"Export schema has changed, apply to {table_id}: {';'.join(statements)}")
+    if table_columns is None:
+        raise AirflowFailException(f"Table {table_id} doesn't exist, update the schema DDL: {ddl_drift}")
+    bigquery.Client().query(";\n".join(statements)).result()
+    log.info(f"Schema of {table_id} is evolved: {statements}")
+    return statements
@@ -0,0 +1,359 @@
+import logging
+import re
+import time
+
+from airflow import DAG
+from airflow.exceptions import AirflowFailException
+from airflow.operators.python import PythonOperator
+from airflow.operators.python import ShortCircuitOperator
+from airflow.utils.task_group import TaskGroup
+
+from common import bq_data_operations
+from common import cost_planner
+from common import direct_transfer
+from common import file_operations
+from common import lazy_operators
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+SINK_GROUP_PREFIX = "sink_"
+SINK_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+CREATE_TABLE_PATTERN = re.compile(r"^(\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?)[`\w.-]+", re.IGNORECASE)
+
+
+def get_primary_sink(gcp_config: dict) -> dict:
+    """
+    This method will return the primary BigQuery destination of the entity, the table of the gcp section, in the
+    form of the sinks, so it's loaded by the same tasks.
+    Args: gcp_config gcp section of the entity config
+    Returns: dict with name, project, dataset_id, table_id and dataset_region_id
+    """
+    return {
+        'name': '',
+        'project': gcp_config['project'],
+        'dataset_id': gcp_config['dataset_id'],
+        'table_id': gcp_config['table_id'],
+        'dataset_region_id': gcp_config['dataset_region_id'],
+    }
+
+
+def get_sinks(gcp_config: dict) -> list:
+    """
+    This method will return the additional BigQuery destinations of the entity, the gcp sinks list. A sink needs a
+    name and a dataset_id, its project, table_id and dataset_region_id default to the ones of the primary sink.
+    Args: gcp_config gcp section of the entity config
+    Returns: list of dict with name, project, dataset_id, table_id and dataset_region_id
+    """
+    sinks = []
+    primary_sink = get_primary_sink(gcp_config)
+    table_ids = {bq_data_operations.get_full_table_id(primary_sink['project'], primary_sink['dataset_id'],
+                                                      primary_sink['table_id'])}
+    for sink_config in gcp_config.get('sinks', []):
+        sink = {
+            'name': sink_config.get('name', ''),
+            'project': sink_config.get('project', primary_sink['project']),
+            'dataset_id': sink_config['dataset_id'],
+            'table_id': sink_config.get('table_id', primary_sink['table_id']),
+            'dataset_region_id': sink_config.get('dataset_region_id', primary_sink['dataset_region_id']),
+        }
+        # The name is a part of the task ids of the sink
+        if not SINK_NAME_PATTERN.match(sink['name']):
+            raise ValueError(f"Sink name '{sink['name']}' isn't made of letters, digits, '_' or '-'")
+        if sink['name'] in {other['name'] for other in sinks}:
+            raise ValueError(f"Sink name {sink['name']} is used more than once")
+        table_id = bq_data_operations.get_full_table_id(sink['project'], sink['dataset_id'], sink['table_id'])
+        if table_id in table_ids:
+            raise ValueError(f"Table {table_id} of sink {sink['name']} is loaded by another sink")
+        table_ids.add(table_id)
+        sinks.append(sink)
+    return sinks
+
+
+def get_sink_table_sql(ddl: str, table_id: str) -> str:
+    """
+    This method will point the CREATE TABLE statement of the entity, sql/bq/<entity>_schema.sql, to the sink table,
+    so the sinks have the columns of the primary table in their own dataset and region.
+    Args: table_id project.dataset.table of the sink
+    Returns: str
+    """
+    sql, replaced = CREATE_TABLE_PATTERN.subn(lambda match: f"{match.group(1)}`{table_id}`", ddl, count=1)
+    if not replaced:
+        raise ValueError("Schema DDL doesn't start with CREATE TABLE")
+    return sql
+
+
+def validate_rows_number(sink_name: str, rows_task_id: str, files_rows_task_id: str, cost_planned: bool = False,
+                         fail_on_mismatch: bool = False, **context) -> bool:
+    """
+    This method will compare the rows loaded to the sink with the rows of the export, counted from the files or
+    written by the direct transfer if the run took the direct path.
+    Args: sink_name name of the sink, rows_task_id task querying the loaded rows, files_rows_task_id task counting
+    the rows of the export files, cost_planned if the validation can be skipped by the cost plan, fail_on_mismatch
+    fails the task instead of skipping the rest of the load
+    Returns: bool
+    """
+    ti = context['ti']
+    if cost_planned and cost_planner.is_planned_skip(ti, 'row_count'):
+        log.warning("Rows number validation is skipped by the cost plan")
+        return True
+    bq_num = ti.xcom_pull(task_ids=rows_task_id)
+    if ti.xcom_pull(task_ids=direct_transfer.CHOOSE_TRANSFER_PATH_TASK_ID) == direct_transfer.DIRECT_PATH:
+        files_num = ti.xcom_pull(task_ids=direct_transfer.DIRECT_TRANSFER_TASK_ID)
+    else:
+        files_num = ti.xcom_pull(task_ids=files_rows_task_id)
+    log.info(f"BQ {sink_name or 'primary'} inserted rows: {bq_num}, Parquet files total rows: {files_num}")
+    if fail_on_mismatch and str(bq_num) != str(files_num):
+        raise AirflowFailException(f"BQ {sink_name or 'primary'} rows {bq_num} don't match the files rows {files_num}")
+    return str(bq_num) == str(files_num)
+
+
+def validate_checksum(checksum_task_id: str, cost_planned: bool = False, fail_on_mismatch: bool = False,
+                      **context) -> bool:
+    """
+    This method will check the checksum of the rows loaded to the sink matches the one computed in Redshift.
+    Args: checksum_task_id task querying the checksums of the sink, cost_planned if the validation can be skipped by
+    the cost plan, fail_on_mismatch fails the task instead of skipping the rest of the load
+    Returns: bool
+    """
+    ti = context['ti']
+    if cost_planned and cost_planner.is_planned_skip(ti, 'checksum'):
+        log.warning("Checksum validation is skipped by the cost plan")
+        return True
+    checksum_matches = ti.xcom_pull(task_ids=checksum_task_id) == 'True'
+    if fail_on_mismatch and not checksum_matches:
+        raise AirflowFailException("BQ checksum doesn't match the Redshift one")
+    return checksum_matches
+
+
+def load_tasks(dag: DAG, entity_name: str, config: dict, sink: dict, export_datetime: str,
+               export_datetime_suffix: str, count_files_task, transfer_pre_execute=None, sensor_pre_execute=None,
+               validation_cost_budgets: dict = None, replace_export_rows: bool = False,
+               fail_on_mismatch: bool = False) -> tuple:
+    """
+    This method will add the tasks loading the export files of the run from GCS to the sink table with a DTS
+    transfer, validating the load against the rows of the files and promoting the staging table in staging mode.
+    The primary sink and the additional ones are loaded by these tasks, the ones of the additional sinks are added
+    in their task group.
+    Args: sink of get_primary_sink or get_sinks, export_datetime and export_datetime_suffix templates of the run,
+    count_files_task task counting the rows of the export files, transfer_pre_execute pre_execute hook of the
+    transfer tasks, sensor_pre_execute the one of the DTS run sensor, validation_cost_budgets budgets of the
+    validation queries, planned by the cost planner if set, replace_export_rows deletes the rows of the export
+    from the sink before an append load, fail_on_mismatch fails the validations instead of skipping the rest
+    Returns: tuple of the first task of the load, the first task of the validations and the last task
+    """
+    load_mode = config.get('load_mode', 'append')
+    gcp_config = config['gcp']
+    target_bq_table_sink = bq_data_operations.get_full_table_id(sink['project'], sink['dataset_id'],
+                                                                sink['table_id'])
+    load_table_id = f"{sink['table_id']}_staging_{export_datetime_suffix}" if load_mode == 'staging' \
+        else sink['table_id']
+    target_bq_table_load = bq_data_operations.get_full_table_id(sink['project'], sink['dataset_id'], load_table_id)
+    transfer_kwargs = {'pre_execute': transfer_pre_execute} if transfer_pre_execute else {}
+    sink_name = f" {sink['name']}" if sink['name'] else ""
+
+    create_bq_transfer = lazy_operators.lazy_operator(
+        task_id='create_bq_transfer',
+        operator=lazy_operators.BQ_CREATE_TRANSFER,
+        operator_kwargs={
+            'transfer_config': {
+                "destination_dataset_id": sink["dataset_id"],
+                "display_name": f"BQ {entity_name}{sink_name} import for {export_datetime}",
+                "data_source_id": "google_cloud_storage",
+                "schedule_options": {"disable_auto_scheduling": True},
+                "params": {
+                    "max_bad_records": "0",
+                    "skip_leading_rows": "0",
+                    "write_disposition": "MIRROR" if load_mode == 'staging' else "APPEND",
+                    "data_path_template": f"gs://{gcp_config['bucket']}/{gcp_config['path']}{export_datetime}/"
+                                          f"{gcp_config['file_prefix']}*{gcp_config['file_format']}",
+                    "destination_table_name_template": load_table_id,
+                    "file_format": "PARQUET"
+                },
+            },
+            'project_id': sink['project'],
+            'location': sink['dataset_region_id'],
+        },
+        **transfer_kwargs,
+        dag=dag
+    )
+    load_start = create_bq_transfer
+
+    if load_mode == 'staging':
+        # Recreated on every try, so a retried load overwrites the previous partial one
+        bq_create_staging_table = lazy_operators.lazy_operator(
+            task_id='bq_create_staging_table',
+            operator=lazy_operators.BQ_QUERY,
+            operator_kwargs={
+                'sql': file_operations.read_sql_file(
+                    f'redshift_migration_{entity_name}/sql/bq/create_staging_table.sql') % {
+                    'table_id': target_bq_table_sink,
+                    'staging_table_id': target_bq_table_load,
+                    'expiration_days': config.get('staging_expiration_days', 7),
+                },
+                'use_legacy_sql': False,
+                'location': sink['dataset_region_id'],
+            },
+            dag=dag)
+        bq_create_staging_table >> create_bq_transfer
+        load_start = bq_create_staging_table
+    elif replace_export_rows:
+        # Rows of the export appended by a previous try are deleted, so a retried load doesn't duplicate them
+        delete_export_rows = lazy_operators.lazy_operator(
+            task_id='delete_export_rows',
+            operator=lazy_operators.BQ_QUERY,
+            operator_kwargs={
+                'sql': f"DELETE FROM `{target_bq_table_sink}` WHERE export_datetime = '{export_datetime}'",
+                'use_legacy_sql': False,
+                'location': sink['dataset_region_id'],
+            },
+            dag=dag)
+        delete_export_rows >> create_bq_transfer
+        load_start = delete_export_rows
+
+    transfer_config_id_ = "{{ task_instance.xcom_pull(task_ids='%s', key='transfer_config_id') }}" \
+                          % create_bq_transfer.task_id
+
+    run_bq_transfer_job = lazy_operators.lazy_operator(
+        task_id='run_bq_transfer_job',
+        operator=lazy_operators.BQ_START_TRANSFER_RUNS,
+        operator_kwargs={
+            'location': sink['dataset_region_id'],
+            'transfer_config_id': transfer_config_id_,
+            'project_id': sink['project'],
+            'requested_run_time': {"seconds": int(time.time() + 60)},
+        },
+        **transfer_kwargs,
+        dag=dag
+    )
+
+    bq_transfer_job_succeeded = lazy_operators.lazy_sensor(
+        task_id='bq_transfer_job_succeeded',
+        sensor=lazy_operators.BQ_TRANSFER_RUN_SENSOR,
+        sensor_kwargs={
+            'location': sink['dataset_region_id'],
+            'run_id': "{{ task_instance.xcom_pull('%s', key='run_id') }}" % run_bq_transfer_job.task_id,
+            'transfer_config_id': transfer_config_id_,
+            'project_id': sink['project'],
+            'expected_statuses': 'SUCCEEDED',
+        },
+        **({'pre_execute': sensor_pre_execute} if sensor_pre_execute else {}),
+        dag=dag
+    )
+
+    sql_params = {'table_id': target_bq_table_load, 'export_datetime': export_datetime}
+    get_bq_total_rows_sql = file_operations.read_sql_file(
+        f'redshift_migration_{entity_name}/sql/bq/get_amount_of_inserted_rows.sql') % sql_params
+    bq_checksum_sql = file_operations.read_sql_file(
+        f'redshift_migration_{entity_name}/sql/bq/validate_{entity_name}_bq_checksum.sql') % sql_params
+    cost_planned = validation_cost_budgets is not None
+
+    get_bq_total_rows = PythonOperator(
+        task_id='get_bq_total_rows',
+        python_callable=cost_planner.run_planned_query if cost_planned else bq_data_operations.query_bq_single_value,
+        op_kwargs={'validation': 'row_count', 'sql': get_bq_total_rows_sql} if cost_planned
+        else {'sql': get_bq_total_rows_sql},
+        dag=dag)
+
+    # Load validations start with the cost plan if it's on
+    load_validations_start = get_bq_total_rows
+    if cost_planned:
+        plan_validations = PythonOperator(
+            task_id=cost_planner.PLAN_VALIDATIONS_TASK_ID,
+            python_callable=cost_planner.plan_validations,
+            op_kwargs={
+                'validations': {
+                    'row_count': {'sql': get_bq_total_rows_sql},
+                    'checksum': {'sql': bq_checksum_sql, 'sample': True},
+                    'watermark': {'sql': bq_data_operations.get_latest_load_ts_sql(
+                        target_bq_table_sink, config['ts_incremental_column_name']), 'required': True},
+                },
+                'budgets': validation_cost_budgets,
+            },
+            dag=dag)
+        plan_validations >> get_bq_total_rows
+        load_validations_start = plan_validations
+
+    validate_rows_number_equal = ShortCircuitOperator(
+        task_id='validate_rows_number_equal',
+        python_callable=validate_rows_number,
+        op_kwargs={'sink_name': sink['name'], 'rows_task_id': get_bq_total_rows.task_id,
+                   'files_rows_task_id': count_files_task.task_id, 'cost_planned': cost_planned,
+                   'fail_on_mismatch': fail_on_mismatch},
+        dag=dag
+    )
+
+    compare_redshift_checksum_with_bq = PythonOperator(
+        task_id='compare_redshift_checksum_with_bq',
+        python_callable=cost_planner.run_planned_query if cost_planned else bq_data_operations.query_bq_single_value,
+        op_kwargs={'validation': 'checksum', 'sql': bq_checksum_sql,
+                   'sample_percent': validation_cost_budgets.get('sample_percent',
+                                                                 cost_planner.DEFAULT_BUDGETS['sample_percent'])}
+        if cost_planned else {'sql': bq_checksum_sql},
+        dag=dag)
+
+    validate_checksum_equal = ShortCircuitOperator(
+        task_id='validate_checksum',
+        python_callable=validate_checksum,
+        op_kwargs={'checksum_task_id': compare_redshift_checksum_with_bq.task_id, 'cost_planned': cost_planned,
+                   'fail_on_mismatch': fail_on_mismatch},
+        dag=dag
+    )
+
+    create_bq_transfer >> run_bq_transfer_job >> bq_transfer_job_succeeded >> load_validations_start
+    [count_files_task, get_bq_total_rows] >> validate_rows_number_equal >> compare_redshift_checksum_with_bq >> \
+    validate_checksum_equal
+
+    load_validated = validate_checksum_equal
+    if load_mode == 'staging':
+        # Validated rows of the export replace the ones of the same export_datetime at the sink in a single transaction
+        promote_staging_table = lazy_operators.lazy_operator(
+            task_id='promote_staging_table',
+            operator=lazy_operators.BQ_QUERY,
+            operator_kwargs={
+                'sql': file_operations.read_sql_file(
+                    f'redshift_migration_{entity_name}/sql/bq/promote_staging_table.sql') % {
+                    'table_id': target_bq_table_sink,
+                    'staging_table_id': target_bq_table_load,
+                    'export_datetime': export_datetime,
+                },
+                'use_legacy_sql': False,
+                'location': sink['dataset_region_id'],
+            },
+            dag=dag)
+        validate_checksum_equal >> promote_staging_table
+        load_validated = promote_staging_table
+
+    return load_start, load_validations_start, load_validated
+
+
+def sink_tasks(dag: DAG, entity_name: str, config: dict, sink: dict, export_datetime: str,
+               export_datetime_suffix: str, count_files_task, transfer_pre_execute=None,
+               sensor_pre_execute=None, default_args: dict = None, **load_kwargs) -> TaskGroup:
+    """
+    This method will add the task group creating the table of an additional sink and loading it by load_tasks, the
+    same way the primary sink is loaded. The files are transferred from S3 and checked once, so the sinks only add a
+    DTS load and the BQ validation queries each.
+    Args: sink of get_sinks, export_datetime and export_datetime_suffix templates of the run, count_files_task task
+    counting the rows of the export files, transfer_pre_execute, sensor_pre_execute and load_kwargs the ones of
+    load_tasks, default_args of the sink tasks, e.g. the ones of the enclosing task group, which aren't inherited
+    Returns: TaskGroup of the sink
+    """
+    with TaskGroup(group_id=f"{SINK_GROUP_PREFIX}{sink['name']}", dag=dag, default_args=default_args) as sink_group:
+        bq_create_table = lazy_operators.lazy_operator(
+            task_id='bq_create_table',
+            operator=lazy_operators.BQ_QUERY,
+            operator_kwargs={
+                'sql': get_sink_table_sql(file_operations.read_sql_file(
+                    f'redshift_migration_{entity_name}/sql/bq/{entity_name}_schema.sql'),
+                    bq_data_operations.get_full_table_id(sink['project'], sink['dataset_id'], sink['table_id'])),
+                'use_legacy_sql': False,
+                'location': sink['dataset_region_id'],
+            },
+            dag=dag)
+        load_start, _, _ = load_tasks(dag, entity_name, config, sink, export_datetime, export_datetime_suffix,
+                                      count_files_task, transfer_pre_execute=transfer_pre_execute,
+                                      sensor_pre_execute=sensor_pre_execute, **load_kwargs)
+        bq_create_table >> load_start
+
+    return sink_group
@@ -0,0 +1,25 @@
+import logging
+
+from common import redshift
+from common.metrics import record_stage_metrics
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+UNLOAD_TASK_ID = "unload_to_s3"
+
+
+def unload_export(unload_sql: str, rows_sql: str, database: str, cluster_identifier: str, db_user: str,
+                  aws_conn_id: str = 'aws_default', policy: dict = None) -> int:
+    """
+    This method will run the UNLOAD and read its unloaded rows from stl_unload_log in the same batch, so the
+    count is a single submission with the UNLOAD and the export rows are known before the files are transferred.
+    Args: rows_sql of unload_rows_sum.sql
+    Returns: int unloaded rows
+    """
+    results = redshift.run_statements(redshift.get_client(aws_conn_id), [unload_sql, rows_sql], database,
+                                      cluster_identifier, db_user, policy)
+    rows = int(results[-1][0][0] or 0) if results[-1] else 0
+    record_stage_metrics(rows=rows)
+    log.info(f"{rows} rows are unloaded")
+    return rows
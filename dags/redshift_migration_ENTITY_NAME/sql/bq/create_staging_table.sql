@@ -0,0 +1,2 @@
+CREATE OR REPLACE TABLE `%(staging_table_id)s` LIKE `%(table_id)s`
+    OPTIONS (expiration_timestamp = TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL %(expiration_days)s DAY));
@@ -0,0 +1,5 @@
+BEGIN TRANSACTION;
+DELETE FROM `%(table_id)s` WHERE export_datetime = '%(export_datetime)s';
+INSERT INTO `%(table_id)s` SELECT * FROM `%(staging_table_id)s`;
+COMMIT TRANSACTION;
+DROP TABLE IF EXISTS `%(staging_table_id)s`;
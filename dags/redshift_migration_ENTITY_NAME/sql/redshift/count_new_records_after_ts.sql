@@ -0,0 +1 @@
+SELECT count(*) as new_records FROM %(table_id)s WHERE %(column_name)s > '%(insert_time)s'
\ No newline at end of file
@@ -0,0 +1,7 @@
+SELECT (SELECT MIN(starttime) FROM stl_insert) <= '%(insert_time)s' AS in_log_retention,
+       (SELECT COUNT(*) FROM svv_table_info
+        WHERE "database" || '.' || "schema" || '.' || "table" = '%(table_id)s') > 0 AS table_found,
+       (SELECT COALESCE(SUM(i.rows), 0) FROM stl_insert i
+                JOIN svv_table_info t ON i.tbl = t.table_id
+        WHERE t."database" || '.' || t."schema" || '.' || t."table" = '%(table_id)s'
+          AND i.endtime > '%(insert_time)s') AS inserted_rows
\ No newline at end of file
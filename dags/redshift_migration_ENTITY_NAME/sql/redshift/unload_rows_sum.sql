@@ -0,0 +1 @@
+SELECT COALESCE(SUM(line_count), 0) AS unloaded_rows FROM stl_unload_log WHERE query = pg_last_query_id()
\ No newline at end of file
@@ -0,0 +1,18 @@
+import logging
+
+from airflow.utils.dates import days_ago
+
+from common import file_operations
+from common.backfill import create_dag
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+entity_name = "event"
+config = file_operations.load_schema_from_json(f'redshift_migration_{entity_name}/{entity_name}-entity-config.json')
+
+# Entities without the backfill section are migrated incrementally only
+if 'backfill' in config:
+    dag = create_dag(entity_name, config, days_ago(1))
+else:
+    log.info(f"Entity {entity_name} has no backfill config, the backfill DAG isn't created")
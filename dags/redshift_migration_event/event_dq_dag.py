@@ -3,6 +3,7 @@ import logging
 from airflow.utils.dates import days_ago
 
 from common import file_operations
+from common import polling
 from common.data_quality import create_dag
 
 logging.basicConfig(level=logging.INFO)
@@ -12,4 +13,4 @@ entity_name = "event"
 config = file_operations.load_schema_from_json(f'redshift_migration_{entity_name}/{entity_name}-entity-config.json')
 gcp_config = config['gcp']
 
-dag = create_dag(entity_name, gcp_config, days_ago(1))
+dag = create_dag(entity_name, gcp_config, days_ago(1), polling_policy=polling.get_polling_policy(config))
@@ -1,23 +1,33 @@
 import logging
-import time
-from datetime import timedelta, datetime
+from functools import partial
+from datetime import timedelta
 
 from airflow import DAG
+from airflow.models.baseoperator import chain
 from airflow.operators.python import PythonOperator
 from airflow.operators.python import ShortCircuitOperator
 from airflow.operators.trigger_dagrun import TriggerDagRunOperator
-from airflow.providers.amazon.aws.operators.redshift_data import RedshiftDataOperator
-from airflow.providers.amazon.aws.sensors.s3 import S3KeySensor
-from airflow.providers.google.cloud.operators.bigquery import BigQueryExecuteQueryOperator
-from airflow.providers.google.cloud.operators.bigquery_dts import BigQueryCreateDataTransferOperator, \
-    BigQueryDataTransferServiceStartTransferRunsOperator
-from airflow.providers.google.cloud.operators.cloud_storage_transfer_service import \
-    CloudDataTransferServiceS3ToGCSOperator
-from airflow.providers.google.cloud.sensors.bigquery_dts import BigQueryDataTransferServiceTransferRunSensor
 from airflow.utils.dates import days_ago
 
 from common import bq_data_operations
+from common import change_probe
+from common import checkpoints
+from common import checksum
+from common import compaction
+from common import direct_transfer
+from common import dq_results
 from common import file_operations
+from common import lazy_operators
+from common import local_dq
+from common import metrics
+from common import polling
+from common import profiling
+from common import s3_copier
+from common import scheduler
+from common import schema_check
+from common import sinks
+from common import unload
+from common.data_quality import get_configs_path, get_summary_table
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger()
@@ -27,15 +37,72 @@ config = file_operations.load_schema_from_json(f'redshift_migration_{entity_name
 gcp_config = config['gcp']
 target_bq_table_sink = bq_data_operations.get_full_table_id(gcp_config['project'], gcp_config['dataset_id'],
                                                             gcp_config['table_id'])
-dataset_region_id = gcp_config['dataset_region_id']
 aws_config = config['aws']
 ts_incremental_column_name = config['ts_incremental_column_name']
 run_dq_tests: bool = config['run_dq_tests']
+run_preload_dq_tests: bool = config.get('run_preload_dq_tests', False)
+verify_parquet_checksum: bool = config.get('verify_parquet_checksum', False)
+# The migration fails if a DQ dimension success ratio of the run is below its threshold, if the section is set
+dq_thresholds: dict = config.get('dq_thresholds')
+data_quality_dag_id = f'{entity_name}-data-quality-check'
+# Validation queries are dry run and run in full, sampled or skipped by the budgets if the section is set
+validation_cost_budgets: dict = config.get('validation_cost_budgets')
+# Small export files are merged before the checks and the load if the compaction section is set
+compaction_config: dict = config.get('compaction')
+# append loads the export straight to the sink, staging loads it to a per export table promoted after validation
+load_mode: str = config.get('load_mode', 'append')
+checkpoint_location = checkpoints.get_checkpoint_location(gcp_config)
+resume_incomplete_runs: bool = config.get('resume_incomplete_runs', True)
+# Batches of at most direct_transfer_max_rows new records are written to BQ directly, 0 turns the direct path off
+direct_transfer_max_rows: int = config.get('direct_transfer_max_rows', 0)
+# Tasks of the S3 path skip themselves when the direct path is chosen
+s3_path_choices = {direct_transfer.CHOOSE_TRANSFER_PATH_TASK_ID: direct_transfer.S3_PATH} \
+    if direct_transfer_max_rows else {}
+s3_path_pre_execute = partial(checkpoints.restore_chosen_stage, checkpoint_location=checkpoint_location,
+                              choices=s3_path_choices)
+# Exports of at most worker_copy_max_mb are copied from S3 to GCS by the worker, 0 always uses Storage Transfer Service
+worker_copy_max_mb: int = config.get('worker_copy_max_mb', 0)
+worker_copy_concurrency: int = config.get('worker_copy_concurrency', s3_copier.DEFAULT_MAX_CONCURRENCY)
+# Export objects already copied to GCS by a previous try of the export are skipped by the transfer
+skip_existing_objects: bool = config.get('skip_existing_objects', False)
+# The export schema is compared with the table before the transfer, mismatches fail the run or evolve the table
+export_schema_check: str = config.get('schema_check')
+# Pool shared by the UNLOADs of all the entities, sized by the migration scheduler
+redshift_unload_pool: str = config.get('redshift_unload_pool', scheduler.REDSHIFT_UNLOAD_POOL)
+polling_policy = polling.get_polling_policy(config)
+# metadata checks the new records by the Redshift system tables first, count runs the count query over the new range
+new_records_probe: str = config.get('new_records_probe', change_probe.COUNT)
+# Sensors poll by the rows estimated by the metadata probe or counted for the direct transfer
+batch_rows_task_id = change_probe.PROBE_TASK_ID if new_records_probe == change_probe.METADATA \
+    else polling.BATCH_ROWS_TASK_ID
+# Additional BigQuery destinations, each loaded and validated from the same GCS export files as the primary one
+bq_sinks = sinks.get_sinks(gcp_config)
+if bq_sinks and direct_transfer_max_rows:
+    raise ValueError(f"Direct transfer writes only the primary sink of {entity_name}, it can't be used with sinks")
+persist_run_metrics = partial(metrics.persist_run_summary, project_id=gcp_config['project'],
+                              dataset_id=gcp_config.get('metrics_dataset_id', gcp_config['dataset_id']))
 
 with DAG(
         dag_id=f'redshift-to-bq-{entity_name}-migration',
         start_date=days_ago(1),
-        default_args={'retries': 1, 'retry_delay': timedelta(minutes=5)},
+        default_args={'retries': 1, 'retry_delay': timedelta(minutes=5),
+                      # Stages completed by a previous run of the export are skipped, the rest still run after them
+                      'trigger_rule': 'none_failed',
+                      'pre_execute': partial(checkpoints.restore_stage, checkpoint_location=checkpoint_location),
+                      'on_success_callback': [metrics.emit_task_metrics,
+                                              partial(checkpoints.mark_stage_completed,
+                                                      checkpoint_location=checkpoint_location)],
+                      'on_failure_callback': metrics.emit_task_metrics},
+        on_success_callback=[persist_run_metrics,
+                             # Runs without new records end by design, runs with a failed validation are resumed
+                             partial(checkpoints.mark_run_completed, checkpoint_location=checkpoint_location,
+                                     gate_task_ids=('validate_table_has_new_records',))],
+        on_failure_callback=[persist_run_metrics,
+                             # Runs failed by the DQ results aren't resumed by the next run, the rest are
+                             partial(checkpoints.mark_run_failed, checkpoint_location=checkpoint_location,
+                                     validation_task_ids=(dq_results.GATE_DQ_RESULTS_TASK_ID,))],
+        # Profiles of the common callables are uploaded next to the export if profiling is on
+        params={profiling.PROFILE_LOCATION_PARAM: f"gs://{gcp_config['bucket']}/{gcp_config['path']}"},
         description=f'Redshift {entity_name} table DAG',
         schedule_interval=None,
         catchup=False,
@@ -44,15 +111,28 @@ with DAG(
     generate_export_datetime = PythonOperator(
         task_id='generate_export_datetime',
         provide_context=True,
-        python_callable=lambda: datetime.utcnow().isoformat(timespec="seconds"),
+        python_callable=checkpoints.get_export_datetime,
+        op_kwargs={'checkpoint_location': checkpoint_location, 'resume_incomplete_runs': resume_incomplete_runs},
         dag=dag)
 
     export_datetime = "{{ task_instance.xcom_pull('generate_export_datetime') }}"
+    export_datetime_suffix = "{{ task_instance.xcom_pull('generate_export_datetime') | replace('-', '') | " \
+                             "replace(':', '') | lower }}"
 
-    bq_create_table = BigQueryExecuteQueryOperator(
+    if load_mode == 'staging':
+        load_table_id = f"{gcp_config['table_id']}_staging_{export_datetime_suffix}"
+    else:
+        load_table_id = gcp_config['table_id']
+    target_bq_table_load = bq_data_operations.get_full_table_id(gcp_config['project'], gcp_config['dataset_id'],
+                                                                load_table_id)
+
+    bq_create_table = lazy_operators.lazy_operator(
         task_id='bq_create_table',
-        sql=f"/sql/bq/{entity_name}_schema.sql",
-        use_legacy_sql=False,
+        operator=lazy_operators.BQ_QUERY,
+        operator_kwargs={
+            'sql': file_operations.read_sql_file(f'redshift_migration_{entity_name}/sql/bq/{entity_name}_schema.sql'),
+            'use_legacy_sql': False,
+        },
         dag=dag)
 
     get_previous_insert_time = PythonOperator(
@@ -69,27 +149,54 @@ with DAG(
         dag=dag)
     previous_insert_time = "{{ti.xcom_pull(task_ids='get_previous_insert_time')}}"
 
-    check_if_table_has_new_records = RedshiftDataOperator(
-        task_id='check_if_table_has_new_records',
-        aws_conn_id='aws_default',
-        db_user='awsuser',
-        sql=file_operations.read_sql_file(
-            f'redshift_migration_{entity_name}/sql/redshift/new_records_exist_after_ts.sql')
-            % {'column_name': ts_incremental_column_name, 'insert_time': previous_insert_time,
-               'table_id': aws_config['table_id']},
-        database='dev',
-        cluster_identifier='<RS_CLUSTER_ID>',
-        return_sql_result=True,
-        dag=dag
-    )
+    new_records_sql_params = {'column_name': ts_incremental_column_name, 'insert_time': previous_insert_time,
+                              'table_id': aws_config['table_id']}
+    if new_records_probe == change_probe.METADATA:
+        # Scans the table only if the system tables don't cover the previous load
+        check_if_table_has_new_records = PythonOperator(
+            task_id=change_probe.PROBE_TASK_ID,
+            python_callable=change_probe.probe_new_records,
+            op_kwargs={
+                'metadata_sql': file_operations.read_sql_file(
+                    f'redshift_migration_{entity_name}/sql/redshift/new_records_metadata_probe.sql')
+                    % new_records_sql_params,
+                'exists_sql': file_operations.read_sql_file(
+                    f'redshift_migration_{entity_name}/sql/redshift/new_record_exists_after_ts.sql')
+                    % new_records_sql_params,
+                'database': 'dev',
+                'cluster_identifier': '<RS_CLUSTER_ID>',
+                'db_user': 'awsuser',
+            },
+            dag=dag)
+    else:
+        # Stops at the first new record, the batch is counted by count_new_records only if its size is needed
+        check_if_table_has_new_records = lazy_operators.lazy_operator(
+            task_id='check_if_table_has_new_records',
+            operator=lazy_operators.REDSHIFT_DATA,
+            operator_kwargs={
+                'aws_conn_id': 'aws_default',
+                'db_user': 'awsuser',
+                'sql': file_operations.read_sql_file(
+                    f'redshift_migration_{entity_name}/sql/redshift/new_record_exists_after_ts.sql')
+                    % new_records_sql_params,
+                'database': 'dev',
+                'cluster_identifier': '<RS_CLUSTER_ID>',
+                'return_sql_result': True,
+            },
+            dag=dag
+        )
 
 
     def validate_table_has_new_records_decide_which_path(**kwargs):
         response = kwargs['ti'].xcom_pull(task_ids='check_if_table_has_new_records')
+        if 'has_new_records' in response:
+            return response['has_new_records']
         records = response.get('Records', [])
 
+        # The existence query returns a row only if there are new records, checkpoints of the earlier runs keep
+        # the boolean of the count
         if records and isinstance(records[0], list) and isinstance(records[0][0], dict):
-            return records[0][0].get('booleanValue', False)
+            return records[0][0].get('booleanValue', True)
         return False
 
 
@@ -98,15 +205,23 @@ with DAG(
         python_callable=validate_table_has_new_records_decide_which_path
     )
 
-    unload_to_s3 = RedshiftDataOperator(
-        task_id='unload_to_s3',
-        aws_conn_id='aws_default',
-        db_user='awsuser',
-        sql=file_operations.read_sql_file(f'redshift_migration_{entity_name}/sql/redshift/unload_{entity_name}.sql')
-            % {'table_id': aws_config['table_id'], 'insert_time': previous_insert_time,
-               'export_datetime': export_datetime},
-        database='dev',
-        cluster_identifier='<RS_CLUSTER_ID>',
+    # The unloaded rows are counted from stl_unload_log in the same batch as the UNLOAD
+    unload_to_s3 = PythonOperator(
+        task_id=unload.UNLOAD_TASK_ID,
+        python_callable=unload.unload_export,
+        op_kwargs={
+            'unload_sql': file_operations.read_sql_file(
+                f'redshift_migration_{entity_name}/sql/redshift/unload_{entity_name}.sql')
+                % {'table_id': aws_config['table_id'], 'insert_time': previous_insert_time,
+                   'export_datetime': export_datetime},
+            'rows_sql': file_operations.read_sql_file(
+                f'redshift_migration_{entity_name}/sql/redshift/unload_rows_sum.sql'),
+            'database': 'dev',
+            'cluster_identifier': '<RS_CLUSTER_ID>',
+            'db_user': 'awsuser',
+        },
+        pool=redshift_unload_pool,
+        pre_execute=s3_path_pre_execute,
         dag=dag
     )
 
@@ -115,70 +230,130 @@ with DAG(
         return f"s3://{aws_config['bucket']}/{aws_config['path']}{export_datetime}/{aws_config['file_prefix']}*{aws_config['file_format']}"
 
 
-    s3_key_sensor = S3KeySensor(
+    s3_key_sensor = lazy_operators.lazy_sensor(
         task_id='s3_key_sensor',
-        bucket_key=get_s3_unload_files_wildcard(),
-        wildcard_match=True,
-        timeout=18 * 60 * 60,
-        poke_interval=120
+        sensor=lazy_operators.S3_KEY_SENSOR,
+        sensor_kwargs={'bucket_key': get_s3_unload_files_wildcard(), 'wildcard_match': True},
+        pre_execute=partial(polling.tune_sensor, metrics_table_id=metrics.get_run_metrics_table_id(gcp_config),
+                            policy=polling_policy, pre_execute=s3_path_pre_execute,
+                            batch_rows_task_id=batch_rows_task_id),
     )
 
     # create the Resource in Secret Manager. at the format .aws/secret-manager-credentials.example.json
-    create_s3_transfer_job = CloudDataTransferServiceS3ToGCSOperator(
+    create_s3_transfer_job = lazy_operators.lazy_operator(
         task_id='create_s3_transfer_job',
-        s3_bucket=aws_config['bucket'],
-        gcs_bucket=gcp_config['bucket'],
-        s3_path=aws_config['path'] + export_datetime,
-        gcs_path=gcp_config['path'] + export_datetime,
-        project_id=gcp_config['project'],
-        aws_conn_id="aws_default",
-        schedule=None,
-        transfer_options=dict(
-            deleteObjectsFromSourceAfterTransfer=True,
-            overwriteObjectsAlreadyExistingInSink=True
-        ),
-        description=f"S3 {entity_name} transfer for {export_datetime}"
+        operator=lazy_operators.S3_TO_GCS_TRANSFER,
+        operator_kwargs={
+            's3_bucket': aws_config['bucket'],
+            'gcs_bucket': gcp_config['bucket'],
+            's3_path': aws_config['path'] + export_datetime,
+            'gcs_path': gcp_config['path'] + export_datetime,
+            'project_id': gcp_config['project'],
+            'aws_conn_id': "aws_default",
+            'schedule': None,
+            'transfer_options': s3_copier.get_transfer_options(skip_existing_objects),
+            'description': f"S3 {entity_name} transfer for {export_datetime}",
+        },
+        pre_execute=partial(checkpoints.restore_chosen_stage, checkpoint_location=checkpoint_location,
+                            choices={**s3_path_choices, s3_copier.CHOOSE_COPY_METHOD_TASK_ID: s3_copier.STS_COPY}),
     )
-
-    create_bq_transfer = BigQueryCreateDataTransferOperator(
-        task_id='create_bq_transfer',
-        transfer_config={
-            "destination_dataset_id": gcp_config["dataset_id"],
-            "display_name": f"BQ {entity_name} import for {export_datetime}",
-            "data_source_id": "google_cloud_storage",
-            "schedule_options": {"disable_auto_scheduling": True},
-            "params": {
-                "max_bad_records": "0",
-                "skip_leading_rows": "0",
-                "write_disposition": "APPEND",
-                "data_path_template": f"gs://{gcp_config['bucket']}/{gcp_config['path']}{export_datetime}/{gcp_config['file_prefix']}*{gcp_config['file_format']}",
-                "destination_table_name_template": gcp_config["table_id"],
-                "file_format": "PARQUET"
+    s3_to_gcs_tasks = [create_s3_transfer_job]
+
+    if export_schema_check:
+        # Reads the Parquet footer of one export file, so a changed column fails before the transfer and the load
+        check_export_schema = PythonOperator(
+            task_id=schema_check.CHECK_EXPORT_SCHEMA_TASK_ID,
+            python_callable=schema_check.check_export_schema,
+            op_kwargs={
+                's3_bucket': aws_config['bucket'],
+                's3_prefix': f"{aws_config['path']}{export_datetime}/",
+                'file_format': aws_config['file_format'],
+                'table_id': target_bq_table_sink,
+                'ddl': file_operations.read_sql_file(
+                    f'redshift_migration_{entity_name}/sql/bq/{entity_name}_schema.sql'),
+                'entity_name': entity_name,
+                'on_mismatch': export_schema_check,
             },
-        }
-
-    )
-
-    transfer_config_id_ = "{{ task_instance.xcom_pull(task_ids='create_bq_transfer', key='transfer_config_id') }}"
-
-    run_bq_transfer_job = BigQueryDataTransferServiceStartTransferRunsOperator(
-        task_id='run_bq_transfer_job',
-        location=dataset_region_id,
-        transfer_config_id=transfer_config_id_,
-        project_id=gcp_config['project'],
-        requested_run_time={"seconds": int(time.time() + 60)},
-    )
-
-    bq_transfer_job_run_id = "{{ task_instance.xcom_pull('run_bq_transfer_job', key='run_id') }}"
-
-    bq_transfer_job_succeeded = BigQueryDataTransferServiceTransferRunSensor(
-        task_id='bq_transfer_job_succeeded',
-        location=dataset_region_id,
-        run_id=bq_transfer_job_run_id,
-        transfer_config_id=transfer_config_id_,
-        expected_statuses='SUCCEEDED'
-    )
+            pre_execute=s3_path_pre_execute,
+            dag=dag)
+
+    if worker_copy_max_mb:
+        choose_s3_copy_method = PythonOperator(
+            task_id=s3_copier.CHOOSE_COPY_METHOD_TASK_ID,
+            python_callable=s3_copier.choose_s3_copy_method,
+            op_kwargs={
+                's3_bucket': aws_config['bucket'],
+                's3_prefix': f"{aws_config['path']}{export_datetime}/",
+                'max_mb': worker_copy_max_mb,
+            },
+            pre_execute=s3_path_pre_execute,
+            dag=dag)
+
+        # Small exports skip the transfer job creation and polling overhead
+        copy_s3_export_to_gcs = PythonOperator(
+            task_id='copy_s3_export_to_gcs',
+            python_callable=s3_copier.copy_export_to_gcs,
+            op_kwargs={
+                's3_bucket': aws_config['bucket'],
+                's3_prefix': f"{aws_config['path']}{export_datetime}/",
+                'gcs_bucket': gcp_config['bucket'],
+                'gcs_prefix': f"{gcp_config['path']}{export_datetime}/",
+                'max_concurrency': worker_copy_concurrency,
+                'skip_existing': skip_existing_objects,
+            },
+            pre_execute=partial(checkpoints.restore_chosen_stage, checkpoint_location=checkpoint_location,
+                                choices={**s3_path_choices,
+                                         s3_copier.CHOOSE_COPY_METHOD_TASK_ID: s3_copier.WORKER_COPY}),
+            dag=dag)
+        s3_to_gcs_tasks.append(copy_s3_export_to_gcs)
+
+    # Stages run after the export files got to GCS and before they are loaded to BQ
+    pre_load_checks = []
+
+    if compaction_config is not None:
+        compact_export_files = PythonOperator(
+            task_id=compaction.COMPACT_EXPORT_TASK_ID,
+            python_callable=compaction.compact_export,
+            op_kwargs={
+                'bucket_name': f"{gcp_config['bucket']}",
+                'prefix': f"{gcp_config['path']}{export_datetime}/{gcp_config['file_prefix']}",
+                'file_format': gcp_config['file_format'],
+                'small_file_mb': compaction_config.get('small_file_mb', compaction.DEFAULT_SMALL_FILE_MB),
+                'target_file_mb': compaction_config.get('target_file_mb', compaction.DEFAULT_TARGET_FILE_MB),
+                'row_group_mb': compaction_config.get('row_group_mb', compaction.DEFAULT_ROW_GROUP_MB),
+            },
+            pre_execute=s3_path_pre_execute,
+            dag=dag)
+        pre_load_checks.append(compact_export_files)
+
+    if run_preload_dq_tests:
+        validate_preload_dq = ShortCircuitOperator(
+            task_id='validate_preload_dq',
+            python_callable=local_dq.validate_export_dq,
+            op_kwargs={
+                'bucket_name': f"{gcp_config['bucket']}",
+                'prefix': f"{gcp_config['path']}{export_datetime}/{gcp_config['file_prefix']}",
+                'config_path': get_configs_path(gcp_config, entity_name),
+                'entity_name': entity_name,
+            },
+            pre_execute=s3_path_pre_execute,
+        )
+        pre_load_checks.append(validate_preload_dq)
+
+    if verify_parquet_checksum:
+        validate_parquet_checksum = ShortCircuitOperator(
+            task_id='validate_parquet_checksum',
+            python_callable=checksum.verify_export_checksums,
+            op_kwargs={
+                'bucket_name': f"{gcp_config['bucket']}",
+                'prefix': f"{gcp_config['path']}{export_datetime}/{gcp_config['file_prefix']}",
+            },
+            pre_execute=s3_path_pre_execute,
+        )
+        pre_load_checks.append(validate_parquet_checksum)
 
+    # The additional sinks load the export once it's checked, independently of the primary sink
+    export_checked = pre_load_checks[-1] if pre_load_checks else s3_to_gcs_tasks
 
     def handle_failure(**kwargs):
         # Here, you can put the logic for what should happen if the BigQuery data transfer job fails.
@@ -191,68 +366,120 @@ with DAG(
         python_callable=file_operations.calculate_total_rows,
         op_kwargs={
             'bucket_name': f"{gcp_config['bucket']}",
-            'prefix': f"{gcp_config['path']}{export_datetime}/{gcp_config['file_prefix']}"
+            'prefix': f"{gcp_config['path']}{export_datetime}/{gcp_config['file_prefix']}",
+            'compaction_task_id': compaction.COMPACT_EXPORT_TASK_ID if compaction_config is not None else None,
         },
         execution_timeout=timedelta(minutes=10),  # Increase timeout to 10 minutes
+        pre_execute=s3_path_pre_execute,
     )
 
-    get_bq_total_rows = PythonOperator(
-        task_id='get_bq_total_rows',
-        provide_context=True,
-        python_callable=bq_data_operations.query_bq_single_value,
-        op_kwargs=
-        {
-            'sql': file_operations.read_sql_file(
-                f'redshift_migration_{entity_name}/sql/bq/get_amount_of_inserted_rows.sql') % {
-                       'table_id': target_bq_table_sink,
-                       'export_datetime': export_datetime
-                   }
-        },
-        dag=dag)
-
-
-    def validate_amount_is_eq(**kwargs):
-        ti = kwargs['ti']
-        bq_num = ti.xcom_pull(task_ids='get_bq_total_rows')
-        files_num = ti.xcom_pull(task_ids='count_files_total_rows')
-        log.info(f"BQ inserted rows: {bq_num}, Parquet files total rows: {files_num}")
-        return str(bq_num) == str(files_num)
-
-
-    validate_rows_number_equal = ShortCircuitOperator(
-        task_id='validate_rows_number_equal',
-        python_callable=validate_amount_is_eq
-    )
-
-    compare_redshift_checksum_with_bq = PythonOperator(
-        task_id='compare_redshift_checksum_with_bq',
-        provide_context=True,
-        python_callable=bq_data_operations.query_bq_single_value,
-        op_kwargs=
-        {
-            'sql': file_operations.read_sql_file(
-                f'redshift_migration_{entity_name}/sql/bq/validate_{entity_name}_bq_checksum.sql')
-                   % {'table_id': target_bq_table_sink, 'export_datetime': export_datetime},
-        },
-        dag=dag)
+    bq_transfer_sensor_pre_execute = partial(polling.tune_sensor,
+                                             metrics_table_id=metrics.get_run_metrics_table_id(gcp_config),
+                                             policy=polling_policy, pre_execute=s3_path_pre_execute,
+                                             batch_rows_task_id=batch_rows_task_id)
 
-    validate_checksum = ShortCircuitOperator(
-        task_id='validate_checksum',
-        provide_context=True,
-        python_callable=lambda **kwargs: kwargs['ti'].xcom_pull(task_ids='compare_redshift_checksum_with_bq') == 'True',
-    )
+    # The primary sink is loaded and validated by the same tasks as the additional ones, outside of a task group
+    load_start, load_validations_start, load_validated = sinks.load_tasks(
+        dag, entity_name, config, sinks.get_primary_sink(gcp_config), export_datetime, export_datetime_suffix,
+        count_files_total_rows, transfer_pre_execute=s3_path_pre_execute,
+        sensor_pre_execute=bq_transfer_sensor_pre_execute, validation_cost_budgets=validation_cost_budgets)
 
     trigger_data_quality_dag = TriggerDagRunOperator(
-        task_id='trigger_data_quality_dag',
-        trigger_dag_id=f'{entity_name}-data-quality-check',
+        task_id=dq_results.TRIGGER_DQ_TASK_ID,
+        trigger_dag_id=data_quality_dag_id,
+        conf={'export_datetime': export_datetime},
         wait_for_completion=True,
         dag=dag
     )
 
     generate_export_datetime >> bq_create_table >> get_previous_insert_time >> check_if_table_has_new_records >> \
-    validate_table_has_new_records >> unload_to_s3 >> s3_key_sensor >> create_s3_transfer_job >> create_bq_transfer >> \
-    run_bq_transfer_job >> bq_transfer_job_succeeded >> [count_files_total_rows, get_bq_total_rows] >> \
-    validate_rows_number_equal >> compare_redshift_checksum_with_bq >> validate_checksum
+    validate_table_has_new_records
+
+    if direct_transfer_max_rows:
+        count_new_records = lazy_operators.lazy_operator(
+            task_id='count_new_records',
+            operator=lazy_operators.REDSHIFT_DATA,
+            operator_kwargs={
+                'aws_conn_id': 'aws_default',
+                'db_user': 'awsuser',
+                'sql': file_operations.read_sql_file(
+                    f'redshift_migration_{entity_name}/sql/redshift/count_new_records_after_ts.sql')
+                    % {'column_name': ts_incremental_column_name, 'insert_time': previous_insert_time,
+                       'table_id': aws_config['table_id']},
+                'database': 'dev',
+                'cluster_identifier': '<RS_CLUSTER_ID>',
+                'return_sql_result': True,
+            },
+            # The exact count isn't needed if the metadata probe estimated the new records
+            pre_execute=partial(change_probe.skip_if_estimated, pre_execute=partial(
+                checkpoints.restore_stage, checkpoint_location=checkpoint_location)),
+            dag=dag
+        )
+
+        choose_transfer_path = PythonOperator(
+            task_id=direct_transfer.CHOOSE_TRANSFER_PATH_TASK_ID,
+            python_callable=direct_transfer.choose_transfer_path,
+            op_kwargs={'max_rows': direct_transfer_max_rows, 'probe_task_id': change_probe.PROBE_TASK_ID},
+            dag=dag)
+
+        # Reads the same SELECT the UNLOAD does and writes it to the load table without S3, GCS and DTS
+        direct_transfer_to_bq = PythonOperator(
+            task_id=direct_transfer.DIRECT_TRANSFER_TASK_ID,
+            python_callable=direct_transfer.transfer_redshift_to_bq,
+            op_kwargs={
+                'select_sql': direct_transfer.get_unload_select_sql(file_operations.read_sql_file(
+                    f'redshift_migration_{entity_name}/sql/redshift/unload_{entity_name}.sql')
+                    % {'table_id': aws_config['table_id'], 'insert_time': previous_insert_time,
+                       'export_datetime': export_datetime}),
+                'table_id': target_bq_table_load,
+                'database': 'dev',
+                'cluster_identifier': '<RS_CLUSTER_ID>',
+                'db_user': 'awsuser',
+            },
+            pool=redshift_unload_pool,
+            pre_execute=partial(checkpoints.restore_chosen_stage, checkpoint_location=checkpoint_location,
+                                choices={direct_transfer.CHOOSE_TRANSFER_PATH_TASK_ID: direct_transfer.DIRECT_PATH}),
+            dag=dag)
+
+        validate_table_has_new_records >> count_new_records >> choose_transfer_path >> [unload_to_s3,
+                                                                                        direct_transfer_to_bq]
+        direct_transfer_to_bq >> load_validations_start
+        if load_mode == 'staging':
+            # The staging table is created before the direct transfer writes it
+            load_start >> direct_transfer_to_bq
+    else:
+        validate_table_has_new_records >> unload_to_s3
+
+    unload_to_s3 >> s3_key_sensor
+    export_ready = s3_key_sensor
+    if export_schema_check:
+        export_ready = s3_key_sensor >> check_export_schema
+    if worker_copy_max_mb:
+        export_ready >> choose_s3_copy_method >> s3_to_gcs_tasks
+    else:
+        export_ready >> create_s3_transfer_job
+
+    chain(s3_to_gcs_tasks, *pre_load_checks, load_start)
+
+    # The files are counted once for all the sinks, while they are loaded
+    export_checked >> count_files_total_rows
+
+    for sink in bq_sinks:
+        export_checked >> sinks.sink_tasks(
+            dag, entity_name, config, sink, export_datetime, export_datetime_suffix, count_files_total_rows,
+            transfer_pre_execute=s3_path_pre_execute, sensor_pre_execute=bq_transfer_sensor_pre_execute)
 
     if run_dq_tests:
-        validate_checksum.set_downstream(trigger_data_quality_dag)
+        load_validated.set_downstream(trigger_data_quality_dag)
+        if dq_thresholds is not None:
+            gate_dq_results = PythonOperator(
+                task_id=dq_results.GATE_DQ_RESULTS_TASK_ID,
+                python_callable=dq_results.gate_dq_results,
+                op_kwargs={
+                    'summary_table': get_summary_table(gcp_config),
+                    'dq_dag_id': data_quality_dag_id,
+                    'dq_thresholds': dq_thresholds,
+                },
+                dag=dag
+            )
+            trigger_data_quality_dag >> gate_dq_results
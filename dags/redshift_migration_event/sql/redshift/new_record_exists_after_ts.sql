@@ -0,0 +1 @@
+SELECT 1 AS has_new FROM %(table_id)s WHERE %(column_name)s > '%(insert_time)s' LIMIT 1
\ No newline at end of file
@@ -1 +0,0 @@
-SELECT count(*) > 0 as has_new FROM %(table_id)s WHERE insert_time > '%(insert_time)s'
\ No newline at end of file
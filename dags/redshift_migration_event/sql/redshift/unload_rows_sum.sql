@@ -1 +1 @@
-SELECT sum(line_count) FROM stl_unload_log WHERE path like 's3://redshift-sample-data-d001/unload/event/%(export_datetime)s/%%'
\ No newline at end of file
+SELECT COALESCE(SUM(line_count), 0) AS unloaded_rows FROM stl_unload_log WHERE query = pg_last_query_id()
\ No newline at end of file
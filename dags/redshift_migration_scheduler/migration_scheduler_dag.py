@@ -0,0 +1,48 @@
+import logging
+from datetime import timedelta
+
+from airflow import DAG
+from airflow.operators.python import PythonOperator
+from airflow.operators.trigger_dagrun import TriggerDagRunOperator
+from airflow.utils.dates import days_ago
+
+from common import file_operations
+from common import scheduler
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+scheduler_config = file_operations.load_schema_from_json('redshift_migration_scheduler/migration-scheduler-config.json')
+
+with DAG(
+        dag_id='redshift-to-bq-migration-scheduler',
+        start_date=days_ago(1),
+        default_args={'retries': 1, 'retry_delay': timedelta(minutes=5)},
+        description='Admits Redshift entity migration runs within the cluster budget',
+        schedule_interval=scheduler_config.get('schedule_interval', '*/30 * * * *'),
+        catchup=False,
+        max_active_runs=1,
+        tags=['redshift-data-migration', 'beta-6.0'],
+) as dag:
+    sync_unload_pool = PythonOperator(
+        task_id='sync_unload_pool',
+        python_callable=scheduler.sync_unload_pool,
+        op_kwargs={
+            'max_concurrent_unloads': scheduler_config['budget']['max_concurrent_unloads'],
+            'pool_name': scheduler_config.get('pool', scheduler.REDSHIFT_UNLOAD_POOL),
+        },
+        dag=dag)
+
+    plan_entity_runs = PythonOperator(
+        task_id='plan_entity_runs',
+        python_callable=scheduler.plan_entity_runs,
+        op_kwargs={'scheduler_config': scheduler_config},
+        dag=dag)
+
+    trigger_entity_runs = TriggerDagRunOperator.partial(
+        task_id='trigger_entity_runs',
+        wait_for_completion=False,
+        dag=dag
+    ).expand_kwargs(plan_entity_runs.output)
+
+    sync_unload_pool >> plan_entity_runs
@@ -0,0 +1,9 @@
+SELECT dag_id,
+       UNIX_SECONDS(MAX(IF(state = 'success', start_date, NULL))) AS last_success_ts,
+       ARRAY_AGG((SELECT CAST(JSON_VALUE(s.metrics, '$.count_files_total_rows.bytes') AS INT64)
+                  FROM UNNEST(stages) s
+                  WHERE s.stage = 'count_files_total_rows') IGNORE NULLS
+                 ORDER BY start_date DESC LIMIT 1)[SAFE_OFFSET(0)] AS last_export_bytes
+FROM `%(metrics_table_id)s`
+WHERE dag_id IN (%(dag_ids)s)
+GROUP BY dag_id
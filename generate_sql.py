@@ -1,10 +1,17 @@
 import argparse
 import json
-import time
+import os
+import sys
 
 import boto3
 
+# Redshift Data API helpers shared with the DAGs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dags'))
+from common import redshift  # noqa: E402
+
 INSERT_TIME_COLUMN = "insert_time"
+# Column the unload adds to every row with the export it belongs to
+EXPORT_DATETIME_COLUMN = "export_datetime"
 
 with open('.secrets/credentials.json') as json_file:
     config = json.load(json_file)
@@ -30,42 +37,25 @@ def get_redshift_columns(table_name):
             WHERE table_schema = '{schema_name}'
             AND table_name   = '{table_name}'
         """
-    response = client.execute_statement(
-        ClusterIdentifier=cluster_id,
-        Database=database,
-        DbUser=db_user,
-        Sql=query
-    )
-
-    # Wait for the query to finish executing
-    while True:
-        status_response = client.describe_statement(Id=response['Id'])
-        status = status_response['Status']
-        if status in ['FAILED', 'FINISHED']:
-            break
-        time.sleep(1)  # wait before checking status again
-
-    if status == 'FAILED':
-        print("Failed to execute query:", status_response['Error'])
+    # Polls with backoff and pages the result of the wide tables
+    try:
+        records = redshift.run_statements(client, [query], database, cluster_id, db_user)[0]
+    except RuntimeError as e:
+        print("Failed to execute query:", e)
         return
 
-    # Fetch the result of the query
-    result_response = client.get_statement_result(Id=response['Id'])
-    return [{"name": record[0]["stringValue"], "type": record[1]["stringValue"]} for record in
-            result_response['Records']]
-
+    return [{"name": name, "type": data_type} for name, data_type in records]
 
-def get_bq_sql(columns_list, table_name, timestamp_column):
-    bq_schema_name = config['BQ_DATASET']
-    bq_project = config['GCP_PROJECT']
 
+def get_bq_sql(columns_list, export_column=EXPORT_DATETIME_COLUMN):
     cols_concat = " || ', ' || ".join(
         f"CASE WHEN {column['name']} THEN 'true' ELSE 'false' END" if column['type'] == 'boolean'
         else f"COALESCE(CAST({column['name']} AS STRING), '')"
         for column in columns_list)
     equal_checksum_column = f"TO_HEX(MD5({cols_concat})) = checksum as equal_checksum"
-    return f"SELECT {equal_checksum_column} FROM `{bq_project}.{bq_schema_name}.{table_name}` " \
-           f"WHERE {timestamp_column} = '%(export_datetime)s'"
+    # The DAG formats in the table the export is loaded to, e.g. the staging table of the staging load mode
+    return f"SELECT {equal_checksum_column} FROM `%(table_id)s` " \
+           f"WHERE {export_column} = '%(export_datetime)s'"
 
 
 def get_redshift_select_sql(columns_list, table_name, timestamp_column):
@@ -90,7 +80,9 @@ def create_select_statements(table_name, timestamp_column):
     contains_timestamp_column = any(entry.get('name') == timestamp_column for entry in columns_list)
     if contains_timestamp_column:
         redshift_sql = get_redshift_select_sql(columns_list, table_name, timestamp_column)
-        bq_sql = get_bq_sql(columns_list, table_name, timestamp_column)
+        # The timestamp column only bounds the unloaded rows, the BQ rows of an export are found by the
+        # export_datetime column the unload adds to them
+        bq_sql = get_bq_sql(columns_list, EXPORT_DATETIME_COLUMN)
         return {"bq": bq_sql, "redshift": redshift_sql}
     else:
         print(f"{timestamp_column} is missing at the table columns list!")
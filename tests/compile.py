@@ -1,6 +1,7 @@
 import argparse
 import logging
 import os
+from string import Template
 
 import yaml
 
@@ -13,6 +14,12 @@ ENVIRONMENTS_FILENAME = "environments.yaml"
 RULE_DIMENSIONS_FILENAME = "rule_dimensions.yaml"
 ROW_FILTERS_FILENAME = "row_filters.yaml"
 
+# On-demand pricing of the estimated rule costs
+PRICE_PER_TIB_USD = 6.25
+
+# Row filter which is rendered by the DQ DAG to the export_datetime of the triggering migration run
+EXPORT_BATCH_ROW_FILTER_ID = "EXPORT_BATCH"
+
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger()
 
@@ -61,19 +68,95 @@ def load_generic_config(filename):
             raise exc
 
 
-def main(yaml_file, compiled_directory, environment):
+def get_rule_scan_sql(rule, column, rule_args, table_id, filter_sql_expr):
+    # Bytes BigQuery bills depend on the referenced columns only, so the failed rows count is enough to estimate
+    params = rule.get('params', {})
+    substitutions = dict(rule_args, column=column)
+    data = f"SELECT * FROM `{table_id}` WHERE {filter_sql_expr}"
+    if rule['rule_type'] == 'CUSTOM_SQL_STATEMENT':
+        statement = Template(params['custom_sql_statement']).safe_substitute(substitutions)
+        return f"WITH data AS ({data}) SELECT COUNT(*) FROM ({statement})"
+    if rule['rule_type'] == 'CUSTOM_SQL_EXPR':
+        expr = Template(params['custom_sql_expr']).safe_substitute(substitutions)
+        return f"WITH data AS ({data}) SELECT COUNTIF(NOT COALESCE(({expr}), FALSE)) FROM data"
+    return f"WITH data AS ({data}) SELECT COUNTIF({column} IS NULL) FROM data"
+
+
+def estimate_rule_costs(yaml_data, dataset):
+    from google.cloud import bigquery
+
+    client = bigquery.Client()
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    estimates = []
+    for binding_id, binding in yaml_data.get('rule_bindings', {}).items():
+        table_id = f"{dataset}.{binding['entity_uri'].rstrip('/').split('/')[-1]}"
+        row_filter = yaml_data.get('row_filters', {}).get(binding.get('row_filter_id', 'NONE'), {})
+        for rule_id in binding['rule_ids']:
+            rule_name, rule_args = next(iter(rule_id.items())) if isinstance(rule_id, dict) else (rule_id, {})
+            sql = get_rule_scan_sql(yaml_data['rules'][rule_name], binding['column_id'], rule_args or {}, table_id,
+                                    row_filter.get('filter_sql_expr', 'True'))
+            try:
+                total_bytes = client.query(sql, job_config=job_config).total_bytes_processed or 0
+            except Exception as e:
+                log.warning(f"Rule binding {binding_id} rule {rule_name} can't be estimated: {e}")
+                total_bytes = None
+            estimates.append({'rule_binding_id': binding_id, 'rule_id': rule_name, 'bytes': total_bytes})
+
+    for estimate in estimates:
+        cost = f"${estimate['bytes'] / 1024 ** 4 * PRICE_PER_TIB_USD:.4f}" if estimate['bytes'] is not None else "n/a"
+        log.info(f"Rule binding {estimate['rule_binding_id']} rule {estimate['rule_id']}: "
+                 f"{estimate['bytes']} bytes, {cost}")
+    total_bytes = sum(estimate['bytes'] or 0 for estimate in estimates)
+    log.info(f"Total: {total_bytes} bytes, ${total_bytes / 1024 ** 4 * PRICE_PER_TIB_USD:.4f} per full run")
+    return estimates
+
+
+def split_rule_bindings(rule_bindings, shards, weights=None):
+    # Longest first greedy balancing, the heaviest binding goes to the lightest shard
+    weights = weights or {binding_id: len(binding['rule_ids']) for binding_id, binding in rule_bindings.items()}
+    loads = [[0, shard, {}] for shard in range(shards)]
+    for binding_id in sorted(rule_bindings, key=lambda binding_id: (-weights.get(binding_id, 0), binding_id)):
+        lightest = min(loads)
+        lightest[0] += weights.get(binding_id, 0)
+        lightest[2][binding_id] = rule_bindings[binding_id]
+    return [bindings for _, _, bindings in sorted(loads, key=lambda load: load[1])]
+
+
+def write_shards(yaml_data, output_yaml_filename, shards, weights=None):
+    for shard, rule_bindings in enumerate(split_rule_bindings(yaml_data.get('rule_bindings', {}), shards, weights)):
+        if not rule_bindings:
+            log.warning(f"Shard {shard} has no rule bindings, use fewer shards")
+        shard_filename = get_shard_filename(output_yaml_filename, shard)
+        with open(shard_filename, 'w') as outfile:
+            yaml.dump(dict(yaml_data, rule_bindings=rule_bindings), outfile, default_flow_style=False)
+            log.info(f"File {shard_filename} of {len(rule_bindings)} rule bindings created.")
+
+
+def main(yaml_file, compiled_directory, environment, incremental=False, estimate_cost_dataset=None, shards=1):
     yaml_data = load_yaml(yaml_file)
 
     yaml_data = add_common_rules(yaml_data)
     yaml_data = set_environment(environment, yaml_data)
     yaml_data = set_dimensions(yaml_data)
     yaml_data = set_row_filters(yaml_data)
+    if incremental:
+        yaml_data = set_export_batch_row_filter(yaml_data)
+
+    weights = None
+    if estimate_cost_dataset:
+        estimates = estimate_rule_costs(yaml_data, estimate_cost_dataset)
+        # Shards are balanced by the estimated bytes of their rules instead of the rules count
+        weights = {}
+        for estimate in estimates:
+            weights[estimate['rule_binding_id']] = weights.get(estimate['rule_binding_id'], 0) + (estimate['bytes'] or 0)
 
     output_yaml_filename = get_output_filename(compiled_directory, yaml_file, environment)
     os.makedirs(os.path.dirname(output_yaml_filename), exist_ok=True)
     with open(output_yaml_filename, 'w') as outfile:
         yaml.dump(yaml_data, outfile, default_flow_style=False)
         log.info(f"File {output_yaml_filename} created.")
+    if shards > 1:
+        write_shards(yaml_data, output_yaml_filename, shards, weights)
 
 
 def load_yaml(yaml_filename):
@@ -114,6 +197,14 @@ def set_row_filters(yaml_data):
     return __add_property(filename, yaml_data, 'row_filters')
 
 
+def set_export_batch_row_filter(yaml_data):
+    for binding_name, binding_value in yaml_data.get('rule_bindings', {}).items():
+        if binding_value.get('row_filter_id') == 'NONE':
+            log.info(f"Rule binding {binding_name} is scoped to the {EXPORT_BATCH_ROW_FILTER_ID} row filter")
+            binding_value['row_filter_id'] = EXPORT_BATCH_ROW_FILTER_ID
+    return yaml_data
+
+
 def __add_property(filename, yaml_data, property_name):
     property_data = load_generic_config(filename).get(property_name, {})
     if property_name not in yaml_data:
@@ -131,12 +222,24 @@ def get_output_filename(compiled_directory, yaml_file, environment):
     return output_yaml_file
 
 
+def get_shard_filename(output_yaml_filename, shard):
+    # Matches the shard configs path of the DQ DAG
+    return f"{os.path.splitext(output_yaml_filename)[0]}-shard{shard:02d}.yaml"
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Compile YAML file with external SQL.')
     parser.add_argument('yaml_file', type=str, help='Path to the YAML file at the templates directory')
     parser.add_argument('compiled_directory', type=str, default=COMPILED_DIR,
                         help='Directory where compiled YAML files are stored.')
     parser.add_argument('environment', type=str, help='Name of the environment to fetch configurations from.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Bind rules without a custom row filter to the export batch of the migration run.')
+
+    parser.add_argument('--estimate-cost', type=str, default=None, metavar='PROJECT.DATASET',
+                        help='Dry run every rule against the entity tables of the dataset and report its cost.')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='Also split the rule bindings into this many configs run as concurrent Dataplex jobs.')
 
     args = parser.parse_args()
-    main(args.yaml_file, args.compiled_directory, args.environment)
+    main(args.yaml_file, args.compiled_directory, args.environment, args.incremental, args.estimate_cost, args.shards)
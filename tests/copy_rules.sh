@@ -1,3 +1,5 @@
 rules_bucket='gs://dataplex-dq-rules-dev'
+# -c compares checksums, so unchanged compiled rules are not re-uploaded and keep the Dataplex task fingerprint.
+# -x keeps the per-run configs rendered by the DQ DAG.
 echo "Deploying rules to the rules bucket $rules_bucket"
-gsutil -o "GSUtil:parallel_process_count=1" -m rsync -r -d "$1" "${rules_bucket}"
+gsutil -o "GSUtil:parallel_process_count=1" -m rsync -c -r -d -x '^runs/' "$1" "${rules_bucket}"
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The DAG modules import common from the DAGs folder, the way Airflow puts it on the path
+DAGS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'dags'))
+EXAMPLES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'example'))
+sys.path.insert(0, DAGS_DIR)
@@ -0,0 +1,115 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from airflow.exceptions import AirflowFailException
+
+from common import backfill
+from common import file_operations
+from common import sinks
+from conftest import DAGS_DIR
+from test_migration_dag import get_config
+
+
+def test_history_is_split_into_windows_with_a_shorter_last_one():
+    windows = backfill.get_backfill_windows(datetime(2024, 1, 1), datetime(2024, 1, 18), 7)
+
+    assert windows == [(datetime(2024, 1, 1), datetime(2024, 1, 8)),
+                       (datetime(2024, 1, 8), datetime(2024, 1, 15)),
+                       (datetime(2024, 1, 15), datetime(2024, 1, 18))]
+
+
+def test_windows_cover_the_history_once():
+    windows = backfill.get_backfill_windows(datetime(2024, 1, 1, 12), datetime(2024, 3, 1), 10)
+
+    assert windows[0][0] == datetime(2024, 1, 1, 12) and windows[-1][1] == datetime(2024, 3, 1)
+    assert all(previous[1] == following[0] for previous, following in zip(windows, windows[1:]))
+
+
+def test_empty_history_has_no_windows():
+    assert backfill.get_backfill_windows(datetime(2024, 1, 1), datetime(2024, 1, 1), 7) == []
+
+
+@pytest.fixture
+def create_backfill_dag(monkeypatch):
+    monkeypatch.setattr(file_operations, 'dags_folder', DAGS_DIR)
+
+    def create(**overrides):
+        config = get_config(backfill={'start': '2024-01-01T00:00:00', 'end': '2024-01-15T00:00:00', 'window_days': 7},
+                            **overrides)
+        return backfill.create_dag('event', config, start_date=datetime(2024, 1, 1))
+
+    return create
+
+
+def test_append_window_replaces_its_rows_before_the_load(create_backfill_dag):
+    dag = create_backfill_dag()
+
+    delete_export_rows = dag.get_task('window_0001.delete_export_rows')
+    assert delete_export_rows.op_kwargs['operator_kwargs']['sql'] == \
+        "DELETE FROM `p.redshift_raw.event` WHERE export_datetime = '2024-01-15T00:00:00'"
+    assert delete_export_rows.upstream_task_ids == {'window_0001.create_s3_transfer_job'}
+    assert delete_export_rows.downstream_task_ids == {'window_0001.create_bq_transfer'}
+    transfer_params = dag.get_task('window_0001.create_bq_transfer').op_kwargs['operator_kwargs'][
+        'transfer_config']['params']
+    assert transfer_params['write_disposition'] == 'APPEND'
+    assert transfer_params['destination_table_name_template'] == 'event'
+
+
+def test_staging_window_is_promoted_after_its_validations(create_backfill_dag):
+    dag = create_backfill_dag(load_mode='staging')
+
+    assert 'window_0000.delete_export_rows' not in dag.task_ids
+    assert dag.get_task('window_0000.create_bq_transfer').op_kwargs['operator_kwargs']['transfer_config'][
+        'params']['destination_table_name_template'] == 'event_staging_20240108t000000'
+    promote_staging_table = dag.get_task('window_0000.promote_staging_table')
+    assert promote_staging_table.upstream_task_ids == {'window_0000.validate_checksum'}
+    assert promote_staging_table.downstream_task_ids == {'trigger_incremental_migration'}
+
+
+def test_windows_load_the_sinks(create_backfill_dag):
+    dag = create_backfill_dag(gcp={**get_config()['gcp'], 'sinks': [{'name': 'eu', 'dataset_id': 'redshift_eu'}]})
+
+    assert dag.get_task('window_0000.sink_eu.delete_export_rows').op_kwargs['operator_kwargs']['sql'] == \
+        "DELETE FROM `p.redshift_eu.event` WHERE export_datetime = '2024-01-08T00:00:00'"
+    assert dag.get_task('window_0000.sink_eu.validate_rows_number_equal').op_kwargs['files_rows_task_id'] == \
+        'window_0000.count_files_total_rows'
+    # Sink tasks of an empty window skip themselves and are checkpointed like the other window tasks
+    pre_execute = dag.get_task('window_0000.sink_eu.create_bq_transfer')._pre_execute_hook
+    assert pre_execute.func is backfill.restore_window_stage
+    assert pre_execute.keywords['check_task_id'] == 'window_0000.check_window_has_rows'
+    mark_stage_completed = dag.get_task('window_0000.sink_eu.get_bq_total_rows').on_success_callback[1]
+    assert mark_stage_completed.keywords['export_datetime'] == '2024-01-08T00:00:00'
+
+
+def test_window_validations_fail_the_backfill(create_backfill_dag):
+    dag = create_backfill_dag()
+
+    for task_id in ('window_0000.validate_rows_number_equal', 'window_0000.validate_checksum'):
+        assert dag.get_task(task_id).op_kwargs['fail_on_mismatch'] is True
+
+
+def window_context(xcom: dict) -> dict:
+    return {'ti': SimpleNamespace(xcom_pull=lambda task_ids: xcom.get(task_ids))}
+
+
+def test_window_with_matching_rows_is_validated():
+    context = window_context({'window_0000.get_bq_total_rows': 10, 'window_0000.count_files_total_rows': '10'})
+
+    assert sinks.validate_rows_number('', 'window_0000.get_bq_total_rows', 'window_0000.count_files_total_rows',
+                                      fail_on_mismatch=True, **context)
+
+
+def test_window_with_missing_rows_fails_the_backfill():
+    context = window_context({'window_0000.get_bq_total_rows': 9, 'window_0000.count_files_total_rows': 10})
+
+    with pytest.raises(AirflowFailException):
+        sinks.validate_rows_number('', 'window_0000.get_bq_total_rows', 'window_0000.count_files_total_rows',
+                                   fail_on_mismatch=True, **context)
+
+
+def test_window_with_different_checksum_fails_the_backfill():
+    context = window_context({'window_0000.compare_redshift_checksum_with_bq': 'False'})
+
+    with pytest.raises(AirflowFailException):
+        sinks.validate_checksum('window_0000.compare_redshift_checksum_with_bq', fail_on_mismatch=True, **context)
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import pyarrow as pa
+import pytest
+
+from common import bq_data_operations
+
+
+@pytest.fixture
+def query_result(monkeypatch):
+    table = pa.table({'dimension': ['VALIDITY', 'UNIQUENESS', 'TIMELINESS'], 'rules': [3, 2, 1]})
+    calls = {}
+
+    def to_arrow_iterable(bqstorage_client=None):
+        calls['bqstorage_client'] = bqstorage_client
+        return iter(table.to_batches(max_chunksize=2))
+
+    row_iterator = SimpleNamespace(total_rows=table.num_rows, to_arrow_iterable=to_arrow_iterable)
+    query_job = SimpleNamespace(result=lambda: row_iterator, total_bytes_processed=10, total_bytes_billed=20)
+    monkeypatch.setattr(bq_data_operations, 'bigquery',
+                        SimpleNamespace(Client=lambda: SimpleNamespace(query=lambda sql: query_job)))
+    monkeypatch.setattr(bq_data_operations, 'get_read_client', lambda: 'read_client')
+    monkeypatch.setattr(bq_data_operations, 'record_stage_metrics',
+                        lambda **metrics: calls.setdefault('stage_metrics', []).append(metrics))
+    return calls
+
+
+def test_result_is_streamed_by_the_row_iterator_with_the_read_client(query_result):
+    batches = list(bq_data_operations.query_bq_arrow_batches("SELECT 1"))
+
+    assert [batch.num_rows for batch in batches] == [2, 1]
+    assert query_result['bqstorage_client'] == 'read_client'
+    # Queries run by the helpers of other stages, e.g. sensors polling, don't overwrite the stage metrics
+    assert 'stage_metrics' not in query_result
+
+
+def test_job_stats(query_result):
+    job_stats = {}
+
+    list(bq_data_operations.query_bq_arrow_batches("SELECT 1", job_stats=job_stats))
+
+    assert job_stats == {'rows': 3, 'bytes_processed': 10, 'bytes_billed': 20}
+
+
+def test_columns_projection(query_result):
+    batches = list(bq_data_operations.query_bq_arrow_batches("SELECT 1", columns=['rules']))
+
+    assert [batch.schema.names for batch in batches] == [['rules'], ['rules']]
+
+
+def test_single_value_query_is_the_stage(query_result):
+    assert bq_data_operations.query_bq_single_value("SELECT 1") == 'VALIDITY'
+    assert query_result['stage_metrics'] == [{'rows': 3, 'bytes_processed': 10, 'bytes_billed': 20}]
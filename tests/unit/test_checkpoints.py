@@ -0,0 +1,122 @@
+from types import SimpleNamespace
+
+from airflow.exceptions import AirflowSkipException
+from airflow.operators.python import PythonOperator, ShortCircuitOperator
+
+from common import checkpoints
+
+
+def test_transfer_is_checkpointed_with_its_sensor():
+    assert checkpoints.get_checkpointed_task_ids('create_bq_transfer') == []
+    assert checkpoints.get_checkpointed_task_ids('run_bq_transfer_job') == []
+    assert checkpoints.get_checkpointed_task_ids('bq_transfer_job_succeeded') == [
+        'bq_transfer_job_succeeded', 'create_bq_transfer', 'run_bq_transfer_job']
+
+
+def test_grouped_transfer_is_checkpointed_with_its_sensor():
+    assert checkpoints.get_checkpointed_task_ids('sink_eu.bq_transfer_job_succeeded') == [
+        'sink_eu.bq_transfer_job_succeeded', 'sink_eu.create_bq_transfer', 'sink_eu.run_bq_transfer_job']
+    assert checkpoints.get_checkpointed_task_ids('s3_to_gcs') == ['s3_to_gcs']
+
+
+class FakeDag:
+    def __init__(self, tasks: dict):
+        self.tasks = tasks
+
+    def has_task(self, task_id: str) -> bool:
+        return task_id in self.tasks
+
+    def get_task(self, task_id: str):
+        return self.tasks[task_id]
+
+
+def task_instance(task_id: str, state: str, xcom=None) -> SimpleNamespace:
+    return SimpleNamespace(task_id=task_id, state=state, xcom_pull=lambda task_ids: xcom)
+
+
+def test_failed_validations():
+    dag = FakeDag({'validate_table_has_new_records': ShortCircuitOperator(task_id='validate_table_has_new_records',
+                                                                          python_callable=bool),
+                   'validate_checksum': ShortCircuitOperator(task_id='validate_checksum', python_callable=bool),
+                   'validate_rows_number_equal': ShortCircuitOperator(task_id='validate_rows_number_equal',
+                                                                      python_callable=bool),
+                   'get_bq_total_rows': PythonOperator(task_id='get_bq_total_rows', python_callable=bool)})
+    dag_run = SimpleNamespace(get_task_instances=lambda: [
+        task_instance('validate_table_has_new_records', 'success'),
+        task_instance('validate_rows_number_equal', 'success', True),
+        task_instance('validate_checksum', 'success'),
+        task_instance('get_bq_total_rows', 'success')])
+
+    assert checkpoints.get_failed_validations(dag_run, dag, ('validate_table_has_new_records',)) == [
+        'validate_checksum']
+
+
+def test_skipped_validation_isnt_failed():
+    dag = FakeDag({'validate_checksum': ShortCircuitOperator(task_id='validate_checksum', python_callable=bool)})
+    dag_run = SimpleNamespace(get_task_instances=lambda: [task_instance('validate_checksum', 'skipped')])
+
+    assert checkpoints.get_failed_validations(dag_run, dag) == []
+
+
+def test_failed_validation_is_resumed_only_on_request(tmp_path):
+    checkpoint_location = f"{tmp_path}/"
+    export_datetime = "2023-06-01T10:00:00"
+    stage_path = tmp_path / export_datetime
+    stage_path.mkdir()
+    for task_id in ('bq_transfer_job_succeeded', 'get_bq_total_rows'):
+        (stage_path / f"{task_id}.json").write_text('{"completed_at": "2023-06-01T10:05:00", "xcom": {}}')
+    dag = FakeDag({'validate_checksum': ShortCircuitOperator(task_id='validate_checksum', python_callable=bool)})
+    dag_run = SimpleNamespace(run_id='run', get_task_instances=lambda: [task_instance('validate_checksum', 'success')],
+                              get_task_instance=lambda task_id: task_instance(task_id, 'success', export_datetime))
+
+    checkpoints.mark_run_completed({'dag_run': dag_run, 'dag': dag}, checkpoint_location)
+
+    assert (stage_path / checkpoints.RUN_FAILED_MARKER).exists()
+    assert checkpoints.get_latest_incomplete_export(checkpoint_location) is None
+    assert checkpoints.get_export_datetime(checkpoint_location, dag_run=SimpleNamespace(conf={})) != export_datetime
+    assert checkpoints.get_export_datetime(checkpoint_location, dag_run=SimpleNamespace(
+        conf={'resume_export_datetime': export_datetime})) == export_datetime
+
+
+def restore(checkpoint_location: str, export_datetime: str, task) -> bool:
+    ti = SimpleNamespace(task_id=task.task_id, xcom_push=lambda key, value: None)
+    try:
+        checkpoints.restore_stage({'ti': ti, 'task': task}, checkpoint_location, export_datetime)
+    except AirflowSkipException:
+        return True
+    return False
+
+
+def test_resumed_run_queries_the_validations_again(tmp_path):
+    checkpoint_location = f"{tmp_path}/"
+    export_datetime = "2023-06-01T10:00:00"
+    (tmp_path / export_datetime).mkdir()
+    task_ids = ('bq_transfer_job_succeeded', 'count_files_total_rows', 'get_bq_total_rows',
+                'compare_redshift_checksum_with_bq', 'sink_eu.get_bq_total_rows')
+    for task_id in task_ids:
+        (tmp_path / export_datetime / f"{task_id}.json").write_text(
+            '{"completed_at": "2023-06-01T10:05:00", "xcom": {"return_value": 1}}')
+
+    restored = {task_id: restore(checkpoint_location, export_datetime,
+                                 PythonOperator(task_id=task_id, python_callable=bool)) for task_id in task_ids}
+
+    assert restored == {'bq_transfer_job_succeeded': True, 'count_files_total_rows': False,
+                        'get_bq_total_rows': False, 'compare_redshift_checksum_with_bq': False,
+                        'sink_eu.get_bq_total_rows': False}
+
+
+def test_run_failed_by_the_dq_gate_isnt_resumed(tmp_path):
+    checkpoint_location = f"{tmp_path}/"
+    export_datetime = "2023-06-01T10:00:00"
+    (tmp_path / export_datetime).mkdir()
+    (tmp_path / export_datetime / "unload_to_s3.json").write_text('{"completed_at": "", "xcom": {}}')
+
+    def dag_run(failed_task_id: str) -> SimpleNamespace:
+        return SimpleNamespace(run_id='run', get_task_instances=lambda: [task_instance(failed_task_id, 'failed')],
+                               get_task_instance=lambda task_id: task_instance(task_id, 'success', export_datetime))
+
+    checkpoints.mark_run_failed({'dag_run': dag_run('unload_to_s3')}, checkpoint_location, ('gate_dq_results',))
+    assert checkpoints.get_latest_incomplete_export(checkpoint_location) == export_datetime
+
+    checkpoints.mark_run_failed({'dag_run': dag_run('gate_dq_results')}, checkpoint_location, ('gate_dq_results',))
+    assert checkpoints.get_latest_incomplete_export(checkpoint_location) is None
@@ -0,0 +1,56 @@
+import hashlib
+from datetime import date, datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from common import checksum
+
+
+def redshift_md5(*values) -> str:
+    # MD5 of COALESCE(CAST(<column> AS VARCHAR), '') joined by ', ' as the unload SQL computes it
+    return hashlib.md5(', '.join(values).encode('utf-8')).hexdigest()
+
+
+def write_export(tmp_path, checksums: list) -> pq.ParquetFile:
+    table = pa.table({
+        'eventid': pa.array([1, 2, None], pa.int32()),
+        'eventname': ['Concert', None, 'Opera'],
+        'starttime': pa.array([datetime(2008, 1, 25, 14, 30), datetime(2008, 1, 26, 19, 0, 0, 500000),
+                               datetime(2008, 1, 27, 20, 0, 0, 123456)], pa.timestamp('us')),
+        'dateid': pa.array([date(2008, 1, 25), None, date(2008, 1, 27)], pa.date32()),
+        'featured': [True, False, None],
+        'export_datetime': pa.array([datetime(2024, 1, 1)] * 3, pa.timestamp('us')),
+        'checksum': checksums,
+    })
+    path = tmp_path / "event_000.parquet"
+    pq.write_table(table, path)
+    return pq.ParquetFile(path)
+
+
+EXPECTED_CHECKSUMS = [
+    redshift_md5('1', 'Concert', '2008-01-25 14:30:00', '2008-01-25', 'true'),
+    redshift_md5('2', '', '2008-01-26 19:00:00.5', '', 'false'),
+    redshift_md5('', 'Opera', '2008-01-27 20:00:00.123456', '2008-01-27', 'false'),
+]
+
+
+def test_checksum_columns_exclude_the_unload_columns(tmp_path):
+    parquet_file = write_export(tmp_path, EXPECTED_CHECKSUMS)
+
+    assert checksum.get_checksum_columns(parquet_file.schema_arrow) == \
+        ['eventid', 'eventname', 'starttime', 'dateid', 'featured']
+
+
+def test_unloaded_checksums_match(tmp_path):
+    report = checksum.verify_parquet_checksum(write_export(tmp_path, EXPECTED_CHECKSUMS))
+
+    assert report == {'rows': 3, 'mismatches': 0}
+
+
+def test_changed_rows_are_counted_in_every_batch(tmp_path):
+    checksums = [EXPECTED_CHECKSUMS[0], redshift_md5('corrupted'), None]
+
+    report = checksum.verify_parquet_checksum(write_export(tmp_path, checksums), batch_size=1)
+
+    assert report == {'rows': 3, 'mismatches': 2}
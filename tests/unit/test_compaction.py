@@ -0,0 +1,128 @@
+import os
+import shutil
+from types import SimpleNamespace
+
+import pyarrow as pa
+import pyarrow.fs as fs
+import pyarrow.parquet as pq
+import pytest
+
+from common import compaction
+from common import file_operations
+
+MB = 1024 ** 2
+PREFIX = 'path/2023-06-01T10:00:00/event_'
+
+
+def test_small_files_are_grouped_by_the_target_size_in_name_order():
+    files = [('f3', 40 * MB), ('f1', 40 * MB), ('f2', 40 * MB), ('f4', 10 * MB)]
+
+    assert compaction.plan_compaction(files, small_file_mb=64, target_file_mb=100) == [['f1', 'f2'], ['f3', 'f4']]
+
+
+def test_big_files_are_kept():
+    files = [('f1', 200 * MB), ('f2', 1 * MB), ('f3', 1 * MB)]
+
+    assert compaction.plan_compaction(files, small_file_mb=64, target_file_mb=512) == [['f2', 'f3']]
+
+
+def test_single_small_file_isnt_rewritten():
+    assert compaction.plan_compaction([('f1', 200 * MB), ('f2', 1 * MB)]) == []
+    assert compaction.plan_compaction([]) == []
+
+
+def test_file_over_the_target_starts_its_own_group():
+    files = [('f1', 30 * MB), ('f2', 60 * MB), ('f3', 30 * MB)]
+
+    assert compaction.plan_compaction(files, small_file_mb=64, target_file_mb=50) == [['f1'], ['f2'], ['f3']]
+
+
+class LocalBlob:
+    """google.cloud.storage blob of a file at the local bucket directory"""
+
+    def __init__(self, root: str, name: str):
+        self.name = name
+        self.path = os.path.join(root, name)
+        self.size = os.path.getsize(self.path) if os.path.exists(self.path) else None
+
+    def upload_from_string(self, data, content_type=None):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as file:
+            file.write(data)
+
+    def download_as_text(self) -> str:
+        with open(self.path) as file:
+            return file.read()
+
+    def download_to_filename(self, file_name: str):
+        shutil.copyfile(self.path, file_name)
+
+    def delete(self):
+        os.remove(self.path)
+
+
+class LocalBucket:
+    def __init__(self, root: str):
+        self.root = root
+
+    def blob(self, name: str) -> LocalBlob:
+        return LocalBlob(self.root, name)
+
+    def get_blob(self, name: str):
+        return LocalBlob(self.root, name) if os.path.exists(os.path.join(self.root, name)) else None
+
+
+@pytest.fixture
+def bucket(tmp_path, monkeypatch):
+    """Bucket b of the export at a local directory, for both the storage client and the pyarrow GCS file system"""
+    root = tmp_path / 'b'
+
+    def list_blobs(bucket_name: str, prefix: str):
+        names = sorted(os.path.relpath(os.path.join(directory, file_name), root)
+                       for directory, _, file_names in os.walk(root) for file_name in file_names)
+        return [LocalBlob(str(root), name) for name in names if name.startswith(prefix)]
+
+    client = SimpleNamespace(bucket=lambda name: LocalBucket(str(root)), list_blobs=list_blobs)
+    storage = SimpleNamespace(Client=lambda: client)
+    monkeypatch.setattr(compaction, 'storage', storage)
+    monkeypatch.setattr(file_operations, 'storage', storage)
+    monkeypatch.setattr(compaction.fs, 'GcsFileSystem',
+                        lambda: fs.SubTreeFileSystem(str(tmp_path), fs.LocalFileSystem()))
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    monkeypatch.chdir(work_dir)
+
+    for index, rows in enumerate([3, 5, 7]):
+        path = root / f'{PREFIX}{index:04d}_part_00.parquet'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(pa.table({'id': list(range(rows)), 'name': [f'n{i}' for i in range(rows)]}), str(path))
+    return root
+
+
+def test_compacted_export_rows_are_counted_by_the_manifest(bucket, monkeypatch):
+    rows = compaction.compact_export('b', PREFIX)
+
+    assert rows == 15
+    assert sorted(os.listdir(bucket / os.path.dirname(PREFIX))) == [compaction.MANIFEST_NAME,
+                                                                     'event_compacted_0000.parquet']
+    # The compacted files aren't read again by the count of the export files
+    monkeypatch.setattr(file_operations.pq, 'ParquetFile', lambda file_name: pytest.fail("File is read"))
+    ti = SimpleNamespace(xcom_pull=lambda task_ids: rows if task_ids == compaction.COMPACT_EXPORT_TASK_ID else None)
+
+    assert file_operations.calculate_total_rows('b', PREFIX, compaction_task_id=compaction.COMPACT_EXPORT_TASK_ID,
+                                                ti=ti) == 15
+
+
+def test_retried_compaction_returns_the_manifest_rows(bucket):
+    compaction.compact_export('b', PREFIX)
+
+    assert compaction.compact_export('b', PREFIX) == 15
+
+
+def test_files_are_counted_without_the_compaction(bucket):
+    ti = SimpleNamespace(xcom_pull=lambda task_ids: None)
+
+    assert file_operations.calculate_total_rows('b', PREFIX) == 15
+    # Compaction skipped, e.g. by the direct path, leaves no XCom
+    assert file_operations.calculate_total_rows('b', PREFIX, compaction_task_id=compaction.COMPACT_EXPORT_TASK_ID,
+                                                ti=ti) == 15
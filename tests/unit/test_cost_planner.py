@@ -0,0 +1,79 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from airflow.exceptions import AirflowSkipException
+
+from common import cost_planner
+from conftest import DAGS_DIR
+
+GB = 1024 ** 3
+
+
+def read_event_sql(file_name: str) -> str:
+    with open(os.path.join(DAGS_DIR, 'redshift_migration_event', 'sql', 'bq', file_name)) as sql_file:
+        return sql_file.read() % {'table_id': 'p.d.event', 'export_datetime': '2023-06-01T10:00:00'}
+
+
+def test_sampled_checksum_query():
+    sampled_sql = cost_planner.get_sampled_sql(read_event_sql('validate_event_bq_checksum.sql'), 5)
+
+    assert sampled_sql.startswith("SELECT COALESCE(LOGICAL_AND(equal_checksum), TRUE) AS equal_checksum FROM (SELECT")
+    assert "FROM `p.d.event` TABLESAMPLE SYSTEM (5 PERCENT)\nWHERE export_datetime = '2023-06-01T10:00:00')" \
+           in sampled_sql
+
+
+def test_sampled_query_with_a_lowercase_alias():
+    assert cost_planner.get_sampled_sql("select x = y as ok from `p.d.t` where a = 1;", 10) == \
+        "SELECT COALESCE(LOGICAL_AND(ok), TRUE) AS ok FROM (select x = y as ok from `p.d.t` TABLESAMPLE SYSTEM " \
+        "(10 PERCENT) where a = 1)"
+
+
+@pytest.mark.parametrize('sql', ["SELECT COUNT(*) FROM `p.d.t`", "SELECT 1 AS one FROM t"])
+def test_query_without_an_alias_and_a_table_cant_be_sampled(sql):
+    with pytest.raises(ValueError):
+        cost_planner.get_sampled_sql(sql, 10)
+
+
+@pytest.mark.parametrize('full_bytes, can_sample, strategy', [
+    (100 * GB, True, cost_planner.FULL),
+    (100 * GB + 1, True, cost_planner.SAMPLED),
+    (100 * GB + 1, False, cost_planner.SKIP),
+    # The 1 percent sample exceeds the 10 GB sampled budget
+    (1001 * GB, True, cost_planner.SKIP),
+])
+def test_strategy_by_the_budgets(full_bytes, can_sample, strategy):
+    assert cost_planner.choose_strategy(full_bytes, cost_planner.DEFAULT_BUDGETS, can_sample) == strategy
+
+
+def test_validations_planned_by_the_dry_run(monkeypatch):
+    estimates = {'row_count': 2 * GB, 'checksum': 50 * GB, 'watermark': 20 * GB}
+    metrics = {}
+    monkeypatch.setattr(cost_planner, 'estimate_query_bytes', lambda sql: estimates[sql])
+    monkeypatch.setattr(cost_planner, 'record_stage_metrics', lambda **stage_metrics: metrics.update(stage_metrics))
+
+    plan = cost_planner.plan_validations(
+        {'row_count': {'sql': 'row_count'}, 'checksum': {'sql': 'checksum', 'sample': True},
+         'watermark': {'sql': 'watermark', 'required': True}},
+        budgets={'full_max_gb': 10, 'sampled_max_gb': 5})
+
+    assert plan == {'row_count': cost_planner.FULL, 'checksum': cost_planner.SAMPLED,
+                    'watermark': cost_planner.FULL}
+    assert metrics == {'row_count_estimated_bytes': 2 * GB, 'checksum_estimated_bytes': 50 * GB,
+                       'watermark_estimated_bytes': 20 * GB}
+
+
+def test_planned_query(monkeypatch):
+    queries = []
+    monkeypatch.setattr(cost_planner, 'query_bq_single_value', lambda sql: queries.append(sql) or 'True')
+    ti = SimpleNamespace(xcom_pull=lambda task_ids: {'checksum': cost_planner.SAMPLED,
+                                                     'row_count': cost_planner.SKIP})
+    sql = read_event_sql('validate_event_bq_checksum.sql')
+
+    assert cost_planner.run_planned_query('checksum', sql, sample_percent=5, ti=ti) == 'True'
+    assert queries == [cost_planner.get_sampled_sql(sql, 5)]
+    with pytest.raises(AirflowSkipException):
+        cost_planner.run_planned_query('row_count', read_event_sql('get_amount_of_inserted_rows.sql'), ti=ti)
+    assert cost_planner.is_planned_skip(ti, 'row_count')
+    # Validations the plan doesn't have run in full
+    assert cost_planner.get_planned_strategy(ti, 'watermark') == cost_planner.FULL
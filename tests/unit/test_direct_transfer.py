@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+import pytest
+
+from common import direct_transfer
+from common import polling
+
+
+@pytest.mark.parametrize('value, micros', [
+    ('1970-01-01 00:00:00', 0),
+    ('2008-01-25 14:30:00', 1201271400000000),
+    ('2008-01-25T14:30:00.5', 1201271400500000),
+    ('2008-01-25 14:30:00.123456', 1201271400123456),
+    # timestamptz is converted to UTC
+    ('2008-01-25 16:30:00+02', 1201271400000000),
+    ('2008-01-25 09:00:00-05:30', 1201271400000000),
+    ('1969-12-31 23:59:59.999999', -1),
+])
+def test_redshift_timestamps_to_epoch_micros(value, micros):
+    assert direct_transfer.to_epoch_micros(value) == micros
+
+
+def test_unexpected_timestamp_format():
+    with pytest.raises(ValueError):
+        direct_transfer.to_epoch_micros('25/01/2008 14:30')
+
+
+def transfer_path_context(xcom: dict) -> dict:
+    return {'ti': SimpleNamespace(xcom_pull=lambda task_ids: xcom.get(task_ids))}
+
+
+@pytest.mark.parametrize('new_records, path', [(0, 'direct'), (100, 'direct'), (101, 's3')])
+def test_transfer_path_by_the_counted_records(new_records, path):
+    context = transfer_path_context({polling.BATCH_ROWS_TASK_ID: {'Records': [[{'longValue': new_records}]]}})
+
+    assert direct_transfer.choose_transfer_path(100, **context) == path
+
+
+def test_transfer_path_by_the_probe_estimate():
+    context = transfer_path_context({'probe': {'estimated_rows': 50}})
+
+    assert direct_transfer.choose_transfer_path(100, probe_task_id='probe', **context) == 'direct'
+
+
+def test_batch_of_unknown_size_is_transferred_through_s3():
+    assert direct_transfer.choose_transfer_path(100, probe_task_id='probe', **transfer_path_context({})) == 's3'
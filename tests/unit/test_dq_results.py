@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from common import dq_results
+
+
+def summary(dimension: str, rows_validated: int = 0, failed_rows: int = 0, complex_rules: int = 0,
+            failed_complex_rules: int = 0) -> dict:
+    return {'dimension': dimension, 'rows_validated': rows_validated, 'failed_rows': failed_rows,
+            'complex_rules': complex_rules, 'failed_complex_rules': failed_complex_rules}
+
+
+def test_every_dimension_has_to_pass_all_rules_by_default():
+    thresholds = dq_results.get_thresholds(None)
+
+    results = dq_results.evaluate_dimensions([summary('VALIDITY', 100, 0), summary('UNIQUENESS', 100, 1)],
+                                             thresholds)
+
+    assert results['VALIDITY'] == {'success_ratio': 1.0, 'threshold': 1.0, 'passed': True}
+    assert results['UNIQUENESS']['success_ratio'] == pytest.approx(0.99)
+    assert not results['UNIQUENESS']['passed']
+
+
+def test_dimension_thresholds_override_the_default():
+    thresholds = dq_results.get_thresholds({'uniqueness': 0.99, 'DEFAULT': 0.5})
+
+    results = dq_results.evaluate_dimensions([summary('UNIQUENESS', 100, 1), summary('VALIDITY', 10, 6)],
+                                             thresholds)
+
+    assert results['UNIQUENESS']['passed'] and results['UNIQUENESS']['threshold'] == 0.99
+    assert not results['VALIDITY']['passed'] and results['VALIDITY']['threshold'] == 0.5
+
+
+def test_complex_rules_count_as_checks():
+    results = dq_results.evaluate_dimensions([summary('CORRECTNESS', complex_rules=4, failed_complex_rules=1)],
+                                             dq_results.get_thresholds({'correctness': 0.75}))
+
+    assert results['CORRECTNESS'] == {'success_ratio': 0.75, 'threshold': 0.75, 'passed': True}
+
+
+def test_dimension_without_checks_passes():
+    results = dq_results.evaluate_dimensions([summary('TIMELINESS')], dq_results.get_thresholds(None))
+
+    assert results['TIMELINESS']['passed']
+
+
+def test_thresholds_are_ratios():
+    with pytest.raises(ValueError):
+        dq_results.get_thresholds({'validity': 95})
+
+
+def test_run_summary_selects_the_invocations_of_the_run():
+    sql = dq_results.get_run_summary_sql('p.d_dq_results.t', ['a1', 'b2'], datetime(2024, 1, 1, tzinfo=timezone.utc),
+                                         datetime(2024, 1, 1, 1, tzinfo=timezone.utc))
+
+    assert "invocation_id IN ('a1', 'b2')" in sql
+    assert "BETWEEN TIMESTAMP('2024-01-01T00:00:00+00:00') AND TIMESTAMP('2024-01-01T01:00:00+00:00')" in sql
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+from airflow.models import BaseOperator
+
+from common import lazy_operators
+
+
+class TransferOperator(BaseOperator):
+    def __init__(self, transfer_name: str, **kwargs):
+        super().__init__(**kwargs)
+        self.transfer_name = transfer_name
+
+    def execute(self, context):
+        self.xcom_push(context, key='run_id', value=f"{self.transfer_name}-run")
+        return self.task_id
+
+    def poke(self, context):
+        return self.transfer_name == 'done'
+
+    def on_kill(self):
+        self.transfer_name = 'cancelled'
+
+
+def task_context(task_id: str, xcom: dict, task=None) -> dict:
+    return {'ti': SimpleNamespace(task_id=task_id,
+                                  xcom_push=lambda key, value, execution_date=None: xcom.update({key: value})),
+            'task': task or SimpleNamespace()}
+
+
+def test_operator_runs_as_the_task():
+    xcom = {}
+
+    result = lazy_operators.execute_operator(f"{__name__}.TransferOperator", {'transfer_name': 'load'},
+                                             **task_context('sink_eu.run_bq_transfer_job', xcom))
+
+    assert result == 'sink_eu.run_bq_transfer_job'
+    assert xcom == {'run_id': 'load-run'}
+
+
+def test_sensor_pokes_with_the_provider_sensor():
+    context = task_context('bq_transfer_job_succeeded', {})
+
+    assert lazy_operators.poke_sensor(f"{__name__}.TransferOperator", {'transfer_name': 'done'}, **context)
+    assert not lazy_operators.poke_sensor(f"{__name__}.TransferOperator", {'transfer_name': 'running'}, **context)
+
+
+def test_kill_is_forwarded_to_the_running_operator():
+    task = lazy_operators.lazy_operator('run_bq_transfer_job', f"{__name__}.TransferOperator",
+                                        {'transfer_name': 'load'})
+    # Nothing to kill before the task runs
+    task.on_kill()
+
+    lazy_operators.execute_operator(f"{__name__}.TransferOperator", {'transfer_name': 'load'},
+                                    **task_context(task.task_id, {}, task))
+    task.on_kill()
+
+    assert task.provider_operator.transfer_name == 'cancelled'
+
+
+def test_kill_is_forwarded_to_the_poking_sensor():
+    sensor = lazy_operators.lazy_sensor('bq_transfer_job_succeeded', f"{__name__}.TransferOperator",
+                                        {'transfer_name': 'running'})
+
+    assert not lazy_operators.poke_sensor(f"{__name__}.TransferOperator", {'transfer_name': 'running'},
+                                          **task_context(sensor.task_id, {}, sensor))
+    sensor.on_kill()
+
+    assert sensor.provider_operator.transfer_name == 'cancelled'
+
+
+def test_extra_links_of_the_provider_operator():
+    run_transfer = lazy_operators.lazy_operator('run_bq_transfer_job', lazy_operators.BQ_START_TRANSFER_RUNS,
+                                                {'transfer_config_id': 'c', 'project_id': 'p'})
+    create_table = lazy_operators.lazy_operator('bq_create_table', lazy_operators.BQ_QUERY, {'sql': "SELECT 1"})
+
+    assert run_transfer.extra_links == ['BigQuery Data Transfer Config']
+    assert create_table.extra_links == []
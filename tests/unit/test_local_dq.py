@@ -0,0 +1,102 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import yaml
+
+from common import local_dq
+from conftest import EXAMPLES_DIR
+
+
+def load_example(entity_name: str) -> dict:
+    return local_dq.load_dq_config(os.path.join(EXAMPLES_DIR, f"{entity_name}.yaml"))
+
+
+def write_parquet(tmp_path, table: pa.Table) -> list:
+    path = tmp_path / "export_000.parquet"
+    pq.write_table(table, path)
+    return [str(path)]
+
+
+def get_statuses(results: list) -> dict:
+    return {(result['rule_binding_id'], result['rule_id']): (result['status'], result['failed_count'])
+            for result in results}
+
+
+def test_duplicates_fail_the_uniqueness_rule(tmp_path):
+    paths = write_parquet(tmp_path, pa.table({'eventid': [1, 2, 2, 3]}))
+
+    results = local_dq.run_local_dq_checks(load_example('event'), 'event', paths)
+
+    assert get_statuses(results) == {
+        ('NO_DUPLICATES_IN_COLUMN_GROUPS', 'NO_DUPLICATES_IN_COLUMN_GROUPS'): (local_dq.FAILED, 2)}
+    assert results[0]['dimension'] == 'uniqueness'
+
+
+def test_unique_column_passes_the_uniqueness_rule(tmp_path):
+    paths = write_parquet(tmp_path, pa.table({'eventid': [1, 2, 3]}))
+
+    results = local_dq.run_local_dq_checks(load_example('event'), 'event', paths)
+
+    assert [result['status'] for result in results] == [local_dq.PASSED]
+
+
+def test_bindings_of_other_entities_are_ignored(tmp_path):
+    paths = write_parquet(tmp_path, pa.table({'eventid': [1, 1]}))
+
+    assert local_dq.run_local_dq_checks(load_example('event'), 'users', paths) == []
+
+
+def test_null_rule_counts_null_rows(tmp_path):
+    yaml_data = load_example('event')
+    yaml_data['rules']['NOT_NULL'] = {'rule_type': 'NOT_NULL', 'dimension': 'completeness'}
+    yaml_data['rule_bindings']['EVENTNAME_NOT_NULL'] = {
+        'entity_uri': 'dataplex://entities/event', 'column_id': 'eventname', 'row_filter_id': 'NONE',
+        'rule_ids': ['NOT_NULL']}
+    paths = write_parquet(tmp_path, pa.table({'eventid': [1, 2, 3], 'eventname': ['a', None, None]}))
+
+    results = get_statuses(local_dq.run_local_dq_checks(yaml_data, 'event', paths))
+
+    assert results[('EVENTNAME_NOT_NULL', 'NOT_NULL')] == (local_dq.FAILED, 2)
+
+
+def test_row_filter_scopes_the_rules(tmp_path):
+    yaml_data = load_example('event')
+    yaml_data['row_filters']['EXPORT_BATCH'] = {'filter_sql_expr': 'eventid > 1'}
+    yaml_data['rule_bindings']['NO_DUPLICATES_IN_COLUMN_GROUPS']['row_filter_id'] = 'EXPORT_BATCH'
+    paths = write_parquet(tmp_path, pa.table({'eventid': [1, 1, 2]}))
+
+    results = local_dq.run_local_dq_checks(yaml_data, 'event', paths)
+
+    assert [result['status'] for result in results] == [local_dq.PASSED]
+
+
+def test_regex_and_duplicate_rules_of_users(tmp_path):
+    paths = write_parquet(tmp_path, pa.table({'userid': ['1', '2', '2'],
+                                              'email': ['a@example.com', 'not an email', None]}))
+
+    results = get_statuses(local_dq.run_local_dq_checks(load_example('users'), 'users', paths))
+
+    assert results[('VALID_USER_ID', 'VALID_USER_ID')] == (local_dq.PASSED, 0)
+    assert results[('NO_DUPLICATES_IN_COLUMN_GROUPS', 'NO_DUPLICATES_IN_COLUMN_GROUPS')] == (local_dq.FAILED, 2)
+    assert results[('EMAIL_CHECK', 'NO_INVALID_EMAIL')] == (local_dq.FAILED, 1)
+
+
+def test_rules_reading_other_bigquery_tables_are_skipped(tmp_path):
+    paths = write_parquet(tmp_path, pa.table({'commission': [1.0], 'pricepaid': [-1.0], 'sellerid': [1]}))
+
+    results = get_statuses(local_dq.run_local_dq_checks(load_example('sales'), 'sales', paths))
+
+    assert results[('TRANSACTIONS_COMMISSION_VALID', 'SELLER_COMMISSION_PER_DAY_IS_BETWEEN_5_10_PERCENT')] == \
+        (local_dq.SKIPPED, None)
+    assert results[('TRANSACTION_AMOUNT_VALID', 'VALUE_ZERO_OR_POSITIVE')] == (local_dq.FAILED, 1)
+
+
+@pytest.mark.parametrize('entity_name', ['event', 'sales', 'users'])
+def test_examples_build_a_query_per_bound_rule(entity_name):
+    yaml_data = load_example(entity_name)
+    with open(os.path.join(EXAMPLES_DIR, f"{entity_name}.yaml")) as f:
+        rule_ids = sum(len(binding['rule_ids']) for binding in yaml.safe_load(f)['rule_bindings'].values())
+
+    assert len(local_dq.build_rule_queries(yaml_data, entity_name)) == rule_ids
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from common import metrics
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    emitted = {}
+    monkeypatch.setattr(metrics.Stats, 'timing', lambda name, value: emitted.update({name: value}))
+    monkeypatch.setattr(metrics.Stats, 'incr', lambda name: emitted.update({name: 1}))
+    return emitted
+
+
+def task_instance(state: str, start_date=None, end_date=None) -> SimpleNamespace:
+    return SimpleNamespace(dag_id='dag', task_id='task', state=state, start_date=start_date, end_date=end_date)
+
+
+def test_task_duration_and_state(emitted):
+    start_date = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    metrics.emit_task_metrics({'ti': task_instance('success', start_date, start_date + timedelta(seconds=3))})
+
+    assert emitted == {'redshift_migration.dag.task.duration': 3000, 'redshift_migration.dag.task.success': 1}
+
+
+@pytest.mark.parametrize('state', ['upstream_failed', 'skipped'])
+def test_task_which_never_started(emitted, state):
+    metrics.emit_task_metrics({'ti': task_instance(state)})
+
+    assert emitted == {'redshift_migration.dag.task.duration': 0, f'redshift_migration.dag.task.{state}': 1}
@@ -0,0 +1,101 @@
+import os
+import runpy
+from types import SimpleNamespace
+
+import pytest
+
+from common import file_operations
+from conftest import DAGS_DIR
+
+MIGRATION_DAG_PATH = os.path.join(DAGS_DIR, 'redshift_migration_event', 'redshift_event_migration_dag.py')
+SINK_TABLE_ID = "p.redshift_raw.event"
+
+
+def get_config(**overrides) -> dict:
+    return {
+        'gcp': {'project': 'p', 'dataset_id': 'redshift_raw', 'table_id': 'event', 'bucket': 'b',
+                'path': 's3-unload/event/', 'file_prefix': 'event_', 'file_format': '.parquet',
+                'dataset_region_id': 'EU', 'environment': 'dev'},
+        'aws': {'bucket': 's3b', 'path': 'unload/event/', 'file_prefix': 'event_', 'file_format': '.parquet',
+                'table_id': 'dev.public.event'},
+        'ts_incremental_column_name': 'insert_time',
+        'run_dq_tests': False,
+        **overrides,
+    }
+
+
+@pytest.fixture
+def load_migration_dag(monkeypatch):
+    monkeypatch.setattr(file_operations, 'dags_folder', DAGS_DIR)
+
+    def load(config: dict):
+        monkeypatch.setattr(file_operations, 'load_schema_from_json', lambda json_file_path: config)
+        return runpy.run_path(MIGRATION_DAG_PATH)['dag']
+
+    return load
+
+
+def get_validation_sqls(dag, group_id: str = None) -> dict:
+    prefix = f"{group_id}." if group_id else ""
+    return {task_id: dag.get_task(f"{prefix}{task_id}").op_kwargs['sql']
+            for task_id in ('get_bq_total_rows', 'compare_redshift_checksum_with_bq')}
+
+
+def test_validations_read_the_sink_table_in_append_mode(load_migration_dag):
+    dag = load_migration_dag(get_config())
+
+    for sql in get_validation_sqls(dag).values():
+        assert f"`{SINK_TABLE_ID}`" in sql
+
+
+def test_staging_validations_read_the_staging_table(load_migration_dag):
+    dag = load_migration_dag(get_config(load_mode='staging'))
+
+    for sql in get_validation_sqls(dag).values():
+        assert f"`{SINK_TABLE_ID}_staging_" in sql
+        assert f"`{SINK_TABLE_ID}`" not in sql
+
+
+
+@pytest.mark.parametrize('load_mode, table_suffix', [('append', '`'), ('staging', '_staging_')])
+def test_sink_validations_read_the_table_of_the_sink(load_migration_dag, load_mode, table_suffix):
+    sinks = [{'name': 'eu', 'dataset_id': 'raw_eu'}, {'name': 'us', 'dataset_id': 'raw_us', 'table_id': 'events'}]
+    dag = load_migration_dag(get_config(load_mode=load_mode, gcp={**get_config()['gcp'], 'sinks': sinks}))
+
+    for group_id, table_id in (('sink_eu', "p.raw_eu.event"), ('sink_us', "p.raw_us.events")):
+        for sql in get_validation_sqls(dag, group_id).values():
+            assert f"`{table_id}{table_suffix}" in sql
+            assert SINK_TABLE_ID not in sql
+
+
+def test_validations_pull_the_tasks_of_the_sink(load_migration_dag):
+    dag = load_migration_dag(get_config(gcp={**get_config()['gcp'], 'sinks': [{'name': 'eu', 'dataset_id': 'raw_eu'}]}))
+    xcoms = {'sink_eu.get_bq_total_rows': 10, 'count_files_total_rows': 10, 'get_bq_total_rows': 9,
+             'sink_eu.compare_redshift_checksum_with_bq': 'True'}
+    ti = SimpleNamespace(xcom_pull=lambda task_ids: xcoms.get(task_ids))
+
+    for task_id in ('sink_eu.validate_rows_number_equal', 'sink_eu.validate_checksum'):
+        task = dag.get_task(task_id)
+        assert task.python_callable(ti=ti, **task.op_kwargs)
+    assert not dag.get_task('validate_rows_number_equal').python_callable(
+        ti=ti, **dag.get_task('validate_rows_number_equal').op_kwargs)
+
+def test_new_records_gate_stops_at_the_first_record(load_migration_dag):
+    dag = load_migration_dag(get_config())
+
+    sql = dag.get_task('check_if_table_has_new_records').op_kwargs['operator_kwargs']['sql']
+    assert sql.rstrip().endswith("LIMIT 1")
+    assert "count(" not in sql.lower()
+
+
+@pytest.mark.parametrize('records, has_new_records', [
+    ([[{'longValue': 1}]], True),
+    ([], False),
+    # Checkpoint of an earlier run of the count query
+    ([[{'booleanValue': False}]], False),
+])
+def test_new_records_gate_decision(load_migration_dag, records, has_new_records):
+    dag = load_migration_dag(get_config())
+    ti = SimpleNamespace(xcom_pull=lambda task_ids: {'Records': records})
+
+    assert dag.get_task('validate_table_has_new_records').python_callable(ti=ti) == has_new_records
@@ -0,0 +1,32 @@
+import pytest
+
+from common import polling
+
+
+@pytest.mark.parametrize('poll_number, expected_s, interval_s', [
+    # An eighth of the expected duration first, doubling with every poll
+    (1, 800, 100),
+    (2, 800, 200),
+    (3, 800, 400),
+    # Bounded by the policy min and max intervals
+    (1, 8, 10),
+    (5, 800, 600),
+])
+def test_poll_interval_backs_off_within_bounds(poll_number, expected_s, interval_s):
+    assert polling.get_poll_interval(poll_number, expected_s) == interval_s
+
+
+def test_poll_interval_of_the_policy():
+    policy = {**polling.DEFAULT_POLLING_POLICY, 'initial_fraction': 0.5, 'backoff': 3, 'min_interval_s': 1}
+
+    assert [polling.get_poll_interval(poll, 10, policy) for poll in (1, 2, 3)] == [5, 15, 45]
+
+
+@pytest.mark.parametrize('expected_s, deadline_s', [
+    (2 * 60 * 60, 8 * 60 * 60),
+    # At least an hour and at most 18 hours
+    (60, 60 * 60),
+    (24 * 60 * 60, 18 * 60 * 60),
+])
+def test_deadline_is_a_multiple_of_the_expected_duration(expected_s, deadline_s):
+    assert polling.get_deadline(expected_s) == deadline_s
@@ -0,0 +1,157 @@
+import logging
+import marshal
+import tracemalloc
+from types import SimpleNamespace
+
+import pytest
+
+from common import profiling
+
+
+@pytest.fixture(autouse=True)
+def reset_enabled(monkeypatch):
+    monkeypatch.setattr(profiling, '__enabled', None)
+    monkeypatch.delenv(profiling.PROFILING_ENV, raising=False)
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(profiling, '__enabled', True)
+
+
+class FakeBucket:
+    def __init__(self, uploads: dict):
+        self.uploads = uploads
+
+    def blob(self, name: str):
+        return SimpleNamespace(upload_from_string=lambda data, content_type: self.uploads.update({name: data}))
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    uploads = {}
+    monkeypatch.setattr(profiling, 'storage', SimpleNamespace(
+        Client=lambda: SimpleNamespace(bucket=lambda name: FakeBucket(uploads) if name == 'b' else None)))
+    return uploads
+
+
+def task_context(params: dict = None, export_datetime: str = None, conf: dict = None) -> dict:
+    return {'params': params, 'run_id': 'manual__1', 'dag_run': SimpleNamespace(conf=conf),
+            'ti': SimpleNamespace(task_id='unload_to_s3', try_number=2,
+                                  xcom_pull=lambda task_ids: export_datetime)}
+
+
+@pytest.mark.parametrize('value, is_enabled', [('true', True), ('1', True), ('YES', True), ('false', False),
+                                               ('', False)])
+def test_enabled_by_the_env_var(monkeypatch, value, is_enabled):
+    monkeypatch.setenv(profiling.PROFILING_ENV, value)
+    monkeypatch.setattr(profiling.Variable, 'get', lambda *args, **kwargs: pytest.fail("Variable is read"))
+
+    assert profiling.is_profiling_enabled() is is_enabled
+
+
+def test_enabled_by_the_variable_once(monkeypatch):
+    reads = []
+    monkeypatch.setattr(profiling.Variable, 'get', lambda key, default_var: reads.append(key) or 'True')
+
+    assert profiling.is_profiling_enabled() and profiling.is_profiling_enabled()
+    assert reads == [profiling.PROFILING_VARIABLE]
+
+
+def test_disabled_without_the_variable_store(monkeypatch):
+    def get(key, default_var):
+        raise RuntimeError("no metadata database")
+    monkeypatch.setattr(profiling.Variable, 'get', get)
+
+    assert profiling.is_profiling_enabled() is False
+
+
+@pytest.mark.parametrize('context, location', [
+    (task_context(), None),
+    (task_context({profiling.PROFILE_LOCATION_PARAM: 'gs://b/p/'}, '2023-06-01T10:00:00'),
+     'gs://b/p/2023-06-01T10:00:00/_profiles/'),
+    (task_context({profiling.PROFILE_LOCATION_PARAM: 'gs://b/p/'}, conf={'export_datetime': '2023-05-01T00:00:00'}),
+     'gs://b/p/2023-05-01T00:00:00/_profiles/'),
+    (task_context({profiling.PROFILE_LOCATION_PARAM: 'gs://b/p/'}), 'gs://b/p/manual__1/_profiles/'),
+])
+def test_profile_location(context, location):
+    assert profiling.get_profile_location(context) == location
+
+
+def test_disabled_runs_the_callable_as_it_is(monkeypatch):
+    monkeypatch.setattr(profiling, '__enabled', False)
+    monkeypatch.setattr(profiling.cProfile, 'Profile', lambda: pytest.fail("Profiled"))
+
+    assert profiling.profiled(lambda x, y=1: x + y)(1, y=2) == 3
+
+
+def test_report_is_logged_outside_of_a_task(enabled, caplog):
+    @profiling.profiled
+    def allocate(rows: int) -> int:
+        return len([str(row) for row in range(rows)])
+
+    with caplog.at_level(logging.INFO):
+        assert allocate(10000) == 10000
+
+    report = next(record.getMessage() for record in caplog.records if record.getMessage().startswith("Profile of"))
+    assert report.startswith("Profile of allocate:\nWall time: ")
+    assert "traced memory peak" in report and "Top 25 allocations by line" in report
+    assert "test_profiling.py" in report
+    assert not tracemalloc.is_tracing()
+
+
+def test_profile_is_uploaded_next_to_the_export(enabled, uploads, monkeypatch):
+    monkeypatch.setattr(profiling, 'get_current_context', lambda: task_context(
+        {profiling.PROFILE_LOCATION_PARAM: 'gs://b/p/'}, '2023-06-01T10:00:00'))
+
+    @profiling.profiled
+    def unload_export():
+        return 'done'
+
+    assert unload_export() == 'done'
+    name = 'p/2023-06-01T10:00:00/_profiles/unload_to_s3_unload_export_try2'
+    assert sorted(uploads) == [f'{name}.prof', f'{name}.txt']
+    assert any(function_name == 'unload_export' for _, _, function_name in marshal.loads(uploads[f'{name}.prof']))
+    assert uploads[f'{name}.txt'].startswith("Wall time: ")
+
+
+def test_nested_calls_are_profiled_once(enabled, monkeypatch):
+    saved = []
+    monkeypatch.setattr(profiling, '__save', lambda func_name, profiler, report: saved.append(func_name))
+
+    @profiling.profiled
+    def inner():
+        return 1
+
+    @profiling.profiled
+    def outer():
+        return inner() + 1
+
+    assert outer() == 2
+    assert inner() == 1
+    assert saved == ['outer', 'inner']
+
+
+def test_failing_upload_doesnt_fail_the_task(enabled, monkeypatch, caplog):
+    def upload(*args):
+        raise RuntimeError("403 Forbidden")
+    monkeypatch.setattr(profiling, '__upload', upload)
+    monkeypatch.setattr(profiling, 'get_current_context', lambda: task_context(
+        {profiling.PROFILE_LOCATION_PARAM: 'gs://b/p/'}, '2023-06-01T10:00:00'))
+
+    assert profiling.profiled(lambda: 'done')() == 'done'
+    assert "isn't saved: 403 Forbidden" in caplog.text
+
+
+def test_callable_error_is_raised_after_the_profile_is_saved(enabled, monkeypatch):
+    saved = []
+    monkeypatch.setattr(profiling, '__save', lambda func_name, profiler, report: saved.append(func_name))
+
+    @profiling.profiled
+    def unload_export():
+        raise ValueError("UNLOAD failed")
+
+    with pytest.raises(ValueError, match="UNLOAD failed"):
+        unload_export()
+    assert saved == ['unload_export']
+    assert not tracemalloc.is_tracing()
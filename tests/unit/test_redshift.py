@@ -0,0 +1,117 @@
+import pytest
+
+from common import redshift
+
+CLUSTER = {'database': 'dev', 'cluster_identifier': 'c', 'db_user': 'awsuser'}
+
+
+class FakeClient:
+    """boto3 redshift-data client running the statements at describe_statement calls of the given statuses"""
+
+    def __init__(self, statuses: list, results: dict = None, sub_statements: list = None):
+        self.statuses = list(statuses)
+        self.results = results or {}
+        self.sub_statements = sub_statements
+        self.calls = []
+
+    def execute_statement(self, **kwargs):
+        self.calls.append(('execute_statement', kwargs))
+        return {'Id': 's1'}
+
+    def batch_execute_statement(self, **kwargs):
+        self.calls.append(('batch_execute_statement', kwargs))
+        return {'Id': 'b1'}
+
+    def describe_statement(self, Id):
+        status = self.statuses.pop(0)
+        description = {'Id': Id, 'Status': status, 'Error': 'ERROR: permission denied' if status == 'FAILED' else None,
+                       'HasResultSet': Id in self.results}
+        if self.sub_statements is not None:
+            description['SubStatements'] = self.sub_statements
+        return description
+
+    def get_statement_result(self, Id, NextToken=None):
+        self.calls.append(('get_statement_result', NextToken))
+        pages = self.results[Id]
+        index = int(NextToken) if NextToken else 0
+        page = {'Records': pages[index]}
+        if index + 1 < len(pages):
+            page['NextToken'] = str(index + 1)
+        return page
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = {'now': 0.0, 'sleeps': []}
+
+    def sleep(seconds: float):
+        clock['sleeps'].append(seconds)
+        clock['now'] += seconds
+
+    monkeypatch.setattr(redshift.time, 'sleep', sleep)
+    monkeypatch.setattr(redshift.time, 'monotonic', lambda: clock['now'])
+    return clock
+
+
+def test_single_statement_pages_all_the_records(clock):
+    client = FakeClient([redshift.FINISHED], {'s1': [
+        [[{'stringValue': 'a'}, {'longValue': 1}], [{'stringValue': 'b'}, {'isNull': True}]],
+        [[{'stringValue': 'c'}, {'longValue': 3}]],
+        [],
+    ]})
+
+    records = redshift.run_statements(client, ["SELECT name, size FROM t"], **CLUSTER)
+
+    assert records == [[['a', 1], ['b', None], ['c', 3]]]
+    assert client.calls == [
+        ('execute_statement', {'Sql': "SELECT name, size FROM t", 'ClusterIdentifier': 'c', 'Database': 'dev',
+                               'DbUser': 'awsuser'}),
+        ('get_statement_result', None), ('get_statement_result', '1'), ('get_statement_result', '2')]
+    assert clock['sleeps'] == []
+
+
+def test_batch_results_in_the_submission_order(clock):
+    client = FakeClient([redshift.FINISHED], {'b1:1': [[[{'longValue': 10}]]], 'b1:3': [[[{'stringValue': 'q'}]]]},
+                        sub_statements=[{'Id': 'b1:1', 'HasResultSet': True}, {'Id': 'b1:2', 'HasResultSet': False},
+                                        {'Id': 'b1:3', 'HasResultSet': True}])
+
+    records = redshift.run_statements(client, ["SELECT 10", "UNLOAD ...", "SELECT pg_last_query_id()"], **CLUSTER)
+
+    assert records == [[[10]], [], [['q']]]
+    assert client.calls[0] == ('batch_execute_statement', {
+        'Sqls': ["SELECT 10", "UNLOAD ...", "SELECT pg_last_query_id()"], 'ClusterIdentifier': 'c',
+        'Database': 'dev', 'DbUser': 'awsuser'})
+
+
+def test_polls_back_off_up_to_the_max_interval(clock):
+    client = FakeClient(['SUBMITTED', 'PICKED', 'STARTED', 'STARTED', 'STARTED', 'STARTED', 'STARTED',
+                         redshift.FINISHED])
+
+    assert redshift.run_statements(client, ["UNLOAD ..."], **CLUSTER) == [[]]
+    assert clock['sleeps'] == [0.25, 0.5, 1, 2, 4, 8, 15]
+
+
+def test_policy_overrides_the_defaults(clock):
+    client = FakeClient(['STARTED', 'STARTED', 'STARTED', redshift.FINISHED])
+
+    redshift.run_statements(client, ["UNLOAD ..."], policy={'initial_interval_s': 1, 'backoff': 3}, **CLUSTER)
+
+    assert clock['sleeps'] == [1, 3, 9]
+
+
+@pytest.mark.parametrize('status', redshift.FAILED_STATUSES)
+def test_failed_statement(clock, status):
+    client = FakeClient(['STARTED', status])
+
+    with pytest.raises(RuntimeError, match=f"Redshift statement s1 is {status}"):
+        redshift.run_statements(client, ["UNLOAD ..."], **CLUSTER)
+    assert ('get_statement_result', None) not in client.calls
+
+
+def test_statement_times_out(clock):
+    client = FakeClient(['STARTED'] * 10)
+
+    with pytest.raises(TimeoutError, match="isn't finished in 3 s"):
+        redshift.run_statements(client, ["UNLOAD ..."], policy={'initial_interval_s': 1, 'timeout_s': 3}, **CLUSTER)
+    # The next 4 s poll would pass the deadline
+    assert clock['sleeps'] == [1, 2]
@@ -0,0 +1,163 @@
+import base64
+import hashlib
+import io
+from types import SimpleNamespace
+
+import pytest
+
+from common import s3_copier
+
+MULTIPART_ETAG = "0123456789abcdef0123456789abcdef-2"
+
+
+class FakeBlob:
+    def __init__(self, bucket, name: str):
+        self.bucket = bucket
+        self.name = name
+        self.metadata = None
+        self.size = None
+        self.md5_hash = None
+
+    def open(self, mode: str, chunk_size: int = None):
+        blob = self
+
+        class Writer(io.BytesIO):
+            def close(self):
+                blob.upload(self.getvalue())
+                super().close()
+
+        return Writer()
+
+    def upload(self, data: bytes) -> None:
+        self.size = len(data)
+        self.md5_hash = base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+        self.bucket.blobs[self.name] = self
+
+    def reload(self) -> None:
+        pass
+
+    def delete(self) -> None:
+        del self.bucket.blobs[self.name]
+
+
+class FakeBucket:
+    name = 'gcs'
+
+    def __init__(self):
+        self.blobs = {}
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self, name)
+
+    def get_blob(self, name: str):
+        return self.blobs.get(name)
+
+
+class FakeS3Client:
+    def __init__(self, objects: dict, etags: dict = None):
+        self.objects = objects
+        self.etags = etags or {}
+        self.read_bytes = 0
+
+    def list_objects_v2(self, Bucket: str, Prefix: str, **kwargs) -> dict:
+        return {'Contents': [{'Key': key, 'Size': len(data),
+                              'ETag': f'"{self.etags.get(key, hashlib.md5(data).hexdigest())}"'}
+                             for key, data in sorted(self.objects.items()) if key.startswith(Prefix)]}
+
+    def get_object(self, Bucket: str, Key: str, Range: str) -> dict:
+        start, end = (int(value) for value in Range[len('bytes='):].split('-'))
+        self.read_bytes += end - start + 1
+        return {'Body': io.BytesIO(self.objects[Key][start:end + 1])}
+
+    def delete_object(self, Bucket: str, Key: str) -> dict:
+        del self.objects[Key]
+        return {}
+
+
+@pytest.fixture
+def copy_export(monkeypatch):
+    bucket = FakeBucket()
+    monkeypatch.setattr(s3_copier, 'storage', SimpleNamespace(
+        Client=lambda: SimpleNamespace(bucket=lambda name: bucket)))
+    monkeypatch.setattr(s3_copier, 'record_stage_metrics', lambda **metrics: None)
+
+    def copy(s3_client: FakeS3Client, **kwargs) -> int:
+        monkeypatch.setattr(s3_copier, 's3', SimpleNamespace(
+            S3Hook=lambda aws_conn_id: SimpleNamespace(get_conn=lambda: s3_client)))
+        return s3_copier.copy_export_to_gcs('s3', 'unload/', 'gcs', 'export/', part_size=256 * 1024, **kwargs)
+
+    copy.bucket = bucket
+    return copy
+
+
+def test_transfer_options():
+    assert s3_copier.get_transfer_options() == {'deleteObjectsFromSourceAfterTransfer': True,
+                                                'overwriteObjectsAlreadyExistingInSink': True}
+    assert s3_copier.get_transfer_options(skip_existing=True) == {'deleteObjectsFromSourceAfterTransfer': True,
+                                                                  'overwriteWhen': 'DIFFERENT'}
+
+
+def test_objects_copied_by_a_previous_try_are_skipped(copy_export):
+    objects = {'unload/event_000.parquet': b'a' * 300 * 1024, 'unload/event_001.parquet': b'b' * 10}
+    etags = {'unload/event_000.parquet': MULTIPART_ETAG}
+
+    assert copy_export(FakeS3Client(dict(objects), etags), skip_existing=True) == 300 * 1024 + 10
+    assert copy_export.bucket.blobs['export/event_000.parquet'].metadata == {'s3_etag': MULTIPART_ETAG}
+
+    s3_client = FakeS3Client(dict(objects), etags)
+    assert copy_export(s3_client, skip_existing=True) == 0
+    assert s3_client.read_bytes == 0
+    assert s3_client.objects == {}
+
+
+def test_changed_objects_are_copied_again(copy_export):
+    copy_export(FakeS3Client({'unload/event_000.parquet': b'old'}))
+
+    s3_client = FakeS3Client({'unload/event_000.parquet': b'new'})
+    assert copy_export(s3_client, skip_existing=True) == 3
+    assert copy_export.bucket.blobs['export/event_000.parquet'].md5_hash == \
+        base64.b64encode(hashlib.md5(b'new').digest()).decode('ascii')
+
+
+def test_export_is_copied_in_parts_and_deleted_from_s3(copy_export):
+    objects = {'unload/event_000.parquet': bytes(range(256)) * 4 * 1024 + b'tail', 'other/event.parquet': b'x'}
+    s3_client = FakeS3Client(dict(objects))
+
+    assert copy_export(s3_client, max_concurrency=2) == 1024 * 1024 + 4
+
+    blob = copy_export.bucket.blobs['export/event_000.parquet']
+    assert blob.md5_hash == base64.b64encode(hashlib.md5(objects['unload/event_000.parquet']).digest()).decode()
+    assert s3_client.objects == {'other/event.parquet': b'x'}
+
+
+def test_copy_not_matching_the_etag_is_deleted(copy_export):
+    s3_client = FakeS3Client({'unload/event_000.parquet': b'data'},
+                             {'unload/event_000.parquet': hashlib.md5(b'other').hexdigest()})
+
+    with pytest.raises(ValueError, match="doesn't match its ETag"):
+        copy_export(s3_client)
+    assert copy_export.bucket.blobs == {}
+    assert 'unload/event_000.parquet' in s3_client.objects
+
+
+def test_part_size_is_a_multiple_of_256_kib():
+    with pytest.raises(ValueError):
+        s3_copier.copy_export_to_gcs('s3', 'unload/', 'gcs', 'export/', part_size=1000)
+
+
+def test_listing_follows_the_continuation_token():
+    pages = {None: {'Contents': [{'Key': 'a'}], 'IsTruncated': True, 'NextContinuationToken': 't'},
+             't': {'Contents': [{'Key': 'b'}], 'IsTruncated': False}}
+    s3_client = SimpleNamespace(list_objects_v2=lambda Bucket, Prefix, ContinuationToken=None: pages[ContinuationToken])
+
+    assert s3_copier.list_export_objects(s3_client, 's3', 'unload/') == [{'Key': 'a'}, {'Key': 'b'}]
+
+
+@pytest.mark.parametrize('sizes, method', [([512 * 1024, 512 * 1024], s3_copier.WORKER_COPY),
+                                           ([512 * 1024, 512 * 1024 + 1], s3_copier.STS_COPY)])
+def test_copy_method_by_the_export_size(monkeypatch, sizes, method):
+    objects = {f'unload/event_{number:03}.parquet': b'x' * size for number, size in enumerate(sizes)}
+    monkeypatch.setattr(s3_copier, 's3', SimpleNamespace(
+        S3Hook=lambda aws_conn_id: SimpleNamespace(get_conn=lambda: FakeS3Client(objects))))
+
+    assert s3_copier.choose_s3_copy_method('s3', 'unload/', max_mb=1) == method
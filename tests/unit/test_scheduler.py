@@ -0,0 +1,121 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from common import scheduler
+
+NIGHT_WINDOW = {'start': '20:00', 'end': '06:00'}
+
+
+@pytest.mark.parametrize('windows, hour, minute, in_window', [
+    ([], 12, 0, True),
+    ([{'start': '09:00', 'end': '17:00'}], 9, 0, True),
+    ([{'start': '09:00', 'end': '17:00'}], 17, 0, False),
+    ([NIGHT_WINDOW], 23, 30, True),
+    ([NIGHT_WINDOW], 5, 59, True),
+    ([NIGHT_WINDOW], 6, 0, False),
+    ([NIGHT_WINDOW, {'start': '12:00', 'end': '13:00'}], 12, 30, True),
+])
+def test_is_in_window(windows, hour, minute, in_window):
+    assert scheduler.is_in_window(windows, datetime(2023, 6, 1, hour, minute, tzinfo=timezone.utc)) is in_window
+
+
+def candidate(entity_name: str, staleness_hours: float, estimated_mb: float) -> dict:
+    return {'entity_name': entity_name, 'staleness_hours': staleness_hours, 'estimated_mb': estimated_mb}
+
+
+def test_most_stale_and_then_smaller_first():
+    candidates = [candidate('a', 5.5, 10), candidate('b', 30, 500), candidate('c', 5.2, 1)]
+
+    assert [c['entity_name'] for c in scheduler.prioritize(candidates)] == ['b', 'c', 'a']
+
+
+def test_admit_within_the_unload_slots_and_mb_budget():
+    candidates = [candidate('a', 10, 600), candidate('b', 9, 600), candidate('c', 8, 300), candidate('d', 7, 10)]
+
+    admitted = scheduler.admit(candidates, {'max_concurrent_unloads': 3, 'max_unload_mb': 1000}, [])
+
+    assert [c['entity_name'] for c in admitted] == ['a', 'c', 'd']
+
+
+def test_active_runs_take_their_share_of_the_budget_first():
+    active = [candidate('running', 1, 900)]
+    candidates = [candidate('a', 10, 200), candidate('b', 9, 50), candidate('c', 8, 10)]
+
+    admitted = scheduler.admit(candidates, {'max_concurrent_unloads': 3, 'max_unload_mb': 1000}, active)
+
+    assert [c['entity_name'] for c in admitted] == ['b', 'c']
+
+
+def test_first_entity_is_admitted_even_over_the_mb_budget():
+    admitted = scheduler.admit([candidate('big', 10, 5000)], {'max_concurrent_unloads': 2, 'max_unload_mb': 1000}, [])
+
+    assert [c['entity_name'] for c in admitted] == ['big']
+
+
+def test_no_slots_left():
+    assert scheduler.admit([candidate('a', 10, 1)], {'max_concurrent_unloads': 1}, [candidate('running', 1, 1)]) == []
+
+
+def test_sync_unload_pool(monkeypatch):
+    calls = []
+    monkeypatch.setattr(scheduler, 'Pool', SimpleNamespace(
+        create_or_update_pool=lambda *args: calls.append(args)))
+
+    scheduler.sync_unload_pool(3)
+
+    assert calls == [(scheduler.REDSHIFT_UNLOAD_POOL, 3, "Concurrent Redshift UNLOADs of the migration DAGs")]
+
+
+@pytest.fixture
+def plan(monkeypatch):
+    now = datetime.now(timezone.utc).timestamp()
+    entity_configs = {name: {'aws': {'table_id': f'dev.public.{name}'}} for name in ('fresh', 'stale', 'new', 'busy')}
+    monkeypatch.setattr(scheduler.file_operations, 'load_schema_from_json',
+                        lambda path: entity_configs[path.split('/')[0].replace('redshift_migration_', '')])
+    monkeypatch.setattr(scheduler, 'get_run_history', lambda metrics_table_id, dag_ids: {
+        scheduler.get_migration_dag_id('fresh'): {'last_success_ts': now - 3600, 'last_export_bytes': 1024 ** 2},
+        scheduler.get_migration_dag_id('stale'): {'last_success_ts': now - 48 * 3600,
+                                                  'last_export_bytes': 200 * 1024 ** 2},
+        scheduler.get_migration_dag_id('busy'): {'last_success_ts': now - 72 * 3600,
+                                                 'last_export_bytes': 700 * 1024 ** 2},
+    })
+    requested_sizes = []
+    monkeypatch.setattr(scheduler, 'get_redshift_table_sizes',
+                        lambda aws_config, table_ids: requested_sizes.extend(table_ids) or {'dev.public.new': 400})
+    monkeypatch.setattr(scheduler, 'get_active_dag_ids', lambda dag_ids: [scheduler.get_migration_dag_id('busy')])
+
+    def plan_entity_runs(budget: dict) -> list:
+        scheduler_config = {'budget': budget, 'metrics_table_id': 'p.d.migration_run_metrics', 'aws': {},
+                            'entities': list(entity_configs)}
+        return scheduler.plan_entity_runs(scheduler_config, dag_run=SimpleNamespace(run_id='scheduled__1'))
+
+    plan_entity_runs.requested_sizes = requested_sizes
+    return plan_entity_runs
+
+
+def test_plan_entity_runs(plan):
+    runs = plan({'max_concurrent_unloads': 3, 'max_unload_mb': 1000})
+
+    # busy is running and takes 700 MB and a slot, never migrated new is the most stale but doesn't fit
+    assert runs == [{'trigger_dag_id': scheduler.get_migration_dag_id('stale'),
+                     'conf': {'scheduled_by': 'scheduled__1', 'staleness_hours': 48.0, 'estimated_mb': 200.0}},
+                    {'trigger_dag_id': scheduler.get_migration_dag_id('fresh'),
+                     'conf': {'scheduled_by': 'scheduled__1', 'staleness_hours': 1.0, 'estimated_mb': 1.0}}]
+    assert sorted(plan.requested_sizes) == ['dev.public.busy', 'dev.public.fresh', 'dev.public.new',
+                                            'dev.public.stale']
+
+
+def test_never_migrated_entity_is_estimated_by_the_table_size(plan):
+    runs = plan({'max_concurrent_unloads': 2})
+
+    assert runs == [{'trigger_dag_id': scheduler.get_migration_dag_id('new'),
+                     'conf': {'scheduled_by': 'scheduled__1',
+                              'staleness_hours': scheduler.NEVER_MIGRATED_STALENESS_HOURS, 'estimated_mb': 400}}]
+
+
+def test_no_runs_outside_of_the_windows(plan, monkeypatch):
+    monkeypatch.setattr(scheduler, 'is_in_window', lambda windows, now: False)
+
+    assert plan({'max_concurrent_unloads': 2, 'windows': [NIGHT_WINDOW]}) == []
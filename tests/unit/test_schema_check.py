@@ -0,0 +1,89 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from airflow.exceptions import AirflowFailException
+
+from common import schema_check
+from conftest import DAGS_DIR
+
+with open(os.path.join(DAGS_DIR, 'redshift_migration_event', 'sql', 'bq', 'event_schema.sql')) as schema_file:
+    DDL = schema_file.read()
+
+EXPORT_COLUMNS = {'eventid': 'INT64', 'venueid': 'INT64', 'catid': 'INT64', 'dateid': 'INT64', 'eventname': 'STRING',
+                  'starttime': 'DATETIME', 'checksum': 'STRING', 'insert_time': 'DATETIME',
+                  'export_datetime': 'TIMESTAMP'}
+
+
+def test_ddl_columns_with_their_types_and_modes():
+    assert schema_check.parse_ddl_columns(DDL) == {
+        'eventid': {'type': 'INT64', 'mode': 'NULLABLE'},
+        'venueid': {'type': 'INT64', 'mode': 'NULLABLE'},
+        'catid': {'type': 'INT64', 'mode': 'NULLABLE'},
+        'dateid': {'type': 'INT64', 'mode': 'NULLABLE'},
+        'eventname': {'type': 'STRING', 'mode': 'NULLABLE'},
+        'starttime': {'type': 'TIMESTAMP', 'mode': 'NULLABLE'},
+        'checksum': {'type': 'STRING', 'mode': 'NULLABLE'},
+        'insert_time': {'type': 'TIMESTAMP', 'mode': 'NULLABLE'},
+        'export_datetime': {'type': 'TIMESTAMP', 'mode': 'NULLABLE'},
+    }
+
+
+@pytest.mark.parametrize('bq_type', ['INT', 'INTEGER', 'BIGINT', 'SMALLINT', 'TINYINT', 'BYTEINT', 'int64'])
+def test_integer_aliases(bq_type):
+    assert schema_check.normalize_bq_type(bq_type) == 'INT64'
+
+
+def test_matching_schemas_have_no_changes():
+    export_columns = {**EXPORT_COLUMNS, 'EventName': EXPORT_COLUMNS['eventname']}
+    del export_columns['eventname']
+
+    assert schema_check.compare_schemas(export_columns, schema_check.parse_ddl_columns(DDL)) == \
+        {'added': {}, 'widened': {}, 'incompatible': []}
+
+
+def test_new_and_widened_columns():
+    target_columns = schema_check.parse_ddl_columns(DDL)
+    export_columns = {**EXPORT_COLUMNS, 'eventid': 'NUMERIC', 'catid': 'FLOAT64', 'price': 'NUMERIC'}
+
+    changes = schema_check.compare_schemas(export_columns, target_columns)
+
+    assert changes == {'added': {'price': 'NUMERIC'}, 'widened': {'eventid': 'NUMERIC', 'catid': 'FLOAT64'},
+                       'incompatible': []}
+    assert schema_check.get_evolution_ddl('p.d.event', changes) == [
+        "ALTER TABLE `p.d.event` ADD COLUMN IF NOT EXISTS price NUMERIC",
+        "ALTER TABLE `p.d.event` ALTER COLUMN eventid SET DATA TYPE NUMERIC",
+        "ALTER TABLE `p.d.event` ALTER COLUMN catid SET DATA TYPE FLOAT64",
+    ]
+
+
+def test_changed_types_are_incompatible():
+    export_columns = {**EXPORT_COLUMNS, 'eventid': 'STRING'}
+
+    changes = schema_check.compare_schemas(export_columns, schema_check.parse_ddl_columns(DDL))
+
+    assert changes['incompatible'] == ["eventid is STRING in the export and INT64 in the table"]
+
+
+def test_export_matching_the_ddl_of_a_new_table(monkeypatch):
+    import pyarrow as pa
+
+    export_schema = pa.schema([('eventid', pa.int32()), ('venueid', pa.int16()), ('catid', pa.int16()),
+                               ('dateid', pa.int16()), ('eventname', pa.string()), ('starttime', pa.timestamp('us')),
+                               ('checksum', pa.string()), ('insert_time', pa.timestamp('us')),
+                               ('export_datetime', pa.timestamp('us', tz='UTC'))])
+    monkeypatch.setattr(schema_check, 's3', SimpleNamespace(
+        S3Hook=lambda aws_conn_id: SimpleNamespace(get_conn=lambda: None)))
+    monkeypatch.setattr(schema_check, 'list_export_objects',
+                        lambda s3_client, bucket, prefix: [{'Key': 'event_000.parquet', 'Size': 10}])
+    monkeypatch.setattr(schema_check, 'read_parquet_footer_schema', lambda s3_client, bucket, key, size: export_schema)
+    monkeypatch.setattr(schema_check, 'record_stage_metrics', lambda **metrics: None)
+    # The table is created by the load from the DDL
+    monkeypatch.setattr(schema_check, 'get_table_schema', lambda table_id, cache_key: None)
+
+    assert schema_check.check_export_schema('b', 'event/', '.parquet', 'p.d.event', DDL, 'event') == []
+
+    monkeypatch.setattr(schema_check, 'read_parquet_footer_schema',
+                        lambda s3_client, bucket, key, size: export_schema.append(pa.field('price', pa.float64())))
+    with pytest.raises(AirflowFailException, match="update the schema DDL"):
+        schema_check.check_export_schema('b', 'event/', '.parquet', 'p.d.event', DDL, 'event', on_mismatch='evolve')